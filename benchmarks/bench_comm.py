@@ -0,0 +1,98 @@
+"""
+Benchmark sending NumPy arrays between two processes on the same host
+
+A child process listens on each given address and acknowledges every
+message it receives.  For each array size this reports the round trip time
+of one message and the throughput it amounts to.
+
+Usage::
+
+    python benchmarks/bench_comm.py --address shm:// tcp://127.0.0.1
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+import asyncio
+import multiprocessing
+from time import time
+
+import numpy as np
+
+from distributed.comm import listen, parse_address, CommClosedError
+from distributed.comm.registry import get_backend
+from distributed.protocol import to_serialize
+
+
+async def acknowledge(comm):
+    while True:
+        try:
+            msg = await comm.read()
+        except CommClosedError:
+            break
+        await comm.write(msg['x'].nbytes)
+    await comm.close()
+
+
+def serve(address, queue):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        listener = listen(address, acknowledge)
+        listener.start()
+    except Exception as e:
+        queue.put(e)
+    else:
+        queue.put(listener.contact_address)
+        loop.run_forever()
+
+
+async def send(address, sizes, repeat):
+    scheme, loc = parse_address(address)
+    comm = await get_backend(scheme).get_connector().connect(loc)
+    results = []
+    for size in sizes:
+        x = np.random.randint(0, 255, size=size, dtype='u1')
+        await comm.write({'x': to_serialize(x)})  # warm up
+        await comm.read()
+        start = time()
+        for i in range(repeat):
+            await comm.write({'x': to_serialize(x)})
+            assert await comm.read() == size
+        results.append((time() - start) / repeat)
+    await comm.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--address', nargs='+',
+                        default=['shm://', 'tcp://127.0.0.1'])
+    parser.add_argument('--nbytes', type=int, nargs='+',
+                        default=[1000, 100000, 1000000, 10000000, 100000000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    print("%-20s %12s %12s %12s" % ("address", "bytes", "round trip",
+                                    "throughput"))
+    for address in args.address:
+        queue = multiprocessing.Queue()
+        server = multiprocessing.Process(target=serve, args=(address, queue))
+        server.daemon = True
+        server.start()
+        try:
+            contact = queue.get(timeout=10)
+            if isinstance(contact, Exception):
+                print("%-20s could not listen: %r" % (address, contact))
+                continue
+            durations = loop.run_until_complete(
+                send(contact, args.nbytes, args.repeat))
+        finally:
+            server.terminate()
+        for size, duration in zip(args.nbytes, durations):
+            print("%-20s %12d %10.1fus %8.0f MB/s"
+                  % (address, size, duration * 1e6, size / duration / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark how long the scheduler takes to place tasks on workers
+
+This drives a ``Scheduler`` directly, without a network or real workers, over
+synthetic clusters of increasing size and reports microseconds per task for
+
+*   independent tasks without dependencies, placed from the ``idle`` index
+*   tasks depending on data replicated on every worker, so that every worker
+    is a candidate and must be scored
+*   the scoring alone, with ``Scheduler.choose_worker`` against a per-worker
+    ``min(workers, key=worker_objective)``
+
+Usage::
+
+    python benchmarks/bench_decide_worker.py --nworkers 10 100 1000 5000
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+from functools import partial
+from time import time
+
+from bench_scheduler_state import make_scheduler, update_graph
+
+
+def bench_independent(nworkers, ntasks):
+    s, workers = make_scheduler(nworkers)
+    tasks = {'task-%d' % i: b'spec' for i in range(ntasks)}
+    start = time()
+    update_graph(s, client='bench', tasks=tasks, keys=list(tasks),
+                 dependencies={k: [] for k in tasks})
+    stop = time()
+    assert sum(map(len, s.processing.values())) == ntasks
+    return (stop - start) / ntasks
+
+
+def make_replicated(nworkers, ndeps=4):
+    """ A scheduler with *ndeps* pieces of data held by every worker """
+    s, workers = make_scheduler(nworkers)
+    deps = ['data-%d' % i for i in range(ndeps)]
+    s.update_data(who_has={k: workers for k in deps},
+                  nbytes={k: 1000000 for k in deps}, client='bench')
+    return s, deps
+
+
+def bench_replicated(nworkers, ntasks):
+    s, deps = make_replicated(nworkers)
+    tasks = {'task-%d' % i: b'spec' for i in range(ntasks)}
+    start = time()
+    update_graph(s, client='bench', tasks=tasks, keys=list(tasks),
+                 dependencies={k: deps for k in tasks})
+    stop = time()
+    assert sum(map(len, s.processing.values())) == ntasks
+    return (stop - start) / ntasks
+
+
+def bench_scoring(nworkers, ntasks):
+    s, deps = make_replicated(nworkers)
+    s.update_graph(client='bench', tasks={'task': b'spec'}, keys=['task'],
+                   dependencies={'task': deps})
+    ts = s.tasks['task']
+    workers = s.workers
+
+    start = time()
+    for i in range(ntasks):
+        s.choose_worker(ts, workers)
+    middle = time()
+    for i in range(ntasks):
+        min(workers, key=partial(s.worker_objective, ts))
+    stop = time()
+    return (middle - start) / ntasks, (stop - middle) / ntasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nworkers', type=int, nargs='+',
+                        default=[10, 100, 1000, 5000])
+    parser.add_argument('--ntasks', type=int, default=10000)
+    args = parser.parse_args()
+
+    print("%8s %12s %12s %12s %12s" % ("workers", "independent", "replicated",
+                                       "choose", "objective"))
+    for nworkers in args.nworkers:
+        independent = bench_independent(nworkers, args.ntasks)
+        # Every task scores every worker, so scale down to keep this quick
+        n = max(10, args.ntasks * 10 // nworkers)
+        replicated = bench_replicated(nworkers, n)
+        choose, objective = bench_scoring(nworkers, n)
+        print("%8d %10.1fus %10.1fus %10.1fus %10.1fus"
+              % (nworkers, independent * 1e6, replicated * 1e6,
+                 choose * 1e6, objective * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark submitting a long ``Client.map`` over NumPy arrays
+
+This maps a cheap function over many arrays on a local cluster, so that the
+client's hashing and pickling of the arrays dominates.  Each map runs once
+with all of its tasks prepared in the calling thread, and once in chunks of
+``map-chunk-size`` tasks in ``map-threads`` threads, and for each this
+reports
+
+*   the time that ``Client.map`` takes to return
+*   the time until the first result is in memory
+*   the time until all results are in memory
+
+Usage::
+
+    python benchmarks/bench_map_submission.py --ntasks 20000 --nbytes 100000
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+from time import time
+
+import numpy as np
+
+from distributed import Client, LocalCluster, as_completed, wait
+from distributed import client as client_module
+
+
+def total(x):
+    return x.sum()
+
+
+def run(c, arrays, chunk_size):
+    old = client_module.MAP_CHUNK_SIZE
+    client_module.MAP_CHUNK_SIZE = chunk_size
+    try:
+        start = time()
+        futures = c.map(total, arrays)
+        submit = time() - start
+        next(as_completed(futures))
+        first = time() - start
+        wait(futures)
+        end = time() - start
+    finally:
+        client_module.MAP_CHUNK_SIZE = old
+    c.cancel(futures)
+    return submit, first, end
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--ntasks', type=int, default=20000)
+    parser.add_argument('--nbytes', type=int, default=100000,
+                        help="bytes of each array")
+    parser.add_argument('--nworkers', type=int, default=4)
+    args = parser.parse_args()
+
+    arrays = [np.random.random(args.nbytes // 8) for i in range(args.ntasks)]
+    with LocalCluster(n_workers=args.nworkers, threads_per_worker=1,
+                      diagnostics_port=None) as cluster:
+        with Client(cluster) as c:
+            print("%-8s %8s %8s %8s" % ("threads", "submit", "first",
+                                        "all"))
+            for name, chunk_size in [('1', float('inf')),
+                                     (str(client_module.MAP_THREADS),
+                                      client_module.MAP_CHUNK_SIZE)]:
+                submit, first, end = run(c, arrays, chunk_size)
+                print("%-8s %7.2fs %7.2fs %7.2fs" % (name, submit, first,
+                                                     end))
+
+
+if __name__ == '__main__':
+    main()
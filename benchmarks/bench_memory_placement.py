@@ -0,0 +1,103 @@
+"""
+Benchmark task placement on workers with different memory limits
+
+Tasks run on the simulated workers of ``bench_scheduler_state``.  Half of
+the workers have a small memory limit and half a large one, and all have the
+same number of cores.  A client submits batches of tasks, each batch once the
+previous one has finished:
+
+*   ``persist``: loads with large results that the client keeps
+*   ``map``: loads with large results that the client keeps, each with a
+    process task of a small result
+
+Each workload is replayed without regard for memory (``off``) and avoiding
+workers whose projected memory passes the ``placement-memory-target`` of
+their limit (``target``).  For each this reports the simulated time to
+finish, the peak of the bytes held by a worker as a fraction of its limit,
+and the peak of the bytes held by all workers beyond their limits.
+
+Usage::
+
+    python benchmarks/bench_memory_placement.py --nworkers 8 --nbatches 16
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+
+from bench_scheduler_state import make_scheduler, run_workers, update_graph
+
+from distributed import scheduler
+
+
+def persist(batch, n):
+    loads = ['load-%d-%d' % (batch, i) for i in range(n)]
+    return {'tasks': dict.fromkeys(loads, b'spec'),
+            'dependencies': {k: [] for k in loads}, 'keys': loads}
+
+
+def map_(batch, n):
+    graph = persist(batch, n)
+    for load in list(graph['tasks']):
+        key = load.replace('load', 'process')
+        graph['tasks'][key] = b'spec'
+        graph['dependencies'][key] = [load]
+        graph['keys'].append(key)
+    return graph
+
+
+shapes = {'persist': persist, 'map': map_}
+
+
+def simulate(shape, target, nworkers, nbatches, batch_size, ncores=4,
+             limits=(4e9, 16e9), duration=1.0, nbytes=100e6):
+    s, workers = make_scheduler(nworkers, ncores=ncores, steal=False)
+    for i, w in enumerate(workers):
+        s.memory_limit[w] = limits[i * len(limits) // nworkers]
+
+    over = [0]
+
+    def on_finish(w):
+        over[0] = max(over[0], sum(max(0, s.worker_bytes[v] -
+                                       s.memory_limit[v])
+                                   for v in workers))
+
+    now = 0
+    old = scheduler.MEMORY_TARGET
+    scheduler.MEMORY_TARGET = target
+    try:
+        for batch in range(nbatches):
+            update_graph(s, client='bench',
+                         **shapes[shape](batch, batch_size))
+            now = run_workers(s, workers, ncores=ncores, duration=duration,
+                              nbytes={'load': nbytes}, default_nbytes=1e6,
+                              on_finish=on_finish, now=now)
+    finally:
+        scheduler.MEMORY_TARGET = old
+
+    fraction = max(s.peak_bytes[w] / s.memory_limit[w] for w in workers)
+    return now, fraction, over[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nworkers', type=int, default=8)
+    parser.add_argument('--nbatches', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--shapes', nargs='+', default=sorted(shapes),
+                        choices=sorted(shapes))
+    args = parser.parse_args()
+
+    print("%-8s %-7s %10s %13s %14s" % ("shape", "memory", "makespan",
+                                        "peak / limit", "over limits"))
+    for shape in args.shapes:
+        for name, target in [('off', float('inf')),
+                             ('target', scheduler.MEMORY_TARGET)]:
+            makespan, fraction, over = simulate(shape, target, args.nworkers,
+                                                args.nbatches,
+                                                args.batch_size)
+            print("%-8s %-7s %9.1fs %12.0f%% %11.1f GB"
+                  % (shape, name, makespan, 100 * fraction, over / 1e9))
+
+
+if __name__ == '__main__':
+    main()
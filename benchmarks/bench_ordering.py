@@ -0,0 +1,131 @@
+"""
+Benchmark task priorities across graphs submitted one after the other
+
+Tasks run on the simulated workers of ``bench_scheduler_state``.  Each
+workload is a few graphs submitted at once, the later ones building on the
+results of the first:
+
+*   ``map-map``: loads, then a separate submission of a process task per
+    load, as when submitting work on each future of an earlier ``map``
+*   ``tree``: loads, then a tree reduction over them
+*   ``chains``: loads, then a chain of tasks on each load, of which every
+    eighth is much longer than the others
+
+Loads produce large results and the other tasks small ones, except in the
+tree.  The client drops its futures of the loads once their consumers are
+submitted.  Each workload is replayed with priorities ranked strictly by
+submission (``generations``) and with continuations ranked with the graph
+they continue (``merged``), and for each this reports the simulated time to
+finish and the peak of the bytes held by all workers.
+
+Usage::
+
+    python benchmarks/bench_ordering.py --nworkers 8 --nloads 1000
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+
+from bench_scheduler_state import make_scheduler, run_workers, update_graph
+
+from distributed import scheduler
+
+
+def map_map(n):
+    loads = ['load-%d' % i for i in range(n)]
+    yield {'tasks': dict.fromkeys(loads, b'spec'),
+           'dependencies': {k: [] for k in loads}, 'keys': loads}
+    for i, load in enumerate(loads):
+        key = 'process-%d' % i
+        yield {'tasks': {key: b'spec'}, 'dependencies': {key: [load]},
+               'keys': [key], 'release': [load]}
+
+
+def tree(n):
+    loads = ['load-%d' % i for i in range(n)]
+    yield {'tasks': dict.fromkeys(loads, b'spec'),
+           'dependencies': {k: [] for k in loads}, 'keys': loads}
+    tasks = {}
+    dependencies = {}
+    layer = loads
+    depth = 0
+    while len(layer) > 1:
+        depth += 1
+        new = []
+        for i in range(0, len(layer), 2):
+            key = 'sum-%d-%d' % (depth, i // 2)
+            tasks[key] = b'spec'
+            dependencies[key] = layer[i:i + 2]
+            new.append(key)
+        layer = new
+    yield {'tasks': tasks, 'dependencies': dependencies, 'keys': layer,
+           'release': loads}
+
+
+def chains(n, long=20):
+    loads = ['load-%d' % i for i in range(n)]
+    yield {'tasks': dict.fromkeys(loads, b'spec'),
+           'dependencies': {k: [] for k in loads}, 'keys': loads}
+    tasks = {}
+    dependencies = {}
+    keys = []
+    for i, load in enumerate(loads):
+        dep = load
+        for j in range(long if i % 8 == 0 else 1):
+            key = 'chain-%d-%d' % (i, j)
+            tasks[key] = b'spec'
+            dependencies[key] = [dep]
+            dep = key
+        keys.append(dep)
+    yield {'tasks': tasks, 'dependencies': dependencies, 'keys': keys,
+           'release': loads}
+
+
+shapes = {'map-map': map_map, 'tree': tree, 'chains': chains}
+
+
+def simulate(shape, merge, nworkers, nloads, ncores=4, duration=1.0,
+             nbytes=100e6):
+    old = scheduler.MERGE_PRIORITIES
+    scheduler.MERGE_PRIORITIES = merge
+    try:
+        s, workers = make_scheduler(nworkers, ncores=ncores, steal=False)
+        for graph in shapes[shape](nloads):
+            release = graph.pop('release', ())
+            update_graph(s, client='bench', **graph)
+            s.client_releases_keys(keys=release, client='bench')
+    finally:
+        scheduler.MERGE_PRIORITIES = old
+
+    peak = [0]
+
+    def on_finish(w):
+        peak[0] = max(peak[0], s.worker_bytes.total)
+
+    makespan = run_workers(s, workers, ncores=ncores, duration=duration,
+                           nbytes={'load': nbytes, 'sum': nbytes},
+                           on_finish=on_finish)
+    return makespan, peak[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nworkers', type=int, default=8)
+    parser.add_argument('--nloads', type=int, default=1000)
+    parser.add_argument('--shapes', nargs='+', default=sorted(shapes),
+                        choices=sorted(shapes))
+    args = parser.parse_args()
+
+    print("%-10s %-12s %10s %12s" % ("shape", "priorities", "makespan",
+                                     "peak memory"))
+    for shape in args.shapes:
+        for merge in [False, True]:
+            makespan, peak = simulate(shape, merge, args.nworkers,
+                                      args.nloads)
+            print("%-10s %-12s %9.1fs %9.1f GB"
+                  % (shape, 'merged' if merge else 'generations', makespan,
+                     peak / 1e9))
+
+
+if __name__ == '__main__':
+    main()
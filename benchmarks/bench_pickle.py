@@ -0,0 +1,79 @@
+"""
+Benchmark serializing pandas DataFrames that have no serializer of their own
+
+DataFrames go through the generic pickle path of
+``distributed.protocol.serialize``.  For DataFrames of the same size but of
+different widths, this reports with and without out-of-band buffers
+
+*   how many bytes end up inside the pickle, rather than in frames of their
+    own that are sent without copies
+*   the time to serialize the DataFrame into a message and load it back
+
+Out-of-band buffers require pickle protocol 5: Python 3.8 or the ``pickle5``
+backport, and NumPy and pandas versions that support it.
+
+Usage::
+
+    python benchmarks/bench_pickle.py --nbytes 100000000
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+from time import time
+
+import numpy as np
+import pandas as pd
+
+from distributed.protocol import dumps, loads, to_serialize
+from distributed.protocol import pickle
+
+
+def make_dataframe(nbytes, ncolumns):
+    nrows = max(1, nbytes // (8 * ncolumns))
+    return pd.DataFrame(np.random.random((nrows, ncolumns)),
+                        columns=['c%d' % i for i in range(ncolumns)])
+
+
+def roundtrip(df, repeat):
+    frames = dumps({'x': to_serialize(df)})
+    start = time()
+    for i in range(repeat):
+        frames = dumps({'x': to_serialize(df)})
+    middle = time()
+    for i in range(repeat):
+        result = loads(frames)['x']
+    stop = time()
+    assert result.shape == df.shape
+    # small header, small payload, header, then the pickle and its buffers
+    in_band = len(frames[3])
+    return in_band, (middle - start) / repeat, (stop - middle) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nbytes', type=int, default=int(100e6))
+    parser.add_argument('--ncolumns', type=int, nargs='+',
+                        default=[1, 10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print("pickle protocol %d" % pickle.HIGHEST_PROTOCOL)
+    print("%-10s %-12s %12s %10s %10s"
+          % ("columns", "buffers", "in pickle", "dumps", "loads"))
+    for ncolumns in args.ncolumns:
+        df = make_dataframe(args.nbytes, ncolumns)
+        for out_of_band in [False, True][:pickle.OUT_OF_BAND + 1]:
+            old = pickle.OUT_OF_BAND
+            pickle.OUT_OF_BAND = out_of_band
+            try:
+                in_band, dumps_time, loads_time = roundtrip(df, args.repeat)
+            finally:
+                pickle.OUT_OF_BAND = old
+            print("%-10d %-12s %11.1f%% %8.1fms %8.1fms"
+                  % (ncolumns, 'out-of-band' if out_of_band else 'in-band',
+                     100 * in_band / df.values.nbytes,
+                     dumps_time * 1e3, loads_time * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark queueing tasks without dependencies on the scheduler
+
+Tasks run on the simulated workers of ``bench_scheduler_state``.  Task
+durations are drawn from a lognormal distribution, so that some workers get
+ahead of others.  Work stealing is off, to show how the tasks are spread by
+their placement alone.  The workloads are
+
+*   ``map``: loads, each with a process task of a small result
+*   ``tree``: loads, then a tree reduction over them
+
+where loads produce large results.  Each workload is replayed with all
+loads sent to workers right away (``inf``) and with the default
+``worker-saturation``, and for each this reports the simulated time to
+finish, the peak of the bytes held by all workers, the most tasks that a
+worker held at once and the time the scheduler took to accept the graph.
+
+Usage::
+
+    python benchmarks/bench_queueing.py --nworkers 16 --nloads 4000 --sigma 2
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+import random
+from time import time
+
+from bench_scheduler_state import make_scheduler, run_workers, update_graph
+
+from distributed import scheduler
+
+
+def map_(n):
+    tasks = {}
+    dependencies = {}
+    for i in range(n):
+        tasks['load-%d' % i] = b'spec'
+        dependencies['load-%d' % i] = []
+        tasks['process-%d' % i] = b'spec'
+        dependencies['process-%d' % i] = ['load-%d' % i]
+    return {'tasks': tasks, 'dependencies': dependencies,
+            'keys': ['process-%d' % i for i in range(n)]}
+
+
+def tree(n):
+    layer = ['load-%d' % i for i in range(n)]
+    tasks = dict.fromkeys(layer, b'spec')
+    dependencies = {k: [] for k in layer}
+    depth = 0
+    while len(layer) > 1:
+        depth += 1
+        new = []
+        for i in range(0, len(layer), 2):
+            key = 'sum-%d-%d' % (depth, i // 2)
+            tasks[key] = b'spec'
+            dependencies[key] = layer[i:i + 2]
+            new.append(key)
+        layer = new
+    return {'tasks': tasks, 'dependencies': dependencies, 'keys': layer}
+
+
+shapes = {'map': map_, 'tree': tree}
+
+
+def simulate(shape, saturation, nworkers, nloads, ncores=4, sigma=1.0,
+             nbytes=100e6, seed=0):
+    rng = random.Random(seed)
+    old = scheduler.WORKER_SATURATION
+    scheduler.WORKER_SATURATION = saturation
+    try:
+        s, workers = make_scheduler(nworkers, ncores=ncores, steal=False)
+        start = time()
+        update_graph(s, client='bench', **shapes[shape](nloads))
+        accept = time() - start
+
+        peak = [0, max(map(len, s.processing.values()))]  # memory, held
+
+        def on_finish(w):
+            peak[0] = max(peak[0], s.worker_bytes.total)
+            peak[1] = max(peak[1], len(s.processing[w]))
+
+        makespan = run_workers(s, workers, ncores=ncores,
+                               duration=lambda: rng.lognormvariate(0, sigma),
+                               nbytes={'load': nbytes}, on_finish=on_finish)
+    finally:
+        scheduler.WORKER_SATURATION = old
+
+    return makespan, peak[0], peak[1], accept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nworkers', type=int, default=16)
+    parser.add_argument('--nloads', type=int, default=4000)
+    parser.add_argument('--sigma', type=float, default=1.0,
+                        help="spread of the logarithms of task durations")
+    parser.add_argument('--shapes', nargs='+', default=sorted(shapes),
+                        choices=sorted(shapes))
+    args = parser.parse_args()
+
+    print("%-6s %-10s %10s %12s %8s %9s" % ("shape", "saturation",
+                                           "makespan", "peak memory",
+                                           "held", "accept"))
+    for shape in args.shapes:
+        for saturation in [float('inf'), scheduler.WORKER_SATURATION]:
+            makespan, peak, held, accept = simulate(shape, saturation,
+                                                    args.nworkers,
+                                                    args.nloads,
+                                                    sigma=args.sigma)
+            print("%-6s %-10s %9.1fs %9.1f GB %8d %7.2fs"
+                  % (shape, saturation, makespan, peak / 1e9, held,
+                     accept))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark the reports that the scheduler sends to clients
+
+This drives a ``Scheduler`` directly, without a network or real workers.  A
+client asks for the results of many independent tasks, and simulated workers
+finish all of them before the client's batched comm sends anything.  The
+reports of the scheduler are then compared with the same reports sent as one
+message per key, as before they were gathered into bulk messages, for
+
+*   the number of messages
+*   the bytes of these messages once serialized
+*   the time that the client takes to handle them
+
+Usage::
+
+    python benchmarks/bench_reports.py --ntasks 100000
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+import asyncio
+from time import time
+
+from bench_scheduler_state import make_scheduler, update_graph
+
+from distributed.batched import BatchedSend
+from distributed.client import Client, FutureState
+from distributed.protocol import dumps
+from distributed.protocol.pickle import dumps as pickle_dumps
+from distributed.scheduler import BULK_REPORTS
+
+
+def per_key(msgs):
+    """ The reports in *msgs* as one message per key """
+    ops = {op: (single, fields)
+           for single, (op, fields) in BULK_REPORTS.items()}
+    out = []
+    for msg in msgs:
+        if msg['op'] not in ops:
+            out.append(msg)
+            continue
+        single, fields = ops[msg['op']]
+        for key in msg['keys']:
+            report = {'op': single, 'key': key}
+            for field in fields:
+                if msg[field] is not None:
+                    report[field] = msg[field]
+            out.append(report)
+    return out
+
+
+def nbytes(msgs):
+    return sum(map(len, dumps(msgs)))
+
+
+class Handlers(object):
+    """ The handlers of a client for the reports of finished keys """
+    _handle_key_in_memory = Client._handle_key_in_memory
+    _handle_keys_in_memory = Client._handle_keys_in_memory
+
+    def __init__(self, keys):
+        self.futures = {key: FutureState(asyncio.Event()) for key in keys}
+
+
+def handle(msgs, keys):
+    """ Time to handle *msgs* with the handlers of a client """
+    client = Handlers(keys)
+    handlers = {'key-in-memory': client._handle_key_in_memory,
+                'keys-in-memory': client._handle_keys_in_memory}
+    start = time()
+    for msg in msgs:
+        msg = dict(msg)
+        handlers[msg.pop('op')](**msg)
+    return time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nworkers', type=int, default=16)
+    parser.add_argument('--ntasks', type=int, default=100000)
+    args = parser.parse_args()
+
+    s, workers = make_scheduler(args.nworkers)
+    s.extensions['stealing']._pc.stop()
+    bcomm = s.comms['bench'] = BatchedSend(interval=2, loop=s.loop)
+    keys = ['inc-%d' % i for i in range(args.ntasks)]
+    update_graph(s, client='bench', tasks=dict.fromkeys(keys, b'spec'),
+                 dependencies={key: [] for key in keys}, keys=keys)
+
+    type = pickle_dumps(int)
+    while any(s.processing.values()):
+        for w in workers:
+            for key in list(s.processing[w]):
+                s.handle_task_finished(key=key, worker=w, type=type,
+                                       nbytes=28,
+                                       startstops=[('compute', 0, 0.001)])
+
+    bulk = bcomm.buffer
+    single = per_key(bulk)
+    print("%-9s %10s %12s %10s" % ("reports", "messages", "bytes",
+                                   "handling"))
+    for name, msgs in [('per key', single), ('bulk', bulk)]:
+        print("%-9s %10d %12d %9.3fs" % (name, len(msgs), nbytes(msgs),
+                                         handle(msgs, keys)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Benchmark the memory footprint and transition throughput of scheduler state
+
+This drives a ``Scheduler`` directly, without a network or real workers, and
+reports
+
+*   bytes of scheduler task state held per key after ``update_graph``
+*   transitions per second while a graph is computed to completion
+
+It also holds the pieces that the other scheduler benchmarks share: a
+scheduler with fake workers and a simulation of those workers running the
+tasks assigned to them.
+
+Usage::
+
+    python benchmarks/bench_scheduler_state.py --ntasks 100000 --nworkers 10
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+import asyncio
+import gc
+import heapq
+from itertools import count
+import tracemalloc
+from time import time
+
+from tornado.ioloop import IOLoop
+
+from distributed.scheduler import Scheduler
+from distributed.utils import key_split
+
+
+class NullComm(object):
+    """ Stand-in for a worker's BatchedSend that drops all messages """
+    def send(self, msg):
+        pass
+
+    def abort(self):
+        pass
+
+
+def make_scheduler(nworkers, ncores=4, steal=True):
+    s = Scheduler(loop=IOLoop(), validate=False)
+    if not steal:
+        s.extensions['stealing']._pc.stop()
+    workers = []
+    for i in range(nworkers):
+        address = 'tcp://127.0.0.1:%d' % (10000 + i)
+        s.add_worker(address=address, ncores=ncores, resolve_address=False)
+        s.worker_comms[address] = NullComm()
+        workers.append(address)
+    del s._worker_coroutines[:]
+    return s, workers
+
+
+def run_workers(s, workers, ncores=4, duration=1.0, nbytes=None,
+                default_nbytes=1000, on_finish=None, now=0):
+    """ Run the tasks that the scheduler assigns to *workers* to completion
+
+    Each simulated worker runs up to *ncores* of the tasks processing on it
+    at once, in order of their priorities, and reports each finished once
+    its *duration* has passed, with a result of ``nbytes[key_split(key)]``
+    bytes or else *default_nbytes*.  The clock only advances in simulation,
+    starting from *now*.  *duration* is a number of seconds, or a function
+    returning one for each task.  *on_finish* is called with the worker
+    after each task finishes, for the benchmark to take its measures.
+
+    Returns the simulated time at which the last task finished.
+    """
+    nbytes = nbytes or {}
+    events = []
+    seq = count()
+    running = {w: set() for w in workers}
+
+    def start_tasks(w, now):
+        free = ncores - len(running[w])
+        if free <= 0:
+            return
+        ready = heapq.nsmallest(free, ((s.tasks[key].priority, key)
+                                       for key in s.processing[w]
+                                       if key not in running[w]))
+        for _, key in ready:
+            running[w].add(key)
+            d = duration() if callable(duration) else duration
+            heapq.heappush(events, (now + d, next(seq), w, key, d))
+
+    for w in workers:
+        start_tasks(w, now)
+    while events:
+        now, _, w, key, d = heapq.heappop(events)
+        running[w].remove(key)
+        s.handle_task_finished(key=key, worker=w, type=b'bytes',
+                               nbytes=nbytes.get(key_split(key),
+                                                 default_nbytes),
+                               startstops=[('compute', now - d, now)])
+        if on_finish is not None:
+            on_finish(w)
+        for v in workers:
+            start_tasks(v, now)
+    return now
+
+
+def update_graph(s, **kwargs):
+    """ Call ``Scheduler.update_graph``, running any chunks it defers """
+    result = s.update_graph(**kwargs)
+    if result is not None:
+        asyncio.get_event_loop().run_until_complete(result)
+
+
+def make_graph(ntasks, width=100):
+    """ Layers of *width* tasks, each depending on two tasks of the layer
+    below """
+    tasks = {}
+    dependencies = {}
+    for i in range(ntasks):
+        key = 'task-%d' % i
+        tasks[key] = b'spec'
+        if i >= width:
+            layer_start = (i // width - 1) * width
+            deps = ['task-%d' % (layer_start + (i + j) % width)
+                    for j in (0, 1)]
+        else:
+            deps = []
+        dependencies[key] = deps
+    keys = ['task-%d' % i for i in range(max(0, ntasks - width), ntasks)]
+    return tasks, dependencies, keys
+
+
+def bench_memory(ntasks, nworkers):
+    s, workers = make_scheduler(nworkers)
+    tasks, dependencies, keys = make_graph(ntasks)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    update_graph(s, client='bench', tasks=tasks, keys=keys,
+                 dependencies=dependencies)
+    del tasks, dependencies
+    # Both of these are bounded in size and so don't grow with the graph
+    s.transition_log.clear()
+    if hasattr(key_split, 'cache_clear'):
+        key_split.cache_clear()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / ntasks
+
+
+def bench_transitions(ntasks, nworkers):
+    s, workers = make_scheduler(nworkers)
+    tasks, dependencies, keys = make_graph(ntasks)
+
+    update_graph(s, client='bench', tasks=tasks, keys=keys,
+                 dependencies=dependencies)
+    count = s._transition_counter
+    start = time()
+    startstops = [('compute', 0.0, 0.001)]
+    while True:
+        running = [(w, key) for w in workers for key in s.processing[w]]
+        if not running:
+            break
+        for w, key in running:
+            s.handle_task_finished(key=key, worker=w, nbytes=8,
+                                   type=b'int', startstops=startstops)
+    s.client_releases_keys(keys=keys, client='bench')
+    stop = time()
+
+    assert not s.tasks
+    return s._transition_counter - count, stop - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--ntasks', type=int, default=100000)
+    parser.add_argument('--nworkers', type=int, default=10)
+    args = parser.parse_args()
+
+    per_key = bench_memory(args.ntasks, args.nworkers)
+    print("Memory:      %d bytes per key" % per_key)
+
+    n, duration = bench_transitions(args.ntasks, args.nworkers)
+    print("Transitions: %d in %.2f s, %d per second"
+          % (n, duration, n / duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+Benchmark work stealing on a simulated cluster with a mixed-speed network
+
+This drives a ``Scheduler`` directly, without a network or real workers.
+Simulated workers run the tasks the scheduler assigns to them, fetching
+dependencies over links that are fast within a rack and slower between racks,
+while the clock only advances in simulation.  Every task's data starts out on
+a couple of workers, so that the others only get work by stealing it.
+
+The same workload is replayed with each stealing policy:
+
+*   ``none``: no stealing at all
+*   ``assumed``: stealing with the configured bandwidth and latency
+*   ``measured``: stealing with the bandwidth and latency that workers
+    estimate from their transfers and report with their heartbeats
+
+and for each this reports the simulated time to finish the workload, how many
+tasks were stolen, how many steals were refused because the victim had
+already started the task, the bytes moved between racks and the time the
+scheduler spent balancing.
+
+Usage::
+
+    python benchmarks/bench_stealing.py --nworkers 32 --ntasks 2000
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+from collections import defaultdict, deque
+import heapq
+from itertools import count
+from time import time
+
+from bench_scheduler_state import make_scheduler, update_graph
+
+from distributed.utils import key_split
+from distributed.utils_comm import fit_link
+
+
+class StealComm(object):
+    """ Stand-in for a worker's BatchedSend that keeps its steal requests """
+    def __init__(self):
+        self.requests = []
+
+    def send(self, msg):
+        if msg['op'] == 'steal-request':
+            self.requests.extend(msg['keys'])
+
+    def abort(self):
+        pass
+
+
+class Network(object):
+    """ Links between simulated workers, grouped into racks """
+    def __init__(self, workers, rack_size, fast, slow, latency):
+        self.rack = {w: i // rack_size for i, w in enumerate(workers)}
+        self.fast = fast
+        self.slow = slow
+        self.latency = latency
+
+    def link(self, a, b):
+        if self.rack[a] == self.rack[b]:
+            return self.fast, self.latency
+        else:
+            return self.slow, 4 * self.latency
+
+
+def simulate(policy, nworkers, ntasks, ninputs, nbytes, duration, network_args,
+             ncores=4, heartbeat=0.5):
+    s, workers = make_scheduler(nworkers, ncores=ncores)
+    steal = s.extensions['stealing']
+    steal._pc.stop()
+    for w in workers:
+        s.worker_comms[w] = StealComm()
+    network = Network(workers, *network_args)
+
+    # Inputs can only run on the first two workers, everything else anywhere
+    tasks = {}
+    dependencies = {}
+    restrictions = {}
+    for i in range(ninputs):
+        key = 'load-%d' % i
+        tasks[key] = b'spec'
+        dependencies[key] = []
+        restrictions[key] = [workers[i % 2]]
+    for i in range(ntasks):
+        key = 'process-%d' % i
+        tasks[key] = b'spec'
+        dependencies[key] = ['load-%d' % (i % ninputs)]
+    durations = {'load': duration / 10, 'process': duration}
+    update_graph(s, client='bench', tasks=tasks, keys=list(tasks),
+                 dependencies=dependencies, restrictions=restrictions)
+
+    now = 0
+    events = []
+    seq = count()
+    running = {w: dict() for w in workers}
+    transfers = defaultdict(lambda: defaultdict(lambda: deque(maxlen=20)))
+    moved = [0]
+    balance_time = [0]
+
+    def schedule(when, *event):
+        heapq.heappush(events, (when, next(seq)) + event)
+
+    def start_tasks(w):
+        ready = sorted((s.tasks[key].priority, key) for key in s.processing[w]
+                       if key not in running[w])
+        for _, key in ready[:ncores - len(running[w])]:
+            fetch = 0
+            for dts in s.tasks[key].dependencies:
+                if w in dts.who_has:
+                    continue
+                holder = min(dts.who_has, key=lambda h: network.link(w, h))
+                bandwidth, latency = network.link(w, holder)
+                t = latency + dts.nbytes / bandwidth
+                transfers[w][holder].append((dts.nbytes, t))
+                fetch += t
+                if network.rack[w] != network.rack[holder]:
+                    moved[0] += dts.nbytes
+            stop = now + fetch + durations[key_split(key)]
+            running[w][key] = stop
+            schedule(stop, 'finish', w, key)
+
+    for w in workers:
+        start_tasks(w)
+    if policy != 'none':
+        schedule(0, 'balance')
+    if policy == 'measured':
+        schedule(heartbeat, 'heartbeat')
+
+    remaining = ninputs + ntasks
+    while remaining:
+        event = heapq.heappop(events)
+        now, kind = event[0], event[2]
+        if kind == 'finish':
+            w, key = event[3:]
+            if running[w].get(key) != now:
+                continue
+            del running[w][key]
+            d = durations[key_split(key)]
+            s.handle_task_finished(key=key, worker=w, nbytes=nbytes,
+                                   type=b'bytes',
+                                   startstops=[('compute', now - d, now)])
+            remaining -= 1
+        elif kind == 'balance':
+            start = time()
+            steal.balance()
+            # Victims give up the tasks they haven't started
+            for w in workers:
+                comm = s.worker_comms[w]
+                if comm.requests:
+                    steal.steal_response(worker=w, keys={
+                        key: 'executing' if key in running[w] else 'ready'
+                        for key in comm.requests})
+                    del comm.requests[:]
+            balance_time[0] += time() - start
+            schedule(now + steal._pc.callback_time / 1000, 'balance')
+        elif kind == 'heartbeat':
+            for w, peers in transfers.items():
+                steal.update_links(w, {h: fit_link(t)
+                                       for h, t in peers.items()})
+            transfers.clear()
+            schedule(now + heartbeat, 'heartbeat')
+        for w in workers:
+            start_tasks(w)
+
+    return (now, steal.counts['confirmed'], steal.counts['rejected'],
+            moved[0], balance_time[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nworkers', type=int, default=32)
+    parser.add_argument('--ntasks', type=int, default=2000)
+    parser.add_argument('--ninputs', type=int, default=100)
+    parser.add_argument('--nbytes', type=int, default=int(100e6),
+                        help="bytes of data produced by each task")
+    parser.add_argument('--duration', type=float, default=0.5,
+                        help="seconds each task computes for")
+    parser.add_argument('--rack-size', type=int, default=8)
+    parser.add_argument('--fast', type=float, default=12.5e9,
+                        help="bytes per second within a rack")
+    parser.add_argument('--slow', type=float, default=1.25e9,
+                        help="bytes per second between racks")
+    parser.add_argument('--latency', type=float, default=50e-6)
+    args = parser.parse_args()
+
+    network_args = (args.rack_size, args.fast, args.slow, args.latency)
+    print("%-10s %12s %8s %8s %14s %12s"
+          % ("policy", "makespan", "steals", "refused", "between racks",
+             "balancing"))
+    for policy in ['none', 'assumed', 'measured']:
+        makespan, nsteals, nrefused, moved, balance_time = simulate(
+                policy, args.nworkers, args.ntasks, args.ninputs, args.nbytes,
+                args.duration, network_args)
+        print("%-10s %11.1fs %8d %8d %11.1f GB %10.1fms"
+              % (policy, makespan, nsteals, nrefused, moved / 1e9,
+                 balance_time * 1e3))
+
+
+if __name__ == '__main__':
+    main()
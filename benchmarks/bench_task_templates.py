@@ -0,0 +1,75 @@
+"""
+Benchmark sending the tasks of a map as task templates
+
+This builds the tasks of ``Client.map(inc, range(ntasks))`` as the client
+does, and sends them to a ``Scheduler`` through the serialization of the
+protocol, without a network or real workers.  The tasks are sent either one
+serialized task per key, or as task templates that share the function of
+all tasks.  For each this reports
+
+*   the bytes of the tasks once serialized
+*   the time to serialize them, including building the templates
+*   the memory that the scheduler holds after ``update_graph``
+
+Usage::
+
+    python benchmarks/bench_task_templates.py --ntasks 100000
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+import gc
+from time import time
+import tracemalloc
+
+from bench_scheduler_state import make_scheduler, update_graph
+
+from distributed.protocol import dumps, loads
+from distributed.worker import dumps_task, task_templates
+
+
+def inc(x):
+    return x + 1
+
+
+def run(ntasks, templated):
+    dsk = {'inc-%d' % i: (inc, i) for i in range(ntasks)}
+    keys = list(dsk)
+    start = time()
+    tasks = {key: dumps_task(task) for key, task in dsk.items()}
+    templates = task_templates(tasks) if templated else None
+    frames = dumps({'tasks': tasks, 'templates': templates})
+    encode = time() - start
+    nbytes = sum(map(len, frames))
+    del dsk, tasks, templates
+
+    s, workers = make_scheduler(1)
+    s.extensions['stealing']._pc.stop()
+    gc.collect()
+    tracemalloc.start()
+    msg = loads(frames)
+    update_graph(s, client='bench', tasks=msg['tasks'],
+                 templates=msg['templates'], keys=keys,
+                 dependencies={key: [] for key in keys})
+    del msg
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return nbytes, encode, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--ntasks', type=int, default=100000)
+    args = parser.parse_args()
+
+    print("%-10s %12s %9s %12s" % ("encoding", "bytes", "encode",
+                                   "scheduler"))
+    for name, templated in [('per task', False), ('templates', True)]:
+        nbytes, encode, memory = run(args.ntasks, templated)
+        print("%-10s %12d %8.2fs %9.1f MB" % (name, nbytes, encode,
+                                              memory / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Benchmark what sending and receiving messages over TCP costs
+
+This drives ``distributed.comm.tcp.TCP`` over an in-memory stream, without a
+network.  It writes one message holding a NumPy array and reads it back, and
+reports for streams with and without ``read_into``
+
+*   bytes copied per byte received
+*   bytes allocated at peak per byte received, including the array itself
+*   throughput
+
+The stream without ``read_into`` buffers incoming data and slices frames out
+of that buffer, as Tornado's ``IOStream.read_bytes`` does.
+
+It then writes a stream of small messages interleaved with large arrays, with
+and without coalescing of small frames, and reports per message
+
+*   calls to ``stream.write``, each of which costs at least one syscall
+*   bytes copied before reaching the stream
+*   time spent in ``TCP.write``
+
+Usage::
+
+    python benchmarks/bench_transfer.py --nbytes 100000000
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+import asyncio
+import tracemalloc
+from time import time
+
+import numpy as np
+
+from distributed.comm import tcp
+from distributed.comm.tcp import TCP
+from distributed.protocol import to_serialize
+from distributed.utils import nbytes
+
+
+class MemoryStream(object):
+    """ Stand-in for an IOStream that reads back what was written to it """
+    chunk_size = 65536
+
+    def __init__(self):
+        self.written = []
+        self.copied = 0
+
+    def set_nodelay(self, value):
+        pass
+
+    def closed(self):
+        return True
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+    def rewind(self):
+        self.source = memoryview(b''.join(self.written))
+        self.pos = 0
+        self.written = []
+        self.copied = 0
+
+    def _recv(self, n):
+        """ Take the next *n* bytes off the wire, without copying """
+        chunk = self.source[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        return chunk
+
+
+class BufferedStream(MemoryStream):
+    """ Copies into a read buffer, then out of it into a new bytes object """
+    def __init__(self):
+        MemoryStream.__init__(self)
+        self.buffer = bytearray()
+
+    async def read_bytes(self, n):
+        while len(self.buffer) < n:
+            chunk = self._recv(self.chunk_size)
+            self.buffer += chunk
+            self.copied += len(chunk)
+        result = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        self.copied += n
+        return result
+
+
+class IntoStream(BufferedStream):
+    """ Receives frames directly into buffers supplied by the caller """
+    async def read_into(self, buf):
+        buf = memoryview(buf).cast('B')
+        n = len(buf)
+        start = min(n, len(self.buffer))
+        buf[:start] = self.buffer[:start]
+        del self.buffer[:start]
+        while start < n:
+            chunk = self._recv(min(self.chunk_size, n - start))
+            buf[start:start + len(chunk)] = chunk
+            start += len(chunk)
+        self.copied += n
+        return n
+
+
+async def roundtrip(stream, x):
+    comm = TCP(stream, 'tcp://sender', 'tcp://receiver')
+    await comm.write({'x': to_serialize(x)})
+    stream.rewind()
+
+    tracemalloc.start()
+    start = time()
+    msg = await comm.read()
+    stop = time()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert (msg['x'] == x).all()
+    return stream.copied, peak, stop - start
+
+
+class NullStream(MemoryStream):
+    """ Drops everything written to it """
+    def write(self, data):
+        pass
+
+
+async def send(messages, coalesce_bytes):
+    old = tcp.COALESCE_BYTES
+    tcp.COALESCE_BYTES = coalesce_bytes
+    try:
+        comm = TCP(NullStream(), 'tcp://sender', 'tcp://receiver')
+        start = time()
+        for msg in messages:
+            await comm.write(msg)
+        stop = time()
+    finally:
+        tcp.COALESCE_BYTES = old
+    return comm.counters, stop - start
+
+
+def make_messages(n, nbytes):
+    """ Mostly small status messages, with an occasional large array """
+    messages = []
+    for i in range(n):
+        if i % 10 == 0:
+            x = np.random.randint(0, 255, size=nbytes, dtype='u1')
+            messages.append({'op': 'get_data', 'key': 'x-%d' % i,
+                             'data': to_serialize(x)})
+        else:
+            messages.append({'op': 'task-finished', 'key': 'x-%d' % i,
+                             'nbytes': 8, 'type': b'int',
+                             'data': to_serialize(i)})
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nbytes', type=int, default=int(100e6))
+    parser.add_argument('--nmessages', type=int, default=10000)
+    args = parser.parse_args()
+
+    x = np.random.randint(0, 255, size=args.nbytes, dtype='u1')
+    loop = asyncio.get_event_loop()
+
+    print("%-12s %10s %10s %12s" % ("stream", "copied", "peak", "throughput"))
+    for stream in [BufferedStream(), IntoStream()]:
+        copied, peak, duration = loop.run_until_complete(roundtrip(stream, x))
+        print("%-12s %9.2fx %9.2fx %8.0f MB/s"
+              % (type(stream).__name__, copied / nbytes(x), peak / nbytes(x),
+                 nbytes(x) / duration / 1e6))
+
+    messages = make_messages(args.nmessages, 1000000)
+    print()
+    print("%-12s %10s %10s %12s" % ("send", "writes", "copied", "time"))
+    for name, coalesce_bytes in [('per-frame', 0),
+                                 ('coalesced', tcp.COALESCE_BYTES)]:
+        counters, duration = loop.run_until_complete(
+            send(messages, coalesce_bytes))
+        n = counters['messages']
+        print("%-12s %10.2f %9dB %10.1fus"
+              % (name, counters['writes'] / n, counters['bytes-copied'] / n,
+                 duration / n * 1e6))
+
+
+if __name__ == '__main__':
+    main()
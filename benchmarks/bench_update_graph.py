@@ -0,0 +1,85 @@
+"""
+Benchmark how long a large graph submission keeps the scheduler busy
+
+This drives a ``Scheduler`` directly, without a network or real workers,
+submits one large graph and reports
+
+*   the time spent in each phase of ``update_graph``
+*   the longest stretch during which the event loop could not run anything
+    else, as seen by a coroutine ticking alongside
+
+Usage::
+
+    python benchmarks/bench_update_graph.py --ntasks 1000000 --chunk 10000
+"""
+from __future__ import print_function, division, absolute_import
+
+import argparse
+import asyncio
+from collections import defaultdict
+from time import time
+
+from distributed import scheduler
+
+from bench_scheduler_state import make_scheduler, make_graph
+
+
+class Durations(list):
+    """ Stand-in for a digest that keeps every value """
+    add = list.append
+
+
+async def ticker(gaps):
+    last = time()
+    while True:
+        await asyncio.sleep(0)
+        now = time()
+        gaps.append(now - last)
+        last = now
+
+
+async def submit(s, **kwargs):
+    gaps = []
+    tick = asyncio.ensure_future(ticker(gaps))
+    await asyncio.sleep(0)
+    start = time()
+    result = s.update_graph(**kwargs)
+    if result is not None:
+        await result
+    stop = time()
+    await asyncio.sleep(0)  # let the ticker see the last stretch
+    tick.cancel()
+    return stop - start, max(gaps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--ntasks', type=int, default=200000)
+    parser.add_argument('--nworkers', type=int, default=100)
+    parser.add_argument('--chunk', type=int,
+                        default=scheduler.UPDATE_GRAPH_CHUNK,
+                        help="tasks transitioned between yields to the loop")
+    args = parser.parse_args()
+
+    scheduler.UPDATE_GRAPH_CHUNK = args.chunk
+    s, workers = make_scheduler(args.nworkers)
+    s.digests = defaultdict(Durations)
+
+    tasks, dependencies, keys = make_graph(args.ntasks)
+    # Clients send priorities along with the graph, from dask.order, so that
+    # dependencies come before their dependents
+    priority = {key: i for i, key in enumerate(tasks)}
+
+    loop = asyncio.get_event_loop()
+    duration, stall = loop.run_until_complete(
+        submit(s, client='bench', tasks=tasks, keys=keys,
+               dependencies=dependencies, priority=priority))
+
+    for name, values in sorted(s.digests.items()):
+        print("%-40s %8.2f s" % (name, sum(values)))
+    print("%-40s %8.2f s" % ("total", duration))
+    print("%-40s %8.2f s" % ("longest event loop stall", stall))
+
+
+if __name__ == '__main__':
+    main()
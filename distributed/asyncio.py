@@ -141,7 +141,12 @@ class AioClient(Client):
         # Override Client.__del__ to avoid running self.shutdown()
         assert self.status != 'running'
 
-    gather = to_asyncio(Client._gather)
+    _gather_all = to_asyncio(Client._gather)
+
+    def gather(self, futures, *args, **kwargs):
+        if hasattr(futures, '__aiter__'):
+            return client.GatherStream(self, futures, *args, **kwargs)
+        return self._gather_all(futures, *args, **kwargs)
     scatter = to_asyncio(Client._scatter)
     cancel = to_asyncio(Client._cancel)
     publish_dataset = to_asyncio(Client._publish_dataset)
@@ -35,6 +35,16 @@ class BatchedSend(object):
     On the other side, the recipient will get a message like the following::
 
         ['Hello,', 'world!']
+
+    Many small messages of the same kind, like one per key, can instead be
+    gathered into one columnar message with ``send_bulk``::
+
+    >>> bstream.send_bulk({'op': 'keys-in-memory', 'type': None}, keys='x')
+    >>> bstream.send_bulk({'op': 'keys-in-memory', 'type': None}, keys='y')
+
+    which the recipient gets as::
+
+        [{'op': 'keys-in-memory', 'type': None, 'keys': ['x', 'y']}]
     """
     # XXX why doesn't BatchedSend follow either the IOStream or Comm API?
 
@@ -48,7 +58,10 @@ class BatchedSend(object):
         self.please_stop = False
         self.buffer = []
         self.comm = None
+        self.bulk = None  # last bulk message, while it waits in the buffer
+        self.bulk_header = None
         self.message_count = 0
+        self.row_count = 0
         self.batch_count = 0
         self.byte_count = 0
         self.next_deadline = None
@@ -106,6 +119,36 @@ class BatchedSend(object):
         if self.next_deadline is None:
             self.waker.set()
 
+    def send_bulk(self, header, **row):
+        """ Schedule one row of a bulk message for sending
+
+        Rows with equal *header*, a message of the fields that they share,
+        are gathered into one message with a list of values for each of
+        their names, for as long as no other message is sent in between.
+        So the other side still sees all messages in the order in which they
+        were sent.  All rows with the same header should have the same
+        names.
+
+        This completes quickly and synchronously
+        """
+        if self.comm is not None and self.comm.closed():
+            raise CommClosedError
+
+        self.row_count += 1
+        bulk = self.bulk
+        if (bulk is not None and self.buffer and self.buffer[-1] is bulk and
+                header == self.bulk_header):
+            for name, value in row.items():
+                bulk[name].append(value)
+            return
+
+        bulk = dict(header)
+        for name, value in row.items():
+            bulk[name] = [value]
+        self.send(bulk)
+        self.bulk = bulk
+        self.bulk_header = header
+
     async def close(self):
         """ Flush existing messages and then close comm """
         if self.comm is None:
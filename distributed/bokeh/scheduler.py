@@ -91,8 +91,8 @@ class StateTable(DashboardComponent):
     def __init__(self, scheduler):
         self.scheduler = scheduler
 
-        names = ['Tasks', 'Stored', 'Processing', 'Waiting', 'No Worker',
-                 'Erred', 'Released']
+        names = ['Tasks', 'Stored', 'Processing', 'Queued', 'Waiting',
+                 'No Worker', 'Erred', 'Released']
         self.source = ColumnDataSource({name: [] for name in names})
 
         columns = {name: TableColumn(field=name, title=name)
@@ -107,13 +107,16 @@ class StateTable(DashboardComponent):
     def update(self):
         with log_errors():
             s = self.scheduler
+            counts = s.task_counts()
             d = {'Tasks': [len(s.tasks)],
-                 'Stored': [len(s.who_has)],
-                 'Processing': ['%d / %d' % (len(s.rprocessing), s.total_ncores)],
-                 'Waiting': [len(s.waiting)],
+                 'Stored': [counts['in-memory']],
+                 'Processing': ['%d / %d' % (counts['processing'],
+                                             s.total_ncores)],
+                 'Queued': [len(s.queued)],
+                 'Waiting': [counts['waiting']],
                  'No Worker': [len(s.unrunnable)],
-                 'Erred': [len(s.exceptions)],
-                 'Released': [len(s.released)]}
+                 'Erred': [counts['exceptions']],
+                 'Released': [counts['released']]}
 
             update(self.source, d)
 
@@ -2,7 +2,7 @@ from __future__ import print_function, division, absolute_import
 
 import asyncio
 import atexit
-from collections import defaultdict, Iterator, Iterable
+from collections import defaultdict, deque, Iterator, Iterable
 from concurrent.futures import ThreadPoolExecutor
 from concurrent.futures._base import DoneAndNotDoneFutures, CancelledError
 from contextlib import contextmanager
@@ -41,6 +41,7 @@ from .utils_comm import (WrappedKey, unpack_remotedata, pack_data,
 from .cfexecutor import ClientExecutor
 from .compatibility import (Queue as pyQueue, Empty, isqueue,
         get_thread_identity, html_escape)
+from .config import config
 from .core import connect, rpc, clean_exception, CommClosedError
 from .metrics import time
 from .node import Node
@@ -48,7 +49,8 @@ from .protocol import to_serialize
 from .protocol.pickle import dumps, loads
 from .security import Security
 from .sizeof import sizeof
-from .worker import dumps_task, thread_state, get_client, get_worker
+from .worker import (dumps_task, task_templates, thread_state, get_client,
+        get_worker)
 from .utils import (All, sync, funcname, ignoring, queue_to_iterator,
         tokey, log_errors, str_graph, key_split, format_bytes)
 from .versions import get_versions
@@ -56,9 +58,53 @@ from .versions import get_versions
 
 logger = logging.getLogger(__name__)
 
+# Client.map tokenizes and serializes the tasks of longer maps in chunks of
+# this many tasks in a pool of this many threads, and sends each chunk to
+# the scheduler once it is ready
+MAP_CHUNK_SIZE = config.get('map-chunk-size', 1000)
+MAP_THREADS = config.get('map-threads', 4)
+
+# Client.map over async iterables keeps up to this many tasks per core of
+# the cluster unfinished, and Client.gather over them holds up to this many
+# futures whose results are still to be gathered
+STREAM_TASKS_PER_CORE = config.get('stream-tasks-per-core', 2)
+STREAM_GATHER_SIZE = config.get('stream-gather-size', 100)
+
 _global_client = [None]
 
 
+def _map_graph(func, args, start, key, kwargs, uid, workers,
+               allow_other_workers):
+    """ The keys and graph of the tasks of ``Client.map`` for the tuples of
+    arguments *args*, which start at index *start* of the map """
+    if isinstance(key, list):
+        keys = key
+    elif uid is None:
+        keys = [key + '-' + tokenize(func, kwargs, *a) for a in args]
+    else:
+        keys = [key + '-' + uid + '-' + str(start + i)
+                for i in range(len(args))]
+
+    if not kwargs:
+        dsk = {k: (func,) + a for k, a in zip(keys, args)}
+    else:
+        dsk = {k: (apply, func, (tuple, list(a)), kwargs)
+               for k, a in zip(keys, args)}
+
+    if workers is None:
+        restrictions = {}
+    elif workers and isinstance(first(workers), (list, set)):
+        restrictions = dict(zip(keys, workers[start:start + len(keys)]))
+    else:
+        restrictions = {k: workers for k in keys}
+    if allow_other_workers is True:
+        loose_restrictions = set(keys)
+    else:
+        loose_restrictions = set()
+
+    return keys, dsk, restrictions, loose_restrictions
+
+
 def _get_global_client():
     wr = _global_client[0]
     return wr and wr()
@@ -447,6 +493,7 @@ class Client(Node):
         self.scheduler = None
         self._lock = threading.Lock()
         self._refcount_lock = threading.Lock()
+        self._map_pool = None  # threads preparing chunks of long maps
 
         if loop is None:
             self._should_close_loop = None
@@ -472,8 +519,11 @@ class Client(Node):
 
         self._handlers = {
             'key-in-memory': self._handle_key_in_memory,
+            'keys-in-memory': self._handle_keys_in_memory,
             'lost-data': self._handle_lost_data,
+            'lost-keys': self._handle_lost_keys,
             'cancelled-key': self._handle_cancelled_key,
+            'cancelled-keys': self._handle_cancelled_keys,
             'task-erred': self._handle_task_erred,
             'restart': self._handle_restart,
             'error': self._handle_error
@@ -821,16 +871,44 @@ class Client(Node):
                 type = None
             state.finish(type)
 
+    def _handle_keys_in_memory(self, keys=(), type=None):
+        futures = self.futures
+        loaded = None  # the keys share their type, load it only once
+        for key in keys:
+            state = futures.get(key)
+            if state is None:
+                continue
+            if type and not state.type:
+                if loaded is None:
+                    loaded = loads(type)
+                state.finish(loaded)
+            else:
+                state.finish()
+
     def _handle_lost_data(self, key=None):
         state = self.futures.get(key)
         if state is not None:
             state.lose()
 
+    def _handle_lost_keys(self, keys=()):
+        futures = self.futures
+        for key in keys:
+            state = futures.get(key)
+            if state is not None:
+                state.lose()
+
     def _handle_cancelled_key(self, key=None):
         state = self.futures.get(key)
         if state is not None:
             state.cancel()
 
+    def _handle_cancelled_keys(self, keys=()):
+        futures = self.futures
+        for key in keys:
+            state = futures.get(key)
+            if state is not None:
+                state.cancel()
+
     def _handle_task_erred(self, key=None, exception=None, traceback=None):
         state = self.futures.get(key)
         if state is not None:
@@ -870,6 +948,12 @@ class Client(Node):
             with ignoring(AttributeError):
                 self.scheduler.close_rpc()
             self.status = 'closed'
+            self._close_map_pool()
+
+    def _close_map_pool(self):
+        pool, self._map_pool = self._map_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
 
     def close(self):
         """ Close this client and its connection to the scheduler """
@@ -886,6 +970,7 @@ class Client(Node):
                 with ignoring(AttributeError):
                     await self.cluster._close()
             self.status = 'closed'
+            self._close_map_pool()
             if _get_global_client() is self:
                 _set_global_client(None)
             if not fast:
@@ -1068,7 +1153,7 @@ class Client(Node):
         Parameters
         ----------
         func: callable
-        iterables: Iterables, Iterators, or Queues
+        iterables: Iterables, Iterators, Queues, or async iterables
         key: str, list
             Prefix for task names if string.  Explicit names if list.
         pure: bool (defaults to True)
@@ -1084,8 +1169,15 @@ class Client(Node):
 
         Returns
         -------
-        List, iterator, or Queue of futures, depending on the type of the
-        inputs.
+        List, iterator, Queue, or async iterator of futures, depending on the
+        type of the inputs.  See ``MapStream`` for async iterables.
+
+        Notes
+        -----
+        Sequences longer than ``map-chunk-size`` in the configuration are
+        tokenized and serialized in chunks by ``map-threads`` threads.  Each
+        chunk goes to the scheduler as soon as it is ready, so that the
+        first tasks run while later chunks are still being prepared.
 
         See also
         --------
@@ -1094,6 +1186,9 @@ class Client(Node):
         if not callable(func):
             raise TypeError("First input to map must be a callable function")
 
+        if iterables and all(hasattr(i, '__aiter__') for i in iterables):
+            return MapStream(self, func, iterables, **kwargs)
+
         if (all(map(isqueue, iterables)) or
             all(isinstance(i, Iterator) for i in iterables)):
             maxsize = kwargs.pop('maxsize', 0)
@@ -1119,58 +1214,72 @@ class Client(Node):
         if allow_other_workers and workers is None:
             raise ValueError("Only use allow_other_workers= if using workers=")
 
-        iterables = list(zip(*zip(*iterables)))
-        if isinstance(key, list):
-            keys = key
-        else:
-            if pure:
-                keys = [key + '-' + tokenize(func, kwargs, *args)
-                        for args in zip(*iterables)]
-            else:
-                uid = str(uuid.uuid1())
-                keys = [key + '-' + uid + '-' + str(i)
-                        for i in range(min(map(len, iterables)))] if iterables else []
-
-        if not kwargs:
-            dsk = {key: (func,) + args
-                   for key, args in zip(keys, zip(*iterables))}
-        else:
-            dsk = {key: (apply, func, (tuple, list(args)), kwargs)
-                   for key, args in zip(keys, zip(*iterables))}
+        args = list(zip(*iterables))
+        nkeys = len(key) if isinstance(key, list) else len(args)
 
         if isinstance(workers, six.string_types):
             workers = [workers]
         if isinstance(workers, (list, set)):
             if workers and isinstance(first(workers), (list, set)):
-                if len(workers) != len(keys):
+                if len(workers) != nkeys:
                     raise ValueError("You only provided %d worker restrictions"
-                    " for a sequence of length %d" % (len(workers), len(keys)))
-                restrictions = dict(zip(keys, workers))
-            else:
-                restrictions = {k: workers for k in keys}
-        elif workers is None:
-            restrictions = {}
-        else:
+                    " for a sequence of length %d" % (len(workers), nkeys))
+        elif workers is not None:
             raise TypeError("Workers must be a list or set of workers or None")
         if allow_other_workers not in (True, False, None):
             raise TypeError("allow_other_workers= must be True or False")
-        if allow_other_workers is True:
-            loose_restrictions = set(keys)
-        else:
-            loose_restrictions = set()
 
-        priority = dict(zip(keys, range(len(keys))))
+        uid = None if pure else str(uuid.uuid1())
+        submitting_task = getattr(thread_state, 'key', None)
 
-        if resources:
-            resources = {k: resources for k in keys}
+        def graph_message(start, stop):
+            keys, dsk, restrictions, loose_restrictions = _map_graph(
+                    func, args[start:stop], start, key, kwargs, uid,
+                    workers, allow_other_workers)
+            priority = {k: start + i for i, k in enumerate(keys)}
+            if resources:
+                resources2 = {k: resources for k in keys}
+            else:
+                resources2 = None
+            msg, needed = self._graph_to_message(dsk, keys, restrictions,
+                    loose_restrictions, priority=priority,
+                    resources=resources2, submitting_task=submitting_task)
+            return keys, msg, needed
+
+        if isinstance(key, list) or len(args) <= MAP_CHUNK_SIZE:
+            chunks = [(0, len(args))]
         else:
-            resources = None
+            chunks = [(i, i + MAP_CHUNK_SIZE)
+                      for i in range(0, len(args), MAP_CHUNK_SIZE)]
+
+        # Tokenize and serialize chunks in threads, and send each to the
+        # scheduler as soon as it is ready and all chunks before it are sent
+        if len(chunks) > 1:
+            with self._lock:
+                if self._map_pool is None:
+                    self._map_pool = ThreadPoolExecutor(MAP_THREADS)
+                pool = self._map_pool
+            pending = [pool.submit(graph_message, *chunk) for chunk in chunks]
+            messages = (p.result() for p in pending)
+        else:
+            pending = []
+            messages = [graph_message(*chunks[0])]
 
-        futures = self._graph_to_futures(dsk, keys, restrictions,
-                loose_restrictions, priority=priority, resources=resources)
+        out = []
+        try:
+            for keys, msg, needed in messages:
+                with self._lock:
+                    self._check_futures(needed)
+                    futures = {k: self._Future(k, self) for k in set(keys)}
+                    self._send_to_scheduler(msg)
+                out.extend(futures[tokey(k)] for k in keys)
+        except BaseException:
+            for p in pending:
+                p.cancel()
+            raise
         logger.debug("map(%s, ...)", funcname(func))
 
-        return [futures[tokey(k)] for k in keys]
+        return out
 
     async def _gather(self, futures, errors='raise', direct=None, local_worker=None):
         futures2, keys = unpack_remotedata(futures, byte_keys=True)
@@ -1280,11 +1389,12 @@ class Client(Node):
             for item in results:
                 qout.put(item)
 
-    def gather(self, futures, errors='raise', maxsize=0, direct=None):
+    def gather(self, futures, errors='raise', maxsize=0, direct=None,
+               ordered=True):
         """ Gather futures from distributed memory
 
-        Accepts a future, nested container of futures, iterator, or queue.
-        The return type will match the input type.
+        Accepts a future, nested container of futures, iterator, queue, or
+        async iterable.  The return type will match the input type.
 
         Parameters
         ----------
@@ -1296,7 +1406,12 @@ class Client(Node):
             or skip its inclusion in the output collection
         maxsize: int
             If the input is a queue then this produces an output queue with a
-            maximum size.
+            maximum size.  If it is an async iterable then this many futures
+            at most wait to have their results gathered.
+        ordered: bool
+            If the input is an async iterable, whether to produce results in
+            the order of the futures (default) or as they finish.  See
+            ``GatherStream``.
 
         Returns
         -------
@@ -1333,6 +1448,9 @@ class Client(Node):
         elif isinstance(futures, Iterator):
             return (self.gather(f, errors=errors, direct=direct)
                     for f in futures)
+        elif hasattr(futures, '__aiter__'):
+            return GatherStream(self, futures, errors=errors, direct=direct,
+                                ordered=ordered, maxsize=maxsize)
         else:
             if hasattr(thread_state, 'execution_state'):  # within worker task
                 local_worker = thread_state.execution_state['worker']
@@ -1793,53 +1911,82 @@ class Client(Node):
             loose_restrictions=None, allow_other_workers=True, priority=None,
             resources=None):
         with self._lock:
-            keyset = set(keys)
-            flatkeys = list(map(tokey, keys))
-            futures = {key: self._Future(key, self) for key in keyset}
-
-            values = {k for k, v in dsk.items() if isinstance(v, Future)
-                                                and k not in keyset}
-            if values:
-                dsk = dask.optimize.inline(dsk, keys=values)
-
-            d = {k: unpack_remotedata(v) for k, v in dsk.items()}
-            extra_keys = set.union(*[v[1] for v in d.values()]) if d else set()
-            dsk2 = str_graph({k: v[0] for k, v in d.items()}, extra_keys)
-            dsk3 = {k: v for k, v in dsk2.items() if k is not v}
-
-            if restrictions:
-                restrictions = keymap(tokey, restrictions)
-                restrictions = valmap(list, restrictions)
-
-            if loose_restrictions is not None:
-                loose_restrictions = list(map(tokey, loose_restrictions))
-
-            dependencies = {tokey(k): set(map(tokey, v[1])) for k, v in d.items()}
-
-            for s in dependencies.values():
-                for v in s:
-                    if v not in self.futures:
-                        raise CancelledError(v)
-
-            for k, v in dsk3.items():
-                dependencies[k] |= get_dependencies(dsk3, task=v)
-
-            if priority is None:
-                dependencies2 = {key: {dep for dep in deps if dep in dependencies}
-                                 for key, deps in dependencies.items()}
-                priority = dask.order.order(dsk3, dependencies2)
-
-            self._send_to_scheduler({'op': 'update-graph',
-                                     'tasks': valmap(dumps_task, dsk3),
-                                     'dependencies': valmap(list, dependencies),
-                                     'keys': list(flatkeys),
-                                     'restrictions': restrictions or {},
-                                     'loose_restrictions': loose_restrictions,
-                                     'priority': priority,
-                                     'resources': resources,
-                                     'submitting_task': getattr(thread_state, 'key', None)})
+            msg, needed = self._graph_to_message(dsk, keys, restrictions,
+                    loose_restrictions, priority=priority,
+                    resources=resources,
+                    submitting_task=getattr(thread_state, 'key', None))
+            self._check_futures(needed)
+            futures = {key: self._Future(key, self) for key in set(keys)}
+            self._send_to_scheduler(msg)
             return futures
 
+    def _check_futures(self, keys):
+        """ Raise CancelledError unless we hold futures for all of keys
+
+        Call this under ``self._lock``, so that none of them is released
+        before the graph that needs them reaches the scheduler.
+        """
+        for key in keys:
+            if key not in self.futures:
+                raise CancelledError(key)
+
+    def _graph_to_message(self, dsk, keys, restrictions=None,
+            loose_restrictions=None, priority=None, resources=None,
+            submitting_task=None):
+        """ The update-graph message for a graph, and the keys of the futures
+        that it depends on
+
+        This serializes the tasks and does not change the state of the
+        client, so it may run outside of ``self._lock`` and in other threads.
+        Whether the futures it depends on are still held is left to
+        ``_check_futures``, under the lock.
+        """
+        keyset = set(keys)
+        flatkeys = list(map(tokey, keys))
+
+        values = {k for k, v in dsk.items() if isinstance(v, Future)
+                                            and k not in keyset}
+        if values:
+            dsk = dask.optimize.inline(dsk, keys=values)
+
+        d = {k: unpack_remotedata(v) for k, v in dsk.items()}
+        extra_keys = set.union(*[v[1] for v in d.values()]) if d else set()
+        dsk2 = str_graph({k: v[0] for k, v in d.items()}, extra_keys)
+        dsk3 = {k: v for k, v in dsk2.items() if k is not v}
+
+        if restrictions:
+            restrictions = keymap(tokey, restrictions)
+            restrictions = valmap(list, restrictions)
+
+        if loose_restrictions is not None:
+            loose_restrictions = list(map(tokey, loose_restrictions))
+
+        dependencies = {tokey(k): set(map(tokey, v[1])) for k, v in d.items()}
+        needed = set().union(*dependencies.values())
+
+        for k, v in dsk3.items():
+            dependencies[k] |= get_dependencies(dsk3, task=v)
+
+        if priority is None:
+            dependencies2 = {key: {dep for dep in deps if dep in dependencies}
+                             for key, deps in dependencies.items()}
+            priority = dask.order.order(dsk3, dependencies2)
+
+        tasks = valmap(dumps_task, dsk3)
+        templates = task_templates(tasks)
+
+        msg = {'op': 'update-graph',
+               'tasks': tasks,
+               'templates': templates,
+               'dependencies': valmap(list, dependencies),
+               'keys': list(flatkeys),
+               'restrictions': restrictions or {},
+               'loose_restrictions': loose_restrictions,
+               'priority': priority,
+               'resources': resources,
+               'submitting_task': submitting_task}
+        return msg, needed
+
     def get(self, dsk, keys, restrictions=None, loose_restrictions=None,
             resources=None, sync=True, **kwargs):
         """ Compute dask graph
@@ -2991,6 +3138,231 @@ class as_completed(object):
                 return
 
 
+class MapStream(object):
+    """ Futures of ``Client.map`` over async iterables
+
+    This takes arguments from the async iterables and submits a task for
+    each, yielding their futures in order.  It only takes more arguments
+    while fewer than *maxsize* of its tasks are still to finish, so that a
+    stream over an unbounded source keeps the cluster busy without running
+    ahead of it.  By default *maxsize* follows the capacity of the cluster,
+    ``stream-tasks-per-core`` tasks per core of the workers, as reported by
+    the scheduler at most once a second.
+
+    Keys are named as by ``Client.map``, from the *key* prefix and a token
+    of the arguments of each task, or a counter with ``pure=False``.
+
+    Everything happens in coroutines on the event loop, without threads.
+
+    Examples
+    --------
+    >>> async for future in client.map(inc, source):  # doctest: +SKIP
+    ...     results.add(future)  # doctest: +SKIP
+
+    See Also
+    --------
+    Client.map
+    GatherStream
+    """
+    def __init__(self, client, func, iterables, maxsize=None, **kwargs):
+        key = kwargs.pop('key', None)
+        if isinstance(key, list):
+            raise TypeError("Mapping over async iterables takes a prefix for "
+                            "keys, not a list of keys")
+        pure = kwargs.pop('pure', True)
+        self.client = client
+        self.func = func
+        self.iterables = iterables
+        self.iterators = None
+        self.kwargs = kwargs
+        self.func_kwargs = {k: v for k, v in kwargs.items()
+                            if k not in ('workers', 'resources',
+                                         'allow_other_workers')}
+        self.key = key or funcname(func)
+        self.uid = None if pure else str(uuid.uuid1())
+        self.count = 0
+        self.closed = False
+        self.maxsize = maxsize
+        self.capacity = None
+        self.capacity_time = 0
+        self.pending = set()  # futures of tasks that are still to finish
+        self.finished = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed:
+            raise StopAsyncIteration
+        if self.iterators is None:
+            self.iterators = [i.__aiter__() for i in self.iterables]
+            self.finished = asyncio.Event()
+
+        while len(self.pending) >= await self._maxsize():
+            self.finished.clear()
+            await self.finished.wait()
+
+        args = []
+        for it in self.iterators:
+            args.append(await it.__anext__())  # raises StopAsyncIteration
+
+        if self.uid is None:
+            key = self.key + '-' + tokenize(self.func, self.func_kwargs, *args)
+        else:
+            key = self.key + '-' + self.uid + '-' + str(self.count)
+        self.count += 1
+        future = self.client.submit(self.func, *args, key=key, **self.kwargs)
+        if future not in self.pending and future.status == 'pending':
+            self.pending.add(future)
+            asyncio.ensure_future(self._track(future))
+        return future
+
+    async def _maxsize(self):
+        if self.maxsize:
+            return self.maxsize
+        if time() > self.capacity_time + 1:
+            ncores = await self.client.scheduler.ncores()
+            self.capacity = max(1, int(STREAM_TASKS_PER_CORE *
+                                       sum(ncores.values())))
+            self.capacity_time = time()
+        return self.capacity
+
+    async def _track(self, future):
+        await future._state.event.wait()
+        self.pending.discard(future)
+        self.finished.set()
+
+    async def aclose(self):
+        """ Stop submitting tasks, and close the async iterables """
+        self.closed = True
+        for it in self.iterators or ():
+            if hasattr(it, 'aclose'):
+                await it.aclose()
+
+
+class GatherStream(object):
+    """ Results of an async iterable of futures
+
+    This gathers the results of the futures as they finish, in the order of
+    the futures if *ordered*, otherwise in the order in which they finish.
+    It only takes more futures from the iterable while fewer than *maxsize*
+    futures are waiting to have their results gathered, so that a slow
+    consumer holds back the source, like a ``MapStream``, rather than
+    letting results pile up in memory.
+
+    Results of the futures taken before the iterable raised an exception
+    come first, then the exception.  Leaving the stream early with
+    ``aclose``, or dropping it, stops taking futures from the iterable.
+
+    Everything happens in coroutines on the event loop, without threads.
+
+    Examples
+    --------
+    >>> async for result in client.gather(client.map(inc, source)):
+    ...     print(result)  # doctest: +SKIP
+
+    See Also
+    --------
+    Client.gather
+    MapStream
+    """
+    def __init__(self, client, futures, errors='raise', direct=None,
+                 ordered=True, maxsize=None):
+        self.client = client
+        self.futures = futures
+        self.errors = errors
+        self.direct = direct
+        self.ordered = ordered
+        self.maxsize = maxsize or STREAM_GATHER_SIZE
+        self.waiting = deque()  # futures taken from the iterable, in order
+        self.done = deque()  # those of them that finished, in that order
+        self.reader = None  # task taking futures from the iterable
+        self.closed = False
+        self.changed = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed:
+            raise StopAsyncIteration
+        if self.reader is None:
+            self.changed = asyncio.Event()
+            # The reader doesn't refer to the stream, so that dropping the
+            # stream cancels it
+            self.reader = asyncio.ensure_future(_read_futures(
+                self.futures, self.waiting, self.done if not self.ordered
+                else None, self.changed, self.maxsize))
+
+        while True:
+            if self.ordered and self.waiting:
+                future = self.waiting.popleft()
+                await future._state.event.wait()
+            elif not self.ordered and self.done:
+                future = self.done.popleft()
+                self.waiting.remove(future)
+            elif self.reader.done() and not self.waiting:
+                self.reader.result()  # raises what the iterable raised
+                raise StopAsyncIteration
+            else:
+                await _wait_for_change(self.changed)
+                continue
+
+            self._notify()  # there is room to take another future
+            results = await self.client._gather([future], errors=self.errors,
+                                                direct=self.direct)
+            if results:  # unless skipped with errors='skip'
+                return results[0]
+
+    def _notify(self):
+        self.changed.set()
+
+    async def aclose(self):
+        """ Stop taking futures from the iterable, and close it """
+        self.closed = True
+        if self.reader is not None:
+            self.reader.cancel()
+            await asyncio.wait([self.reader])
+        if hasattr(self.futures, 'aclose'):
+            await self.futures.aclose()
+
+    def __del__(self):
+        if self.reader is not None and not self.reader.done():
+            with ignoring(RuntimeError):  # event loop closed
+                self.reader.cancel()
+
+
+async def _read_futures(futures, waiting, done, changed, maxsize):
+    """ Take futures from an async iterable for a ``GatherStream``
+
+    Futures go to *waiting*, and also to *done* once they finish unless
+    *done* is None.  Taking them pauses while *maxsize* futures are waiting.
+    """
+    try:
+        async for future in futures:
+            if not isinstance(future, Future):
+                raise TypeError("Input must be a future, got %s" % future)
+            waiting.append(future)
+            if done is not None:
+                asyncio.ensure_future(_track_done(future, done, changed))
+            changed.set()
+            while len(waiting) >= maxsize:
+                await _wait_for_change(changed)
+    finally:
+        changed.set()
+
+
+async def _track_done(future, done, changed):
+    await future._state.event.wait()
+    done.append(future)
+    changed.set()
+
+
+async def _wait_for_change(changed):
+    changed.clear()
+    await changed.wait()
+
+
 def AsCompleted(*args, **kwargs):
     raise Exception("This has moved to as_completed")
 
@@ -0,0 +1,188 @@
+""" Per-worker numbers of the scheduler, stored by column
+
+The scheduler tracks numbers like the occupancy, cores and bytes stored of
+every worker.  Rather than keeping a dictionary of each, keyed by address, we
+give every worker a row and keep each quantity in a flat array, along with its
+running total.  Cluster-wide questions, like the total occupancy or which
+workers are the most occupied, are then answered in constant time or by a
+vectorized NumPy operation, rather than by a loop over workers in Python.
+
+Values are held in ``array.array`` objects, which are quick to access one at
+a time from Python and which NumPy can view without copying.  NumPy itself
+remains optional.
+"""
+from __future__ import print_function, division, absolute_import
+
+from array import array
+from collections.abc import Mapping
+import heapq
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class WorkerIndex(object):
+    """ Rows of workers in a set of ``WorkerColumn`` objects
+
+    Rows of removed workers hold zeros and are reused for workers added later.
+
+    Examples
+    --------
+    >>> index = WorkerIndex()
+    >>> occupancy = WorkerColumn(index)
+    >>> ncores = WorkerColumn(index, 'q')
+    >>> index.add('alice')
+    0
+    >>> occupancy['alice'] = 1.5
+    >>> ncores['alice'] = 4
+    >>> occupancy.total, ncores.total
+    (1.5, 4)
+    >>> index.remove('alice')
+    >>> occupancy.total, ncores.total, len(occupancy)
+    (0.0, 0, 0)
+    """
+    def __init__(self):
+        self.rows = dict()
+        self.addresses = []  # address of each row, or None
+        self.free = []
+        self.columns = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, worker):
+        return worker in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def add(self, worker):
+        """ The row of a worker, adding it if it is new """
+        row = self.rows.get(worker)
+        if row is not None:
+            return row
+        if self.free:
+            row = self.free.pop()
+            self.addresses[row] = worker
+        else:
+            row = len(self.addresses)
+            self.addresses.append(worker)
+            for column in self.columns:
+                column.data.append(0)
+        self.rows[worker] = row
+        return row
+
+    def remove(self, worker):
+        """ Remove a worker, taking its values out of the totals """
+        row = self.rows.pop(worker)
+        self.addresses[row] = None
+        self.free.append(row)
+        for column in self.columns:
+            column.total -= column.data[row]
+            column.data[row] = 0
+        if not self.rows:
+            for column in self.columns:  # don't carry rounding errors along
+                column.total = 0.0 if column.data.typecode == 'd' else 0
+
+    def clear(self):
+        self.rows.clear()
+        del self.addresses[:]
+        del self.free[:]
+        for column in self.columns:
+            del column.data[:]
+            column.total = 0.0 if column.data.typecode == 'd' else 0
+
+    def select(self, workers):
+        """ The rows of the given workers, as a NumPy array """
+        return np.fromiter(map(self.rows.__getitem__, workers), 'i8',
+                           len(workers))
+
+
+class WorkerColumn(Mapping):
+    """ A number for each worker of a ``WorkerIndex``
+
+    This behaves as a dictionary from worker address to value.  Setting the
+    value of a new worker adds it to the index, and so to every other column
+    of the index, with a value of zero.  ``total`` is kept up to date as
+    values change.
+
+    Parameters
+    ----------
+    index: WorkerIndex
+    typecode: str
+        Type of the values, as for ``array.array``: ``'d'`` for floats and
+        ``'q'`` for integers
+    """
+    def __init__(self, index, typecode='d'):
+        self.index = index
+        self.rows = index.rows
+        self.data = array(typecode, [0] * len(index.addresses))
+        self.total = 0.0 if typecode == 'd' else 0
+        index.columns.append(self)
+
+    def __getitem__(self, worker):
+        return self.data[self.rows[worker]]
+
+    def __setitem__(self, worker, value):
+        row = self.rows.get(worker)
+        if row is None:
+            row = self.index.add(worker)
+        data = self.data
+        self.total += value - data[row]
+        data[row] = value
+
+    def __contains__(self, worker):
+        return worker in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return '<WorkerColumn: %s>' % dict(self)
+
+    def copy(self):
+        return dict(self)
+
+    def clear(self):
+        self.index.clear()
+
+    def array(self, workers=None):
+        """ Values of the given workers, or of every row, as a NumPy array
+
+        Rows of removed workers hold zero.  The array is a copy.
+        """
+        if workers is None:
+            return self.take(slice(None)).copy()
+        else:
+            return self.take(self.index.select(workers))
+
+    def take(self, rows):
+        """ Values of the given rows, as in ``WorkerIndex.select`` """
+        return np.frombuffer(self.data, dtype=self.data.typecode)[rows]
+
+    def topk(self, k):
+        """ The ``k`` workers with the largest values, largest first
+
+        >>> index = WorkerIndex()
+        >>> occupancy = WorkerColumn(index)
+        >>> occupancy.update({'a': 1, 'b': 3, 'c': 2})
+        >>> occupancy.topk(2)
+        ['b', 'c']
+        """
+        if np is None or k * 10 > len(self.rows):
+            return heapq.nlargest(k, self.rows, key=self.__getitem__)
+        values = self.array().astype('f8')
+        values[self.index.free] = -np.inf
+        rows = np.argpartition(values, len(values) - k)[-k:]
+        rows = rows[values[rows].argsort()[::-1]]
+        addresses = self.index.addresses
+        return [addresses[row] for row in rows]
+
+    def update(self, other):
+        for worker, value in other.items():
+            self[worker] = value
@@ -0,0 +1,375 @@
+from __future__ import print_function, division, absolute_import
+
+import atexit
+import inspect
+import itertools
+import logging
+import mmap
+import os
+import socket
+import struct
+import tempfile
+
+import asyncio
+
+from .. import config
+from ..compatibility import finalize
+from ..utils import get_ip, nbytes
+
+from .registry import Backend, backends
+from .core import Comm, Connector, Listener, CommClosedError
+from .utils import to_frames, from_frames
+
+
+logger = logging.getLogger(__name__)
+
+
+def _default_directory():
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+# Where listening sockets and shared memory segments are created.  Both ends
+# of a comm must agree on this, as only segment names are sent.
+SHM_DIRECTORY = config.get('shm-directory', None) or _default_directory()
+
+# Frames at least this large are passed through a shared memory segment
+# rather than through the socket
+SHM_FRAME_BYTES = int(config.get('shm-frame-bytes', 2**18))
+
+# How long the peer has to read the messages sent before a comm is closed.
+# Segments it hasn't picked up by then are removed.
+SHM_CLOSE_GRACE = float(config.get('shm-close-grace', 10))
+
+SEGMENT_PREFIX = 'dask-segment-'
+
+DEFAULT_BACKLOG = 2048
+
+_socket_suffixes = itertools.count(1)
+
+
+def parse_shm_address(loc):
+    """
+    Split a scheme-less shm address into its host and socket path.
+
+    The path is None if the address doesn't have one.
+
+    >>> parse_shm_address('10.0.0.1/dev/shm/dask-123-1.sock')
+    ('10.0.0.1', '/dev/shm/dask-123-1.sock')
+    >>> parse_shm_address('10.0.0.1')
+    ('10.0.0.1', None)
+    """
+    host, sep, path = loc.partition('/')
+    return host, sep + path if path else None
+
+
+def new_socket_path():
+    return os.path.join(SHM_DIRECTORY, 'dask-%d-%d.sock'
+                        % (os.getpid(), next(_socket_suffixes)))
+
+
+def write_segment(frame):
+    """
+    Copy a frame into a new shared memory segment and return its name.
+    """
+    fd, path = tempfile.mkstemp(prefix=SEGMENT_PREFIX, dir=SHM_DIRECTORY)
+    try:
+        data = memoryview(frame).cast('B')
+        while data:
+            data = data[os.write(fd, data):]
+    except BaseException:
+        os.unlink(path)
+        raise
+    finally:
+        os.close(fd)
+    return os.path.basename(path)
+
+
+def read_segment(name, n):
+    """
+    Map the shared memory segment *name*, of *n* bytes, and remove it.
+
+    The mapping is private and copy-on-write, so the returned memoryview is
+    writable without the data having been copied.
+    """
+    if not name.startswith(SEGMENT_PREFIX) or os.sep in name:
+        raise ValueError("invalid shared memory segment %r" % (name,))
+    path = os.path.join(SHM_DIRECTORY, name)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.unlink(path)
+        mm = mmap.mmap(fd, n, access=mmap.ACCESS_COPY)
+    finally:
+        os.close(fd)
+    return memoryview(mm)
+
+
+def unlink_segments(names):
+    for name in names:
+        try:
+            os.unlink(os.path.join(SHM_DIRECTORY, name))
+        except EnvironmentError:
+            pass
+
+
+def prune_segments(names):
+    """
+    Drop from the set *names* the segments that no longer exist.
+    """
+    names.difference_update([name for name in names
+                             if not os.path.exists(os.path.join(SHM_DIRECTORY,
+                                                                name))])
+
+
+# Segments of closed comms that are waiting for SHM_CLOSE_GRACE to run out
+_closing = set()
+
+
+def unlink_segments_later(names, delay):
+    """
+    Unlink the segments *names* after *delay* seconds, or at exit.
+    """
+    names = set(names)
+    _closing.update(names)
+
+    def unlink():
+        _closing.difference_update(names)
+        unlink_segments(names)
+
+    asyncio.get_event_loop().call_later(delay, unlink)
+
+
+atexit.register(lambda: unlink_segments(list(_closing)))
+
+
+class SHM(Comm):
+    """
+    An established communication over a Unix domain socket, with large
+    frames passed through shared memory.
+
+    Every message starts with its number of frames, followed by two lengths
+    for each frame: bytes sent inline through the socket and bytes held in a
+    shared memory segment.  For frames in a segment the inline bytes are the
+    segment's name.  The receiver maps the segment and unlinks it right away,
+    so that it is freed once the deserialized data is dropped.
+
+    The sender keeps the names of the segments that the receiver hasn't
+    unlinked yet, and removes them itself when the comm is aborted or
+    garbage collected, or ``SHM_CLOSE_GRACE`` seconds after it is closed.
+    """
+    def __init__(self, reader, writer, local_addr, peer_addr,
+                 deserialize=True):
+        self._local_addr = local_addr
+        self._peer_addr = peer_addr
+        self.reader = reader
+        self.writer = writer
+        self.deserialize = deserialize
+        # Segments the peer may not have picked up yet
+        self._sent = set()
+        self._prune_size = 100
+        self._finalizer = finalize(self, self._get_finalizer())
+        self._finalizer.atexit = False
+
+    def _get_finalizer(self):
+        def finalize(writer=self.writer, sent=self._sent, r=repr(self)):
+            logger.warning("Closing dangling socket in %s" % (r,))
+            writer.close()
+            unlink_segments(sent)
+
+        return finalize
+
+    @property
+    def local_address(self):
+        return self._local_addr
+
+    @property
+    def peer_address(self):
+        return self._peer_addr
+
+    async def read(self):
+        reader = self.reader
+        if reader is None:
+            raise CommClosedError
+
+        try:
+            n_frames = await reader.readexactly(8)
+            n_frames = struct.unpack('Q', n_frames)[0]
+            lengths = await reader.readexactly(16 * n_frames)
+            lengths = struct.unpack('Q' * 2 * n_frames, lengths)
+
+            frames = []
+            for inline, shared in zip(lengths[::2], lengths[1::2]):
+                frame = await reader.readexactly(inline) if inline else b''
+                if shared:
+                    frame = read_segment(frame.decode(), shared)
+                frames.append(frame)
+        except (asyncio.IncompleteReadError, EnvironmentError) as e:
+            self.abort()
+            raise CommClosedError("in %s: %s: %s"
+                                  % (self, e.__class__.__name__, e))
+
+        try:
+            msg = await from_frames(frames, deserialize=self.deserialize)
+        except EOFError:
+            # Frames possibly garbled or truncated by communication error
+            self.abort()
+            raise CommClosedError("aborted stream on truncated data")
+        return msg
+
+    async def write(self, msg):
+        writer = self.writer
+        if writer is None:
+            raise CommClosedError
+
+        frames = await to_frames(msg)
+
+        lengths = []
+        buffers = []
+        names = []
+        try:
+            for frame in frames:
+                n = nbytes(frame)
+                if n >= SHM_FRAME_BYTES:
+                    name = write_segment(frame)
+                    names.append(name)
+                    name = name.encode()
+                    lengths += [len(name), n]
+                    buffers.append(name)
+                else:
+                    lengths += [n, 0]
+                    if n:
+                        buffers.append(frame)
+            header = struct.pack('Q' * (len(lengths) + 1), len(frames),
+                                 *lengths)
+            writer.writelines([header] + buffers)
+            self._sent.update(names)
+            if len(self._sent) > self._prune_size:
+                prune_segments(self._sent)
+                self._prune_size = max(100, 2 * len(self._sent))
+            await writer.drain()
+        except EnvironmentError as e:
+            unlink_segments(names)
+            self.abort()
+            raise CommClosedError("in %s: %s: %s"
+                                  % (self, e.__class__.__name__, e))
+
+        return sum(map(nbytes, frames))
+
+    async def close(self):
+        writer, self.writer = self.writer, None
+        self.reader = None
+        if writer is not None:
+            self._finalizer.detach()
+            try:
+                await writer.drain()
+            except EnvironmentError:
+                pass
+            finally:
+                writer.close()
+                if self._sent:
+                    unlink_segments_later(self._sent, SHM_CLOSE_GRACE)
+
+    def abort(self):
+        writer, self.writer = self.writer, None
+        self.reader = None
+        if writer is not None:
+            self._finalizer.detach()
+            writer.transport.abort()
+            unlink_segments(self._sent)
+
+    def closed(self):
+        return self.writer is None or self.writer.transport.is_closing()
+
+
+class SHMListener(Listener):
+
+    def __init__(self, address, comm_handler, deserialize=True):
+        self.host, self.path = parse_shm_address(address)
+        self.host = self.host or get_ip()
+        self.comm_handler = comm_handler
+        self.deserialize = deserialize
+        self.server = None
+
+    def start(self):
+        if self.path is None:
+            self.path = new_socket_path()
+        # Bind synchronously, so that we can be connected to as soon as
+        # start() returns
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(self.path)
+            sock.listen(int(config.get('socket-backlog', DEFAULT_BACKLOG)))
+        except EnvironmentError:
+            sock.close()
+            raise
+        self.server = asyncio.ensure_future(
+            asyncio.start_unix_server(self._handle_stream, sock=sock))
+
+    def stop(self):
+        server, self.server = self.server, None
+        if server is not None:
+            server.add_done_callback(lambda fut: fut.result().close())
+            try:
+                os.unlink(self.path)
+            except EnvironmentError:
+                pass
+
+    async def _handle_stream(self, reader, writer):
+        # Connecting sockets are unnamed, all we know is that they are local
+        address = 'shm://' + self.host
+        logger.debug("Incoming connection from %r to %r",
+                     address, self.contact_address)
+        comm = SHM(reader, writer, self.contact_address, address,
+                   self.deserialize)
+        result = self.comm_handler(comm)
+        if inspect.isawaitable(result):
+            await result
+
+    @property
+    def listen_address(self):
+        return 'shm://%s%s' % (self.host, self.path)
+
+    @property
+    def contact_address(self):
+        return self.listen_address
+
+
+class SHMConnector(Connector):
+
+    async def connect(self, address, deserialize=True, **connection_args):
+        host, path = parse_shm_address(address)
+        if path is None:
+            raise ValueError("invalid shm address %r: no socket path"
+                             % (address,))
+        reader, writer = await asyncio.open_unix_connection(path)
+        return SHM(reader, writer, 'shm://' + host, 'shm://' + address,
+                   deserialize)
+
+
+class SHMBackend(Backend):
+
+    # I/O
+
+    def get_connector(self):
+        return SHMConnector()
+
+    def get_listener(self, loc, handle_comm, deserialize, **connection_args):
+        return SHMListener(loc, handle_comm, deserialize)
+
+    # Address handling
+
+    def get_address_host(self, loc):
+        return parse_shm_address(loc)[0]
+
+    def resolve_address(self, loc):
+        return loc
+
+    def get_local_address_for(self, loc):
+        # Only peers on this host can be reached, and they know it by the
+        # same name as we do
+        return parse_shm_address(loc)[0]
+
+
+if hasattr(socket, 'AF_UNIX'):
+    backends['shm'] = SHMBackend()
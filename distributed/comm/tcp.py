@@ -1,5 +1,6 @@
 from __future__ import print_function, division, absolute_import
 
+from collections import Counter
 import errno
 import logging
 import socket
@@ -20,7 +21,7 @@ from ..utils import ensure_bytes, ensure_ip, get_ip, get_ipv6, nbytes
 from .registry import Backend, backends
 from .addressing import parse_host_port, unparse_host_port
 from .core import Comm, Connector, Listener, CommClosedError
-from .utils import (to_frames, from_frames,
+from .utils import (to_frames, from_frames, allocate_frames,
                     get_tcp_server_address, ensure_concrete_host)
 
 
@@ -39,6 +40,10 @@ MAX_BUFFER_SIZE = get_total_physical_memory()
 
 DEFAULT_BACKLOG = 2048
 
+# Frames smaller than this are copied into one buffer with their neighbours
+# rather than written to the stream on their own
+COALESCE_BYTES = int(config.get('tcp-coalesce-bytes', 2**14))
+
 
 def set_tcp_timeout(stream):
     """
@@ -122,6 +127,37 @@ def convert_stream_closed_error(obj, exc):
         raise CommClosedError("in %s: %s" % (obj, exc))
 
 
+def coalesce_frames(frames, allow_memoryview=True):
+    """
+    Prepare frames for writing to a stream, preceded by their lengths
+
+    Returns the buffers to write, in order, and the number of bytes copied to
+    produce them.  The lengths header and runs of frames smaller than
+    ``COALESCE_BYTES`` are joined into single buffers, so that they cost one
+    write rather than one each.  Larger frames are passed through as they are.
+    """
+    lengths = [nbytes(frame) for frame in frames]
+    pending = bytearray(struct.pack('Q' * (len(frames) + 1),
+                                    len(frames), *lengths))
+    copied = len(pending)
+    out = []
+    for frame, length in zip(frames, lengths):
+        if length < COALESCE_BYTES:
+            pending += frame
+            copied += length
+        else:
+            if pending:
+                out.append(pending)
+                pending = bytearray()
+            if not allow_memoryview and type(frame) is not bytes:
+                frame = ensure_bytes(frame)
+                copied += length
+            out.append(frame)
+    if pending:
+        out.append(pending)
+    return out, copied
+
+
 class TCP(Comm):
     """
     An established communication based on an underlying Tornado IOStream.
@@ -138,6 +174,8 @@ class TCP(Comm):
         self._finalizer = finalize(self, self._get_finalizer())
         self._finalizer.atexit = False
         self._extra = {}
+        # Cumulative 'messages', 'writes', 'bytes' and 'bytes-copied' sent
+        self.counters = Counter()
 
         stream.set_nodelay(True)
         set_tcp_timeout(stream)
@@ -173,13 +211,22 @@ class TCP(Comm):
             lengths = await stream.read_bytes(8 * n_frames)
             lengths = struct.unpack('Q' * n_frames, lengths)
 
-            frames = []
-            for length in lengths:
-                if length:
-                    frame = await stream.read_bytes(length)
-                else:
-                    frame = b''
-                frames.append(frame)
+            if hasattr(stream, 'read_into'):
+                # Fill buffers of our own rather than have the stream
+                # allocate and copy each frame
+                frames = allocate_frames(lengths)
+                for frame in frames:
+                    if len(frame):
+                        n = await stream.read_into(frame)
+                        assert n == len(frame), (n, len(frame))
+            else:
+                frames = []
+                for length in lengths:
+                    if length:
+                        frame = await stream.read_bytes(length)
+                    else:
+                        frame = b''
+                    frames.append(frame)
         except StreamClosedError as e:
             self.stream = None
             convert_stream_closed_error(self, e)
@@ -198,24 +245,26 @@ class TCP(Comm):
             raise CommClosedError
 
         frames = await to_frames(msg)
-        if not self._iostream_allows_memoryview:
-            frames = [ensure_bytes(f) for f in frames]
+        buffers, copied = coalesce_frames(
+            frames, allow_memoryview=self._iostream_allows_memoryview)
 
         try:
-            lengths = ([struct.pack('Q', len(frames))] +
-                       [struct.pack('Q', nbytes(frame)) for frame in frames])
-            stream.write(b''.join(lengths))
-
-            for frame in frames:
+            for buf in buffers:
                 # Can't wait for the write() Future as it may be lost
                 # ("If write is called again before that Future has resolved,
                 #   the previous future will be orphaned and will never resolve")
-                stream.write(frame)
+                stream.write(buf)
         except StreamClosedError as e:
             stream = None
             convert_stream_closed_error(self, e)
 
-        return sum(map(nbytes, frames))
+        n = sum(map(nbytes, frames))
+        counters = self.counters
+        counters['messages'] += 1
+        counters['writes'] += len(buffers)
+        counters['bytes'] += n
+        counters['bytes-copied'] += copied
+        return n
 
     async def close(self):
         stream, self.stream = self.stream, None
@@ -1,8 +1,10 @@
 from __future__ import print_function, division, absolute_import
 
 from functools import partial
+import mmap
 import os
 import ssl
+import struct
 import sys
 import threading
 
@@ -21,7 +23,8 @@ from distributed.utils_test import (slow, loop, gen_test, gen_cluster,
 from distributed.protocol import (loads, dumps,
                                   to_serialize, Serialized, serialize, deserialize)
 
-from distributed.comm import (tcp, inproc, connect, listen, CommClosedError,
+from distributed.comm import (tcp, inproc, shm, connect, listen,
+                              CommClosedError,
                               parse_address, parse_host_port,
                               unparse_host_port, resolve_address,
                               get_address_host, get_local_address_for)
@@ -83,6 +86,9 @@ def get_tls_comm_pair():
 def get_inproc_comm_pair():
     return get_comm_pair('inproc://')
 
+def get_shm_comm_pair():
+    return get_comm_pair('shm://')
+
 
 @gen.coroutine
 def debug_loop():
@@ -145,6 +151,7 @@ def test_get_address_host():
 
     assert f('tcp://127.0.0.1:123') == '127.0.0.1'
     assert f('inproc://%s/%d/123' % (get_ip(), os.getpid())) == get_ip()
+    assert f('shm://127.0.0.1/tmp/dask-123-1.sock') == '127.0.0.1'
 
 
 def test_resolve_address():
@@ -181,6 +188,91 @@ def test_get_local_address_for():
     assert inproc_res.startswith('inproc://')
     assert inproc_res != inproc_arg
 
+    assert f('shm://127.0.0.1/tmp/dask-123-1.sock') == 'shm://127.0.0.1'
+
+
+def test_tcp_coalesce_frames():
+    big = memoryview(b'x' * tcp.COALESCE_BYTES)
+    frames = [b'ab', b'', b'cde', big, b'f', big]
+    buffers, copied = tcp.coalesce_frames(frames)
+
+    header = struct.pack('Q' * 7, 6, 2, 0, 3, len(big), 1, len(big))
+    assert list(map(bytes, buffers)) == [header + b'abcde', big, b'f', big]
+    assert buffers[1] is big and buffers[3] is big
+    assert copied == len(header) + 6
+
+    buffers, copied = tcp.coalesce_frames(frames, allow_memoryview=False)
+    assert type(buffers[1]) is bytes
+    assert copied == len(header) + 6 + 2 * len(big)
+
+
+class _MemoryStream(object):
+    """ Stand-in for an IOStream that reads back what was written to it """
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def set_nodelay(self, value):
+        pass
+
+    def closed(self):
+        return True  # no socket to set a timeout on
+
+    def write(self, data):
+        self.buffer += data
+
+    def _take(self, n):
+        assert len(self.buffer) >= n
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+    @gen.coroutine
+    def read_bytes(self, n):
+        raise gen.Return(self._take(n))
+
+
+class _ReadIntoStream(_MemoryStream):
+    """ Stand-in for an IOStream of Tornado 5, which has read_into """
+    def __init__(self):
+        _MemoryStream.__init__(self)
+        self.read_into_calls = 0
+
+    @gen.coroutine
+    def read_into(self, buf):
+        self.read_into_calls += 1
+        buf[:] = self._take(len(buf))
+        raise gen.Return(len(buf))
+
+
+@gen_test()
+def test_tcp_read_frames():
+    np = pytest.importorskip('numpy')
+    x = np.random.random(10000)
+    msgs = [{'op': 'first', 'x': to_serialize(x), 'y': b'123',
+             'z': to_serialize(b'')},
+            {'op': 'second', 'data': [to_serialize(x[::2]), b'4' * 10000]}]
+
+    for stream_type in [_MemoryStream, _ReadIntoStream]:
+        stream = stream_type()
+        comm = tcp.TCP(stream, 'tcp://127.0.0.1:1', 'tcp://127.0.0.1:2')
+        for msg in msgs:
+            yield comm.write(msg)
+
+        first = yield comm.read()
+        assert first['op'] == 'first'
+        assert (first['x'] == x).all()
+        assert first['y'] == b'123'
+        assert first['z'] == b''
+        second = yield comm.read()
+        assert second['op'] == 'second'
+        assert (second['data'][0] == x[::2]).all()
+        assert second['data'][1] == b'4' * 10000
+        assert not stream.buffer
+
+    # Frames went straight into buffers allocated by the comm
+    assert stream.read_into_calls >= 4
+    assert first['x'].flags.writeable
+
 
 #
 # Test concrete transport APIs
@@ -282,6 +374,82 @@ def test_tls_specific():
     assert set(l) == {1234} | set(range(N))
 
 
+@gen_test()
+def test_shm_specific():
+    """
+    Test concrete shared memory API.
+    """
+    np = pytest.importorskip('numpy')
+
+    @gen.coroutine
+    def handle_comm(comm):
+        msg = yield comm.read()
+        msg['op'] = 'pong'
+        msg['x'] = to_serialize(msg['x'])
+        yield comm.write(msg)
+        yield comm.close()
+
+    listener = shm.SHMListener(get_ip(), handle_comm)
+    listener.start()
+    assert listener.listen_address.startswith('shm://' + get_ip() + '/')
+    scheme, loc = parse_address(listener.contact_address)
+
+    # Random, so that it isn't compressed on the way
+    x = np.random.random(shm.SHM_FRAME_BYTES // 8 + 1)
+    comm = yield shm.SHMConnector().connect(loc)
+    yield comm.write({'op': 'ping', 'x': to_serialize(x), 'y': b'123'})
+    msg = yield comm.read()
+    assert msg['op'] == 'pong'
+    assert msg['y'] == b'123'
+    assert (msg['x'] == x).all()
+    # Received from a mapped segment, which is already gone
+    assert isinstance(msg['x'].base, mmap.mmap)
+    assert msg['x'].flags.writeable
+    assert not [name for name in os.listdir(shm.SHM_DIRECTORY)
+                if name.startswith(shm.SEGMENT_PREFIX)]
+    yield comm.close()
+
+    listener.stop()
+    assert not os.path.exists(loc.partition('/')[2])
+
+
+@gen_test()
+def test_shm_unread_segments():
+    """
+    Segments of messages that are never read are removed when the comm is
+    closed or aborted.
+    """
+    def segments():
+        return {name for name in os.listdir(shm.SHM_DIRECTORY)
+                if name.startswith(shm.SEGMENT_PREFIX)}
+
+    before = segments()
+    x = to_serialize(os.urandom(shm.SHM_FRAME_BYTES))
+
+    # More messages than were once remembered
+    a, b = yield get_shm_comm_pair()
+    for i in range(150):
+        yield a.write({'x': x})
+    assert len(segments() - before) == 150
+
+    grace = shm.SHM_CLOSE_GRACE
+    shm.SHM_CLOSE_GRACE = 0.1
+    try:
+        yield b.close()
+        yield a.close()
+        yield gen.sleep(0.5)
+    finally:
+        shm.SHM_CLOSE_GRACE = grace
+    assert not segments() - before
+
+    a, b = yield get_shm_comm_pair()
+    for i in range(3):
+        yield a.write({'x': x})
+    a.abort()
+    b.abort()
+    assert not segments() - before
+
+
 @gen.coroutine
 def check_inproc_specific(run_client):
     """
@@ -406,7 +574,7 @@ def check_client_server(addr, check_listen_addr=None, check_contact_addr=None,
     # Check listener properties
     bound_addr = listener.listen_address
     bound_scheme, bound_loc = parse_address(bound_addr)
-    assert bound_scheme in ('inproc', 'tcp', 'tls')
+    assert bound_scheme in ('inproc', 'tcp', 'tls', 'shm')
     assert bound_scheme == parse_address(addr)[0]
 
     if check_listen_addr is not None:
@@ -473,6 +641,14 @@ def inproc_check():
 
     return checker
 
+def shm_check(expected_host):
+    def checker(loc):
+        host, path = shm.parse_shm_address(loc)
+        assert host == expected_host
+        assert path.startswith(shm.SHM_DIRECTORY)
+
+    return checker
+
 
 @gen_test()
 def test_default_client_server_ipv4():
@@ -541,6 +717,12 @@ def test_inproc_client_server():
     yield check_client_server(inproc.new_address(), inproc_check())
 
 
+@gen_test()
+def test_shm_client_server():
+    yield check_client_server('shm://', shm_check(get_ip()))
+    yield check_client_server('shm://127.0.0.1', shm_check('127.0.0.1'))
+
+
 #
 # TLS certificate handling
 #
@@ -954,6 +1136,13 @@ def test_inproc_repr():
     assert b.local_address in repr(a)
     yield check_repr(a, b)
 
+@gen_test()
+def test_shm_repr():
+    a, b = yield get_shm_comm_pair()
+    assert a.local_address in repr(b)
+    assert b.local_address in repr(a)
+    yield check_repr(a, b)
+
 
 @gen.coroutine
 def check_addresses(a, b):
@@ -976,3 +1165,8 @@ def test_tls_adresses():
 def test_inproc_adresses():
     a, b = yield get_inproc_comm_pair()
     yield check_addresses(a, b)
+
+@gen_test()
+def test_shm_adresses():
+    a, b = yield get_shm_comm_pair()
+    yield check_addresses(a, b)
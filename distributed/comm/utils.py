@@ -1,5 +1,6 @@
 from __future__ import print_function, division, absolute_import
 
+import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import logging
 import socket
@@ -8,6 +9,7 @@ import socket
 
 from .. import protocol
 from ..compatibility import finalize
+from ..protocol.utils import BIG_BYTES_SHARD_SIZE
 from ..sizeof import sizeof
 from ..utils import get_ip, get_ipv6, mp_context, nbytes
 
@@ -25,7 +27,7 @@ finalize(_offload_executor, _offload_executor.shutdown)
 
 
 def offload(fn, *args, **kwargs):
-    return _offload_executor.submit(fn, *args, **kwargs)
+    return asyncio.wrap_future(_offload_executor.submit(fn, *args, **kwargs))
 
 
 async def to_frames(msg):
@@ -75,6 +77,38 @@ async def from_frames(frames, deserialize=True):
     return res
 
 
+def allocate_frames(lengths):
+    """
+    Allocate writable buffers to receive frames of the given lengths into
+
+    Each frame gets a ``bytearray`` of its own, except for runs of frames that
+    ``frame_split_size`` cut from one large frame.  Those are slices of a
+    single ``bytearray``, so that ``merge_frames`` can put them back together
+    without copying.
+
+    Examples
+    --------
+    >>> allocate_frames([3, 0])
+    [bytearray(b'\\x00\\x00\\x00'), b'']
+    """
+    frames = []
+    i = 0
+    while i < len(lengths):
+        j = i + 1
+        while lengths[j - 1] == BIG_BYTES_SHARD_SIZE and j < len(lengths):
+            j += 1
+        if j == i + 1:
+            frames.append(bytearray(lengths[i]) if lengths[i] else b'')
+        else:
+            buf = memoryview(bytearray(sum(lengths[i:j])))
+            start = 0
+            for length in lengths[i:j]:
+                frames.append(buf[start:start + length])
+                start += length
+        i = j
+    return frames
+
+
 def get_tcp_server_address(tcp_server):
     """
     Get the bound address of a started Tornado TCPServer.
@@ -41,18 +41,15 @@ class Adaptive(object):
             if self.scheduler.unrunnable and not self.scheduler.ncores:
                 return True
 
-            total_occupancy = sum(self.scheduler.occupancy.values())
-            total_cores = sum(self.scheduler.ncores.values())
+            total_occupancy = (self.scheduler.total_occupancy
+                               + self.scheduler.queued_occupancy)
+            total_cores = self.scheduler.total_ncores
 
             if total_occupancy / (total_cores + 1e-9) > self.startup_cost * 2:
                 return True
 
-            limit_bytes = {w: self.scheduler.worker_info[w]['memory_limit']
-                            for w in self.scheduler.worker_info}
-            worker_bytes = self.scheduler.worker_bytes
-
-            limit = sum(limit_bytes.values())
-            total = sum(worker_bytes.values())
+            limit = self.scheduler.memory_limit.total
+            total = self.scheduler.worker_bytes.total
 
             if total > 0.6 * limit:
                 return True
@@ -18,11 +18,13 @@ def tasks(s):
     processing = sum(map(len, s.processing.values()))
 
     with log_errors():
+        counts = s.task_counts()
         return {'processing': processing,
                 'total': len(s.tasks),
-                'in-memory': len(s.who_has),
-                'waiting': len(s.waiting),
-                'failed': len(s.exceptions_blame)}
+                'in-memory': counts['in-memory'],
+                'queued': len(s.queued),
+                'waiting': counts['waiting'],
+                'failed': counts['failed']}
 
 
 def workers(s):
@@ -66,7 +68,8 @@ def workers(s):
 
 
 def processing(s):
+    counts = s.task_counts()
     return {'processing': valmap(len, s.processing),
-            'waiting': len(s.waiting),
-            'memory': len(s.who_has),
-            'ncores': s.ncores}
+            'waiting': counts['waiting'],
+            'memory': counts['in-memory'],
+            'ncores': dict(s.ncores)}
@@ -25,7 +25,7 @@ def ensure_string(s):
 def info_handler(request):
     """ Basic info about the scheduler """
     server = request.app['server']
-    return web.json_response({'ncores': server.ncores,
+    return web.json_response({'ncores': dict(server.ncores),
                               'status': server.status})
 
 # class Info(RequestHandler):
@@ -165,6 +165,13 @@ def workers_handler(request):
 #             self.write(workers(self.server))
 
 
+def task_prefixes_handler(request):
+    """ Statistics of the durations, result sizes and failures of tasks by
+    key prefix """
+    server = request.app['server']
+    return web.json_response(server.get_task_prefixes())
+
+
 def scheduler_app(scheduler, **kwargs):
     app = web.Application(**kwargs)
     app['server'] = scheduler
@@ -178,6 +185,7 @@ def scheduler_app(scheduler, **kwargs):
     router.add_get('/workers.json', workers_handler)
     router.add_get('/memory-load.json', memory_load_handler)
     router.add_get('/memory-load-by-key.json', memory_load_by_key_handler)
+    router.add_get('/task-prefixes.json', task_prefixes_handler)
     return app
 
 # def HTTPScheduler(scheduler, **kwargs):
@@ -0,0 +1,130 @@
+""" Priorities of tasks across the graphs submitted to the scheduler
+
+Every graph that clients submit gets a new generation and within it the
+ranks of ``dask.order``, so that tasks have priorities like ``(generation,
+rank)``.  Older generations come first.  This runs graphs in the order they
+were submitted, but ranks tasks that continue the work of an older graph
+behind all of the graphs submitted since.  A stream of small graphs, each
+building on the results of the last, then keeps intermediate results in
+memory for long, waiting for their consumers to come up.
+
+Instead we rank such tasks with the graph they continue.  A new task that
+depends on a task of an older generation that is still to run, or whose
+result is only held for the tasks that depend on it, is anchored to that
+dependency and gets the priority
+
+    (generation, -critical_path, rank, -nbytes, new_rank)
+
+where ``generation`` and ``rank`` are those of its anchor,
+``critical_path`` is the expected time of the longest chain of new tasks
+from it to an output, ``nbytes`` the size of the older results it consumes
+and ``new_rank`` its rank in its own graph.  So continuations come before
+the remaining tasks of the graph they continue, which frees the memory of
+the results they consume, those with the longest way to go first, and
+otherwise in the order of their anchors.
+
+Tasks that depend on several older tasks are anchored to the one that comes
+first, and continuations of continuations to the anchor of the task they
+continue.  Dependents of these tasks in the new graph are ranked the same
+way, so that whole continuations move along with the graph they continue,
+while the rest of the new graph keeps its new generation.
+"""
+from __future__ import print_function, division, absolute_import
+
+# States of tasks whose results other graphs may be waiting on
+_PENDING_STATES = ('waiting', 'no-worker', 'queued', 'processing')
+
+
+def _anchor(priority):
+    """ The generation and rank of the task that a priority is anchored to
+
+    >>> _anchor((3, 10))
+    (3, 10)
+    >>> _anchor((3, -1.5, 10, -1000, 2))
+    (3, 10)
+    """
+    if len(priority) > 2:
+        return priority[0], priority[2]
+    return tuple(priority)
+
+
+def _continues(dts, generation):
+    """ Whether a new task depending on *dts* continues an older graph """
+    if dts.priority is None or dts.priority[0] >= generation:
+        return False
+    if dts.state in _PENDING_STATES:
+        return True
+    # Results only kept for their dependents are released once they are
+    # used, persisted ones are not
+    return dts.state == 'memory' and not dts.who_wants
+
+
+def merge_priorities(tasks, generation, duration):
+    """ Rank new tasks that continue older graphs with those graphs
+
+    Parameters
+    ----------
+    tasks: dict
+        The new tasks, ``{key: TaskState}``, linked to their dependencies and
+        with priorities ``(generation, rank)``
+    generation:
+        The generation of the new tasks
+    duration: callable
+        Expected computation time of a ``TaskState``
+
+    Returns
+    -------
+    Dict mapping TaskStates to their new priorities
+    """
+    # New tasks that depend on older graphs, and their new dependents
+    affected = {}  # TaskState: [anchor priority, bytes of older inputs]
+    stack = []
+    for ts in tasks.values():
+        for dts in ts.dependencies:
+            if dts.key not in tasks and _continues(dts, generation):
+                anchor = _anchor(dts.priority)
+                info = affected.get(ts)
+                if info is None:
+                    info = affected[ts] = [anchor, 0]
+                    stack.append(ts)
+                elif anchor < info[0]:
+                    info[0] = anchor
+                info[1] += dts.get_nbytes()
+    if not affected:
+        return {}
+    while stack:
+        ts = stack.pop()
+        for dts in ts.dependents:
+            if dts not in affected and dts.key in tasks:
+                affected[dts] = [None, 0]
+                stack.append(dts)
+
+    # Anchors flow from dependencies to dependents, in topological order
+    waiting = {ts: sum(1 for dts in ts.dependencies if dts in affected)
+               for ts in affected}
+    ready = [ts for ts, n in waiting.items() if not n]
+    topological = []
+    while ready:
+        ts = ready.pop()
+        topological.append(ts)
+        anchor = affected[ts][0]
+        for dts in ts.dependents:
+            if dts in waiting:
+                info = affected[dts]
+                if anchor is not None and (info[0] is None
+                                           or anchor < info[0]):
+                    info[0] = anchor
+                waiting[dts] -= 1
+                if not waiting[dts]:
+                    ready.append(dts)
+
+    # Critical paths flow from dependents to dependencies
+    critical_path = {}
+    for ts in reversed(topological):
+        critical_path[ts] = duration(ts) + max(
+            [critical_path[dts] for dts in ts.dependents
+             if dts in critical_path] or [0])
+
+    return {ts: (anchor[0], -critical_path[ts], anchor[1], -nbytes,
+                 ts.priority[-1] if ts.priority else 0)
+            for ts, (anchor, nbytes) in affected.items()}
@@ -2,12 +2,14 @@ from __future__ import print_function, division, absolute_import
 
 from functools import partial
 
-from .compression import compressions, default_compression
+from .compression import (compressions, default_compression,
+                          register_compression, CompressionPolicy)
 from .core import (dumps, loads, maybe_compress, decompress, msgpack)
 from .serialize import (
     serialize, deserialize, nested_deserialize, Serialize, Serialized,
     to_serialize, register_serialization, register_serialization_lazy,
-    serialize_bytes, deserialize_bytes, serialize_bytelist)
+    serialize_bytes, deserialize_bytes, serialize_bytelist,
+    serialize_compressed)
 
 from ..utils  import ignoring
 
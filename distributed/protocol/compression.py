@@ -5,11 +5,13 @@ Includes utilities for determining whether or not to compress
 """
 from __future__ import print_function, division, absolute_import
 
+from collections import defaultdict
 import logging
 import random
+import threading
 
 from dask.context import _globals
-from toolz import identity, partial
+from toolz import identity
 
 try:
     import blosc
@@ -18,7 +20,8 @@ except ImportError:
     blosc = False
 
 from ..config import config
-from ..utils import ignoring, ensure_bytes
+from ..metrics import time
+from ..utils import ignoring, ensure_bytes, nbytes
 
 
 compressions = {None: {'compress': identity,
@@ -30,10 +33,19 @@ default_compression = None
 logger = logging.getLogger(__name__)
 
 
+def register_compression(name, compress, decompress):
+    """ Register a codec under ``name``
+
+    Compressed frames are labelled with the name of their codec, so the
+    same codec must be registered wherever they are decompressed.
+    """
+    compressions[name] = {'compress': compress,
+                          'decompress': decompress}
+
+
 with ignoring(ImportError):
     import zlib
-    compressions['zlib'] = {'compress': zlib.compress,
-                            'decompress': zlib.decompress}
+    register_compression('zlib', zlib.compress, zlib.decompress)
 
 with ignoring(ImportError):
     import snappy
@@ -44,8 +56,7 @@ with ignoring(ImportError):
             data = data.tobytes()
         return snappy.decompress(data)
 
-    compressions['snappy'] = {'compress': snappy.compress,
-                              'decompress': _fixed_snappy_decompress}
+    register_compression('snappy', snappy.compress, _fixed_snappy_decompress)
     default_compression = 'snappy'
 
 with ignoring(ImportError):
@@ -81,15 +92,31 @@ with ignoring(ImportError):
             else:
                 raise
 
-    compressions['lz4'] = {'compress': _fixed_lz4_compress,
-                           'decompress': _fixed_lz4_decompress}
+    register_compression('lz4', _fixed_lz4_compress, _fixed_lz4_decompress)
     default_compression = 'lz4'
 
+with ignoring(ImportError):
+    import zstandard
+
+    def _zstd_compress(data):
+        # Compressors aren't thread-safe, and are cheap to create
+        cctx = zstandard.ZstdCompressor(level=1, write_content_size=True)
+        return cctx.compress(ensure_bytes(data))
+
+    def _zstd_decompress(data):
+        return zstandard.ZstdDecompressor().decompress(ensure_bytes(data))
+
+    register_compression('zstd', _zstd_compress, _zstd_decompress)
+
 with ignoring(ImportError):
     import blosc
-    compressions['blosc'] = {'compress': partial(blosc.compress, clevel=5,
-                                                 cname='lz4'),
-                             'decompress': blosc.decompress}
+
+    def _blosc_compress(data):
+        # Blosc does itemsize-aware shuffling, resulting in better compression
+        typesize = data.itemsize if type(data) is memoryview else 8
+        return blosc.compress(data, typesize=typesize, clevel=5, cname='lz4')
+
+    register_compression('blosc', _blosc_compress, blosc.decompress)
 
 
 default = config.get('compression', 'auto')
@@ -172,6 +199,135 @@ def maybe_compress(payload, min_size=1e4, sample_size=1e4, nsamples=5):
         return compression, compressed
 
 
+class CompressionPolicy(object):
+    """
+    Choose per payload whether and how to compress data sent to a peer
+
+    Sending ``n`` bytes over a link of bandwidth ``B`` takes ``n / B``
+    seconds.  Compressing them first with a codec of speed ``S``, counting
+    both compression and decompression, down to a ratio ``r`` takes
+    ``n / S + r * n / B`` seconds instead.  We estimate ``B`` for each peer
+    from past transfers, and ``S`` and ``r`` for each payload by compressing
+    a sample of it with each candidate codec, then take whichever option is
+    quickest.  On links faster than any codec has been we skip the sampling
+    and send uncompressed.
+
+    Setting ``compression`` with ``dask.set_options`` overrides the
+    candidates, as it does for ``maybe_compress``.
+
+    Parameters
+    ----------
+    codecs: list of str, optional
+        Candidate codecs.  Defaults to whichever of lz4, zstd, blosc and
+        snappy are installed.
+    bandwidth: float, optional
+        Bytes per second assumed for peers we have no measurements for.
+    alpha: float, optional
+        Weight of each new measurement in the running averages.
+
+    Attributes
+    ----------
+    bandwidth: dict
+        Estimated bytes per second for each peer
+    speed: dict
+        Estimated bytes per second of each codec, to compress and decompress
+    counts: dict
+        Number of payloads compressed with each codec, or None for not at all
+    saved: dict
+        Bytes saved by each codec
+
+    Examples
+    --------
+    >>> policy = CompressionPolicy(codecs=['zlib'])  # doctest: +SKIP
+    >>> policy.update_bandwidth('tcp://10.0.0.2:8786', 1e6, 0.1)  # doctest: +SKIP
+    >>> policy.compress(payload, peer='tcp://10.0.0.2:8786')  # doctest: +SKIP
+    ('zlib', b'x\\x9c...')
+    """
+    def __init__(self, codecs=None, bandwidth=None, alpha=0.2):
+        if codecs is None:
+            codecs = [c for c in ('lz4', 'zstd', 'blosc', 'snappy')
+                      if c in compressions]
+        self.codecs = list(codecs)
+        if bandwidth is None:
+            bandwidth = config.get('bandwidth', 100e6)
+        self.default_bandwidth = bandwidth
+        self.alpha = alpha
+        self.bandwidth = dict()
+        self.speed = dict()
+        self.counts = defaultdict(int)
+        self.saved = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _update(self, d, key, value):
+        with self._lock:  # compress runs in several threads at once
+            old = d.get(key)
+            d[key] = (value if old is None
+                      else old + self.alpha * (value - old))
+
+    def update_bandwidth(self, peer, nbytes, duration):
+        """ Record that a transfer of ``nbytes`` from ``peer`` took
+        ``duration`` seconds
+
+        Links are assumed to be as fast in either direction.
+        """
+        if nbytes and duration > 0:
+            self._update(self.bandwidth, peer, nbytes / duration)
+
+    def choose(self, payload, peer=None, min_size=1e4, sample_size=1e4,
+               nsamples=5):
+        """ The codec that sends ``payload`` to ``peer`` quickest, or None
+
+        See Also
+        --------
+        CompressionPolicy.compress
+        """
+        if 'compression' in _globals:
+            codecs = [_globals['compression']] if _globals['compression'] else []
+        else:
+            codecs = self.codecs
+        n = nbytes(payload)
+        if not codecs or n < min_size or n > 2**31:
+            return None
+
+        bandwidth = self.bandwidth.get(peer, self.default_bandwidth)
+        if all(self.speed.get(c, bandwidth + 1) <= bandwidth for c in codecs):
+            return None
+
+        sample = byte_sample(payload, int(sample_size), nsamples)
+        best, best_cost = None, 1 / bandwidth  # seconds per byte
+        for c in codecs:
+            start = time()
+            compressed = compressions[c]['compress'](sample)
+            compressions[c]['decompress'](compressed)
+            duration = time() - start
+            if duration > 0:
+                self._update(self.speed, c, len(sample) / duration)
+            cost = (duration + len(compressed) / bandwidth) / len(sample)
+            if cost < best_cost:
+                best, best_cost = c, cost
+        return best
+
+    def compress(self, payload, peer=None):
+        """ Compress ``payload`` for sending to ``peer``
+
+        Returns the name of the codec used, or None, and the compressed
+        payload, as does ``maybe_compress``.  This may be called from
+        several threads at once.
+        """
+        codec = self.choose(payload, peer)
+        compressed = payload
+        if codec is not None:
+            if codec != 'blosc':
+                payload = ensure_bytes(payload)
+            compressed = compressions[codec]['compress'](payload)
+            if len(compressed) >= nbytes(payload):
+                codec, compressed = None, payload
+        with self._lock:
+            self.counts[codec] += 1
+            self.saved[codec] += nbytes(payload) - nbytes(compressed)
+        return codec, compressed
+
+
 def decompress(header, frames):
     """ Decompress frames according to information in the header """
     return [compressions[c]['decompress'](frame)
@@ -5,11 +5,29 @@ import sys
 
 import cloudpickle
 
+from ..utils import has_arg
+
 if sys.version_info.major == 2:
     import cPickle as pickle
+elif sys.version_info < (3, 8):
+    try:
+        import pickle5 as pickle
+    except ImportError:
+        import pickle
 else:
     import pickle
 
+HIGHEST_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+# Whether large buffers can be handed out of band, rather than copied into
+# the pickle stream (protocol 5, PEP 574)
+OUT_OF_BAND = HIGHEST_PROTOCOL >= 5
+CLOUDPICKLE_OUT_OF_BAND = OUT_OF_BAND and has_arg(cloudpickle.dumps,
+                                                  'buffer_callback')
+# Older cloudpickle doesn't know about protocol 5 even if pickle does
+CLOUDPICKLE_PROTOCOL = (HIGHEST_PROTOCOL if CLOUDPICKLE_OUT_OF_BAND
+                        else min(HIGHEST_PROTOCOL, 4))
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,36 +45,53 @@ def _always_use_pickle_for(x):
         return False
 
 
-def dumps(x):
+def dumps(x, buffer_callback=None):
     """ Manage between cloudpickle and pickle
 
     1.  Try pickle
     2.  If it is short then check if it contains __main__
     3.  If it is long, then first check type, then check __main__
+
+    With pickle protocol 5, ``buffer_callback`` is called with each buffer
+    that is left out of the pickle, as a ``PickleBuffer``.  They must be
+    passed to ``loads`` along with the result.
     """
+    buffers = []
+    kwargs = {'protocol': HIGHEST_PROTOCOL}
+    cloudpickle_kwargs = {'protocol': CLOUDPICKLE_PROTOCOL}
+    if buffer_callback is not None and OUT_OF_BAND:
+        kwargs['buffer_callback'] = buffers.append
+        if CLOUDPICKLE_OUT_OF_BAND:
+            cloudpickle_kwargs['buffer_callback'] = buffers.append
     try:
-        result = pickle.dumps(x, protocol=pickle.HIGHEST_PROTOCOL)
+        result = pickle.dumps(x, **kwargs)
         if len(result) < 1000:
             if b'__main__' in result:
-                return cloudpickle.dumps(x, protocol=pickle.HIGHEST_PROTOCOL)
-            else:
-                return result
+                del buffers[:]
+                result = cloudpickle.dumps(x, **cloudpickle_kwargs)
         else:
-            if _always_use_pickle_for(x) or b'__main__' not in result:
-                return result
-            else:
-                return cloudpickle.dumps(x, protocol=pickle.HIGHEST_PROTOCOL)
+            if not _always_use_pickle_for(x) and b'__main__' in result:
+                del buffers[:]
+                result = cloudpickle.dumps(x, **cloudpickle_kwargs)
     except:
+        del buffers[:]
         try:
-            return cloudpickle.dumps(x, protocol=pickle.HIGHEST_PROTOCOL)
+            result = cloudpickle.dumps(x, **cloudpickle_kwargs)
         except Exception as e:
             logger.info("Failed to serialize %s. Exception: %s", x, e)
             raise
+    if buffer_callback is not None:
+        for buf in buffers:
+            buffer_callback(buf)
+    return result
 
 
-def loads(x):
+def loads(x, buffers=()):
     try:
-        return pickle.loads(x)
+        if buffers:
+            return pickle.loads(x, buffers=buffers)
+        else:
+            return pickle.loads(x)
     except Exception:
         logger.info("Failed to deserialize %s", x[:10000], exc_info=True)
         raise
@@ -15,12 +15,38 @@ except ImportError:
 
 from . import pickle
 from ..compatibility import PY2
+from ..utils import nbytes
 from .compression import maybe_compress, decompress
-from .utils import unpack_frames, pack_frames_prelude, frame_split_size
+from .utils import (unpack_frames, pack_frames_prelude, frame_split_size,
+                    merge_frames)
+
+
+def pickle_dumps(x):
+    """ Pickle ``x`` into a header and frames
+
+    With pickle protocol 5 large buffers, such as those of NumPy arrays held
+    by ``x``, become frames of their own rather than being copied into the
+    pickle, which is the first frame.
+    """
+    frames = [None]
+    frames[0] = pickle.dumps(x, buffer_callback=lambda buf:
+                                frames.append(buf.raw()))
+    if len(frames) > 1:
+        return {'lengths': tuple(map(nbytes, frames))}, frames
+    return {}, frames
+
+
+def pickle_loads(header, frames):
+    """ Unpickle frames made by ``pickle_dumps``, without copying buffers """
+    if 'lengths' not in header:
+        return pickle.loads(b''.join(frames))
+    if len(frames) != len(header['lengths']):
+        frames = merge_frames(header, frames)
+    return pickle.loads(frames[0], buffers=frames[1:])
 
 
 serializers = {}
-deserializers = {None: lambda header, frames: pickle.loads(b''.join(frames))}
+deserializers = {None: pickle_loads}
 
 lazy_registrations = {}
 
@@ -135,7 +161,7 @@ def serialize(x):
     else:
         if _find_lazy_registration(name):
             return serialize(x)  # recurse
-        header, frames = {}, [pickle.dumps(x)]
+        header, frames = pickle_dumps(x)
 
     return header, frames
 
@@ -332,7 +358,10 @@ def _serialize_bytes(obj):
 
 
 def _deserialize_bytes(header, frames):
-    return frames[0]
+    frame = frames[0]
+    if type(frame) is not bytes:  # received into a buffer of our own
+        frame = bytes(frame)
+    return frame
 
 
 register_serialization(bytes, _serialize_bytes, _deserialize_bytes)
@@ -353,6 +382,29 @@ def serialize_bytelist(x):
     return [pack_frames_prelude(frames2)] + frames2
 
 
+def serialize_compressed(x, compress=maybe_compress):
+    """ Serialize and compress ``x`` ahead of sending it
+
+    ``dumps`` passes the result through as it is, so this lets the caller
+    choose how each frame is compressed.
+
+    Examples
+    --------
+    >>> policy = CompressionPolicy()  # doctest: +SKIP
+    >>> msg = {'x': serialize_compressed(x, partial(policy.compress,
+    ...                                             peer=address))}  # doctest: +SKIP
+    """
+    header, frames = serialize(x)
+    header['lengths'] = tuple(map(nbytes, frames))
+    frames = frame_split_size(frames)
+    if frames:
+        compression, frames = zip(*map(compress, frames))
+    else:
+        compression = []
+    header['compression'] = compression
+    return Serialized(header, list(frames))
+
+
 def serialize_bytes(x):
     L = serialize_bytelist(x)
     if PY2:
@@ -1,12 +1,14 @@
 from __future__ import print_function, division, absolute_import
 
+from functools import partial
 import sys
 
 import dask
 import pytest
 
 from distributed.protocol import (loads, dumps, msgpack, maybe_compress,
-        to_serialize)
+        to_serialize, serialize_compressed, register_compression,
+        CompressionPolicy)
 from distributed.protocol.compression import compressions
 from distributed.protocol.serialize import (Serialize, Serialized,
                                             serialize, deserialize)
@@ -102,6 +104,43 @@ def test_maybe_compress_sample():
     assert compressed == payload
 
 
+def test_compression_policy():
+    policy = CompressionPolicy(codecs=['zlib'], bandwidth=1e12)
+    payload = b'0' * 100000
+
+    # Faster to send than to compress, once we know how fast zlib is
+    assert policy.compress(payload) == (None, payload)
+    assert policy.speed['zlib'] < 1e12
+    assert policy.choose(payload) is None
+
+    policy.update_bandwidth('tcp://slow', 1000, 1)
+    assert policy.bandwidth['tcp://slow'] == 1000
+    rc, rd = policy.compress(payload, peer='tcp://slow')
+    assert rc == 'zlib'
+    assert compressions[rc]['decompress'](rd) == payload
+    assert policy.counts == {None: 1, 'zlib': 1}
+    assert policy.saved['zlib'] == len(payload) - len(rd)
+
+    # Small, incompressible or explicitly uncompressed payloads are left be
+    assert policy.compress(b'123', peer='tcp://slow') == (None, b'123')
+    with dask.set_options(compression=None):
+        assert policy.choose(payload, peer='tcp://slow') is None
+
+
+def test_register_compression():
+    import zlib
+    register_compression('zlib-1', partial(zlib.compress, level=1),
+                         zlib.decompress)
+    try:
+        payload = b'0123456789' * 10000
+        policy = CompressionPolicy(codecs=['zlib-1'], bandwidth=1000)
+        frames = dumps({'x': serialize_compressed(payload, policy.compress)})
+        assert zlib.compress(payload, 1) in frames
+        assert loads(frames) == {'x': payload}
+    finally:
+        del compressions['zlib-1']
+
+
 def test_large_bytes():
     msg = {'x': b'0' * 1000000, 'y': 1}
     frames = dumps(msg)
@@ -1,6 +1,9 @@
 from __future__ import print_function, division, absolute_import
 
-from distributed.protocol.utils import merge_frames, pack_frames, unpack_frames
+from distributed.comm import utils as comm_utils
+from distributed.comm.utils import allocate_frames
+from distributed.protocol.utils import (merge_frames, pack_frames,
+                                        unpack_frames)
 from distributed.utils import ensure_bytes
 
 def test_merge_frames():
@@ -16,6 +19,24 @@ def test_merge_frames():
     assert merge_frames({'lengths': [3, 3]}, L) is L
 
 
+def test_merge_frames_received_into_one_buffer():
+    old = comm_utils.BIG_BYTES_SHARD_SIZE
+    comm_utils.BIG_BYTES_SHARD_SIZE = 4
+    try:
+        frames = allocate_frames([4, 4, 2, 3])
+    finally:
+        comm_utils.BIG_BYTES_SHARD_SIZE = old
+    for frame, data in zip(frames, [b'0123', b'4567', b'89', b'abc']):
+        frame[:] = data
+
+    result = merge_frames({'lengths': [10, 3]}, frames)
+    assert list(map(ensure_bytes, result)) == [b'0123456789', b'abc']
+    # The shards were received next to each other, so aren't copied
+    assert result[0].obj is frames[0].obj
+    result[0][0] = ord('x')
+    assert frames[0][0] == ord('x')
+
+
 def test_pack_frames():
     frames = [b'123', b'asdf']
     b = pack_frames(frames)
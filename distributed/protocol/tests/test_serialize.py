@@ -181,3 +181,41 @@ def test_serialize_list_compress():
     b = b''.join(L)
     y = deserialize_bytes(b)
     assert (x == y).all()
+
+
+class OutOfBand(object):
+    """ Hands its buffer to pickle out of band when it can """
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        from distributed.protocol.pickle import pickle
+        if protocol >= 5:
+            return OutOfBand, (pickle.PickleBuffer(self.data),)
+        return OutOfBand, (self.data,)
+
+
+def test_serialize_pickle_out_of_band():
+    from distributed.protocol import pickle as protocol_pickle
+    from distributed.protocol import dumps, loads
+    from distributed.protocol.utils import frame_split_size
+    if not protocol_pickle.OUT_OF_BAND:
+        pytest.skip("requires pickle protocol 5")
+
+    x = OutOfBand(bytearray(b'x' * 1000000))
+    header, frames = serialize(x)
+    assert header['lengths'] == (nbytes(frames[0]), 1000000)
+    assert len(frames[0]) < 1000
+
+    y = deserialize(header, frames)
+    y.data[0] = ord('y')  # shares memory with the original, no copies
+    assert x.data[0] == ord('y')
+
+    frames = frame_split_size(frames, n=300000)
+    assert len(frames) > 2
+    y = deserialize(header, frames)
+    assert bytes(y.data) == bytes(x.data)
+
+    msg = loads(dumps({'x': to_serialize(x)}))
+    assert bytes(msg['x'].data) == bytes(x.data)
+    assert bytes(deserialize_bytes(serialize_bytes(x)).data) == bytes(x.data)
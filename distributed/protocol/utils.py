@@ -1,7 +1,9 @@
 from __future__ import print_function, division, absolute_import
 
+import ctypes
 import struct
 
+from ..compatibility import PY2
 from ..utils import ensure_bytes, nbytes
 
 BIG_BYTES_SHARD_SIZE = 2**28
@@ -77,10 +79,49 @@ def merge_frames(header, frames):
                 L.append(mv[:l])
                 frames.append(mv[l:])
                 l = 0
-        out.append(b''.join(map(ensure_bytes, L)))
+        out.append(join_frames(L))
     return out
 
 
+def _address(frame):
+    return ctypes.addressof(ctypes.c_char.from_buffer(frame))
+
+
+def join_frames(frames):
+    """ Join frames into a single bytes-like object
+
+    If the frames are adjacent slices of one writable buffer, as when a
+    large frame was received in shards, then we return a memoryview spanning
+    all of them rather than copying.
+
+    Examples
+    --------
+    >>> join_frames([b'123', b'456'])
+    b'123456'
+    >>> buf = memoryview(bytearray(b'123456'))
+    >>> join_frames([buf[:3], buf[3:]]).obj is buf.obj
+    True
+    """
+    first = frames[0]
+    if (len(frames) > 1 and type(first) is memoryview and
+            not first.readonly and
+            all(type(f) is memoryview and f.obj is first.obj
+                for f in frames)):
+        try:
+            addresses = [_address(f) for f in frames]
+        except (TypeError, ValueError):  # not contiguous, or empty
+            pass
+        else:
+            if all(a + nbytes(f) == b
+                   for a, f, b in zip(addresses, frames, addresses[1:])):
+                whole = memoryview(first.obj).cast('B')
+                start = addresses[0] - _address(whole)
+                return whole[start:start + sum(map(nbytes, frames))]
+    if PY2:
+        frames = map(ensure_bytes, frames)
+    return b''.join(frames)
+
+
 def pack_frames_prelude(frames):
     lengths = [len(f) for f in frames]
     lengths = ([struct.pack('Q', len(frames))] +
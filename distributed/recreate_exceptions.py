@@ -36,17 +36,22 @@ class ReplayExceptionScheduler(object):
         task: the definition of that key
         deps: keys that the task depends on
         """
+        from .scheduler import TemplatedTask
 
         keys = kwargs.pop('keys', [])
         for key in keys:
             if isinstance(key, list):
                 key = tuple(key)  # ensure not a list from msgpack
-            if key in self.scheduler.exceptions_blame:
-                cause = self.scheduler.exceptions_blame[key]
+            ts = self.scheduler.tasks.get(key)
+            if ts is not None and ts.exception_blame is not None:
+                cts = ts.exception_blame
+                task = cts.run_spec
+                if isinstance(task, TemplatedTask):
+                    task = task.expand()
                 # cannot serialize sets
-                return {'deps': list(self.scheduler.dependencies[cause]),
-                        'cause': cause,
-                        'task': self.scheduler.tasks[cause]}
+                return {'deps': [dts.key for dts in cts.dependencies],
+                        'cause': cts.key,
+                        'task': task}
 
 
 class ReplayExceptionClient(object):
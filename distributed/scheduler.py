@@ -1,14 +1,19 @@
 from __future__ import print_function, division, absolute_import
 
 from collections import defaultdict, deque, OrderedDict
+from collections.abc import Mapping, Set
 from datetime import timedelta
-from functools import partial
+import inspect
+from itertools import chain, repeat
 import json
 import logging
+from math import ceil
+from operator import attrgetter
 import os
 import pickle
 import random
 import six
+import sys
 
 from sortedcontainers import SortedSet
 try:
@@ -16,6 +21,10 @@ try:
 except ImportError:
     from toolz import frequencies, merge, pluck
 from toolz import memoize, valmap, first, second, concat
+try:
+    import numpy as np
+except ImportError:
+    np = None
 import asyncio
 # from tornado import gen
 # from tornado.gen import Return
@@ -25,6 +34,7 @@ from dask.core import reverse_dict
 from dask.order import order
 
 from .batched import BatchedSend
+from .columns import WorkerIndex, WorkerColumn
 from .comm import (normalize_address, resolve_address,
                    get_address_host, unparse_host_port)
 from .compatibility import finalize
@@ -33,7 +43,9 @@ from .core import (rpc, connect, Server, send_recv,
                    error_message, clean_exception, CommClosedError)
 from .metrics import time
 from .node import ServerNode
+from .ordering import merge_priorities
 from .security import Security
+from .taskstats import TaskPrefixStats
 from .utils import (All, ignoring, get_ip, get_fileno_limit, log_errors,
         key_split, validate_key)
 from .utils_comm import (scatter_to_workers, gather_from_workers)
@@ -54,6 +66,248 @@ ALLOWED_FAILURES = config.get('allowed-failures', 3)
 LOG_PDB = config.get('pdb-on-err') or os.environ.get('DASK_ERROR_PDB', False)
 DEFAULT_DATA_SIZE = config.get('default-data-size', 1000)
 
+# Expected duration of tasks of a prefix that has not finished any yet
+DEFAULT_TASK_DURATION = config.get('default-task-duration', 0.5)
+
+# Number of finished tasks after which a task counts half as much in the
+# statistics of its prefix, see taskstats.py
+TASK_STATISTICS_HALFLIFE = config.get('task-statistics-halflife', 10)
+
+# Number of tasks that update_graph transitions before yielding to the loop
+UPDATE_GRAPH_CHUNK = config.get('update-graph-chunk-size', 10000)
+
+# Candidate sets at least this large are scored together with NumPy
+BATCH_SCORE_WORKERS = config.get('batch-score-workers', 64)
+
+# Whether tasks continuing older graphs are ranked with them, see ordering.py
+MERGE_PRIORITIES = config.get('merge-priorities', True)
+
+# Workers are avoided for tasks that would take their bytes in memory past
+# this fraction of their memory limit
+MEMORY_TARGET = config.get('placement-memory-target', 0.8)
+
+# Tasks without dependencies or restrictions only go to workers processing
+# fewer than this many tasks per core, others wait in the scheduler's queue.
+# With ``inf`` all of them go to workers right away.
+WORKER_SATURATION = float(config.get('worker-saturation', 1.1))
+
+# Reports about single keys that go to clients in bulk, as the op of the bulk
+# message and the fields of the reports that it shares among its keys
+BULK_REPORTS = {
+    'key-in-memory': ('keys-in-memory', ('type',)),
+    'cancelled-key': ('cancelled-keys', ()),
+    'lost-data': ('lost-keys', ()),
+}
+
+
+# Shared by all tasks not in memory, most tasks never hold data at a given time
+_NO_WORKERS = frozenset()
+
+
+class TemplatedTask(object):
+    """ The run_spec of a task sent as part of a task template
+
+    Tasks of one template share their serialized function, and kwargs if
+    any, in *template*, and only hold their own serialized *args*.  The full
+    serialized task is built only when sending the task to a worker.
+    """
+    __slots__ = ('template', 'args')
+
+    def __init__(self, template, args):
+        self.template = template
+        self.args = args
+
+    def expand(self):
+        """ The serialized task like ``{'function': b'...', 'args': b'...'}``
+        """
+        d = dict(self.template)
+        d['args'] = self.args
+        return d
+
+    def __repr__(self):
+        return '<TemplatedTask %d bytes of args>' % len(self.args)
+
+
+class TaskState(object):
+    """
+    A simple object holding information about a task.
+
+    Every key known to the scheduler, whether it is a computation or a piece
+    of data scattered by a client, has exactly one ``TaskState`` in
+    ``Scheduler.tasks``.  Relationships between tasks are stored as direct
+    references to other ``TaskState`` objects so that transitions can walk
+    the graph without going through per-key dictionaries.
+
+    **Attributes**
+
+    * **key:** ``str``:
+        The key of this task
+    * **prefix:** ``str``:
+        The key prefix, as returned by ``key_split``, used to look up
+        ``Scheduler.task_duration``
+    * **run_spec:** ``object``:
+        A serialized task like ``{'function': b'...', 'args': b'...'}`` or
+        ``{'task': b'...'}``, a ``TemplatedTask``, or ``None`` for pure data
+    * **priority:** ``tuple``:
+        A score that determines the priority of this task
+    * **state:** ``str``:
+        One of released, waiting, no-worker, queued, processing, memory,
+        erred
+    * **dependencies:** ``{TaskState}``:
+        The tasks on which this task depends
+    * **dependents:** ``{TaskState}``:
+        The tasks which depend on this task
+    * **waiting_on:** ``{TaskState}``:
+        Dependencies that are not yet in memory while this task is waiting
+    * **waiters:** ``{TaskState}``:
+        Dependents that still need our data to run
+    * **who_wants:** ``{client}`` or ``None``:
+        The clients that want this task's result.  This is allocated lazily
+        as most tasks are only intermediate results.
+    * **who_has:** ``{worker}``:
+        The workers that hold this task's result in memory.  This is the
+        shared immutable ``_NO_WORKERS`` until the task first enters memory,
+        so assign a new set rather than adding to an empty one.
+    * **processing_on:** ``worker`` or ``None``:
+        The worker currently executing this task
+    * **nbytes:** ``int`` or ``None``:
+        The number of bytes of the result as reported by a worker
+    * **exception:** ``bytes`` or ``None``:
+        The pickled exception if this task failed
+    * **traceback:** ``bytes`` or ``None``:
+        The pickled traceback if this task failed
+    * **exception_blame:** ``TaskState`` or ``None``:
+        The task which actually failed when this task is in erred state
+    * **suspicious:** ``int``:
+        Number of times this task has been involved in a worker failure
+    * **host_restrictions:** ``{hostname}`` or ``None``
+    * **worker_restrictions:** ``{worker}`` or ``None``
+    * **resource_restrictions:** ``{str: Number}`` or ``None``
+    * **loose_restrictions:** ``bool``:
+        Whether we may violate the restrictions above if no valid worker
+        is present
+    """
+    __slots__ = ('key', 'prefix', 'run_spec', 'priority', 'state',
+                 'dependencies', 'dependents', 'waiting_on', 'waiters',
+                 'who_wants', 'who_has', 'processing_on', 'nbytes',
+                 'exception', 'traceback', 'exception_blame', 'suspicious',
+                 'host_restrictions', 'worker_restrictions',
+                 'resource_restrictions', 'loose_restrictions')
+
+    def __init__(self, key, run_spec):
+        self.key = key
+        self.prefix = sys.intern(key_split(key))
+        self.run_spec = run_spec
+        self.priority = None
+        self.state = None
+        self.dependencies = set()
+        self.dependents = set()
+        self.waiting_on = set()
+        self.waiters = set()
+        self.who_wants = None
+        self.who_has = _NO_WORKERS
+        self.processing_on = None
+        self.nbytes = None
+        self.exception = None
+        self.traceback = None
+        self.exception_blame = None
+        self.suspicious = 0
+        self.host_restrictions = None
+        self.worker_restrictions = None
+        self.resource_restrictions = None
+        self.loose_restrictions = False
+
+    def get_nbytes(self):
+        nbytes = self.nbytes
+        return nbytes if nbytes is not None else DEFAULT_DATA_SIZE
+
+    def __repr__(self):
+        return '<Task %r %s>' % (self.key, self.state)
+
+
+class _StateLegacyMapping(Mapping):
+    """
+    A read-only mapping mimicking one of the former per-key dictionaries of
+    the Scheduler, like ``task_state`` or ``who_has``.
+
+    Values are computed from ``Scheduler.tasks`` with *accessor*.  If given,
+    *predicate* decides whether a key is present in the mapping at all.
+    Lookups are constant time, iteration and ``len`` are linear.
+    """
+    def __init__(self, tasks, accessor, predicate=None):
+        self._tasks = tasks
+        self._accessor = accessor
+        self._predicate = predicate
+
+    def __getitem__(self, key):
+        ts = self._tasks[key]
+        if self._predicate is not None and not self._predicate(ts):
+            raise KeyError(key)
+        return self._accessor(ts)
+
+    def __contains__(self, key):
+        ts = self._tasks.get(key)
+        return ts is not None and (self._predicate is None or
+                                   self._predicate(ts))
+
+    def __iter__(self):
+        if self._predicate is None:
+            return iter(self._tasks)
+        predicate = self._predicate
+        return (key for key, ts in self._tasks.items() if predicate(ts))
+
+    def __len__(self):
+        if self._predicate is None:
+            return len(self._tasks)
+        return sum(map(bool, map(self._predicate, self._tasks.values())))
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, dict(self))
+
+
+class _StateLegacySet(Set):
+    """
+    A read-only set of keys mimicking one of the former per-key sets of the
+    Scheduler, like ``released``.  See ``_StateLegacyMapping``.
+    """
+    def __init__(self, tasks, predicate):
+        self._tasks = tasks
+        self._predicate = predicate
+
+    def __contains__(self, key):
+        ts = self._tasks.get(key)
+        return ts is not None and bool(self._predicate(ts))
+
+    def __iter__(self):
+        predicate = self._predicate
+        return (key for key, ts in self._tasks.items() if predicate(ts))
+
+    def __len__(self):
+        return sum(map(bool, map(self._predicate, self._tasks.values())))
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, set(self))
+
+
+def _task_keys(tasks):
+    """ Transform a collection of TaskStates into a set of keys """
+    return {ts.key for ts in tasks}
+
+
+# States in which a task tracks the dependents that still need its data
+_WAITING_DATA_STATES = ('waiting', 'processing', 'memory', 'no-worker',
+                        'queued')
+
+
+def _is_not_none(attr):
+    getter = attrgetter(attr)
+    return lambda ts: getter(ts) is not None
+
+
+def _priority_key(ts):
+    """ Sort tasks by priority, those without one first, as in the queue """
+    return ts.priority or ()
+
 
 class Scheduler(ServerNode):
     """ Dynamic distributed task scheduler
@@ -93,51 +347,35 @@ class Scheduler(ServerNode):
     The scheduler contains the following state variables.  Each variable is
     listed along with what it stores and a brief description.
 
-    * **tasks:** ``{key: task}``:
-        Dictionary mapping key to a serialized task like the following:
-        ``{'function': b'...', 'args': b'...'}`` or ``{'task': b'...'}``
-    * **dependencies:** ``{key: {keys}}``:
-        Dictionary showing which keys depend on which others
-    * **dependents:** ``{key: {keys}}``:
-        Dictionary showing which keys are dependent on which others
-    * **task_state:** ``{key: string}``:
-        Dictionary listing the current state of every task among the following:
-        released, waiting, queue, no-worker, processing, memory, erred
-    * **priority:** ``{key: tuple}``:
-        A score per key that determines its priority
-    * **waiting:** ``{key: {key}}``:
-        Dictionary like dependencies but excludes keys already computed
-    * **waiting_data:** ``{key: {key}}``:
-        Dictionary like dependents but excludes keys already computed
+    * **tasks:** ``{key: TaskState}``:
+        Dictionary mapping every known key to its ``TaskState``, which holds
+        the serialized task, its state, priority, dependencies, dependents,
+        restrictions, location in memory and errors.  See ``TaskState``.
     * **ready:** ``deque(key)``
         Keys that are ready to run, but not yet assigned to a worker
     * **processing:** ``{worker: {key: cost}}``:
-        Set of keys currently in execution on each worker and their expected
-        duration
-    * **rprocessing:** ``{key: worker}``:
-        The worker currently executing a particular task
-    * **who_has:** ``{key: {worker}}``:
-        Where each key lives.  The current state of distributed memory.
+        Set of keys currently in execution on each worker and the expected
+        time to move their dependencies there.  Their expected compute time
+        is that of their prefix in ``task_duration``, see
+        ``get_processing_cost``
+    * **processing_counts:** ``{key-prefix: {worker: int}}``:
+        Number of tasks of each prefix processing on each worker, other than
+        long-running tasks.  Lets us update ``occupancy`` when the duration
+        of a prefix changes without visiting its tasks
+    * **long_running:** ``{key}``:
+        Processing tasks that have seceded from their worker's thread pool,
+        and so don't count towards its occupancy
     * **has_what:** ``{worker: {key}}``:
-        What worker has what keys.  The transpose of who_has.
-    * **released:** ``{keys}``
-        Set of keys that are known, but released from memory
-    * **unrunnable:** ``{key}``
-        Keys that we are unable to run
-    * **host_restrictions:** ``{key: {hostnames}}``:
-        A set of hostnames per key of where that key can be run.  Usually this
-        is empty unless a key has been specifically restricted to only run on
-        certain hosts.
-    * **worker_restrictions:** ``{key: {workers}}``:
-        Like host_restrictions except that these include specific host:port
-        worker names
-    * **loose_restrictions:** ``{key}``:
-        Set of keys for which we are allow to violate restrictions (see above)
-        if not valid workers are present.
-    * **resource_restrictions:** ``{key: {str: Number}}``:
-        Resources required by a task, such as ``{'GPU': 1}`` or
-        ``{'memory': 1e9}``.  These names must match resources specified when
-        creating workers.
+        What worker has what keys.  The transpose of ``TaskState.who_has``.
+    * **unrunnable:** ``{TaskState}``
+        Tasks that we are unable to run
+    * **queued:** ``SortedSet[TaskState]``
+        Tasks without dependencies or restrictions that wait, in order of
+        priority, for a worker to process fewer than ``WORKER_SATURATION``
+        tasks per core
+    * **queued_counts:** ``{key-prefix: int}``
+        Number of queued tasks of each prefix, from which ``queued_occupancy``
+        follows without visiting them
     * **worker_resources:** ``{worker: {str: Number}}``:
         The available resources on each worker like ``{'gpu': 2, 'mem': 1e9}``.
         These are abstract quantities that constrain certain tasks from running
@@ -145,26 +383,17 @@ class Scheduler(ServerNode):
     * **used_resources:** ``{worker: {str: Number}}``:
         The sum of each resource used by all tasks allocated to a particular
         worker.
-    * **exceptions:** ``{key: Exception}``:
-        A dict mapping keys to remote exceptions
-    * **tracebacks:** ``{key: list}``:
-        A dict mapping keys to remote tracebacks stored as a list of strings
-    * **exceptions_blame:** ``{key: key}``:
-        A dict mapping a key to another key on which it depends that has failed
-    * **suspicious_tasks:** ``{key: int}``
-        Number of times a task has been involved in a worker failure
     * **deleted_keys:** ``{key: {workers}}``
         Locations of workers that have keys that should be deleted
     * **wants_what:** ``{client: {key}}``:
-        What keys are wanted by each client..  The transpose of who_wants.
-    * **who_wants:** ``{key: {client}}``:
-        Which clients want each key.  The active targets of computation.
-    * **nbytes:** ``{key: int}``:
-        Number of bytes for a key as reported by workers holding that key.
+        What keys are wanted by each client.  The transpose of
+        ``TaskState.who_wants``.
     * **ncores:** ``{worker: int}``:
         Number of cores owned by each worker
     * **idle:** ``{worker}``:
-        Set of workers that are not fully utilized
+        Set of workers that are not fully utilized, ordered by the time
+        that they need to get through their current work (occupancy per
+        core), least busy first
     * **worker_info:** ``{worker: {str: data}}``:
         Information about each worker
     * **host_info:** ``{hostname: dict}``:
@@ -173,6 +402,19 @@ class Scheduler(ServerNode):
         Number of bytes in memory on each worker
     * **occupancy:** ``{worker: time}``
         Expected runtime for all tasks currently processing on a worker
+    * **memory_limit:** ``{worker: int}``:
+        Number of bytes each worker may hold in memory, or zero if unknown
+    * **peak_bytes:** ``{worker: int}``:
+        Largest number of bytes each worker has held in memory, the peak of
+        ``worker_bytes``
+    * **processing_bytes:** ``{worker: int}``:
+        Number of bytes we expect the results of the tasks processing on each
+        worker to take, from ``task_nbytes``
+    * **worker_index:** ``WorkerIndex``:
+        Rows of workers in ``ncores``, ``occupancy``, ``worker_bytes``,
+        ``memory_limit``, ``peak_bytes`` and ``processing_bytes``, which
+        store their values by column and keep their totals up to date, see
+        ``distributed.columns``
 
     * **services:** ``{str: port}``:
         Other services running on this scheduler, like HTTP
@@ -183,8 +425,20 @@ class Scheduler(ServerNode):
         report results
     * **task_duration:** ``{key-prefix: time}``
         Time we expect certain functions to take, e.g. ``{'sum': 0.25}``
+    * **task_nbytes:** ``{key-prefix: int}``
+        Number of bytes we expect the results of certain functions to take,
+        e.g. ``{'read_csv': 64000000}``
+    * **task_prefix_stats:** ``{key-prefix: TaskPrefixStats}``
+        Decayed statistics of the durations, result sizes and failures of
+        finished tasks, from which ``task_duration`` and ``task_nbytes``
+        take their means
     * **coroutines:** ``[Futures]``:
         A list of active futures that control operation
+
+    The former per-key dictionaries like ``task_state``, ``who_has``,
+    ``dependencies`` or ``nbytes`` remain available as read-only views onto
+    ``tasks`` for diagnostics and extensions.  They should not be used in
+    performance-sensitive code.
     """
     default_port = 8786
 
@@ -223,69 +477,99 @@ class Scheduler(ServerNode):
 
         # Task state
         self.tasks = dict()
-        self.task_state = dict()
-        self.dependencies = dict()
-        self.dependents = dict()
         self.generation = 0
-        self.released = set()
-        self.priority = dict()
-        self.nbytes = dict()
-        self.worker_bytes = dict()
-        self.processing = dict()
-        self.rprocessing = dict()
         self.task_duration = {prefix: 0.00001 for prefix in fast_tasks}
-        self.unknown_durations = defaultdict(set)
-        self.host_restrictions = dict()
-        self.worker_restrictions = dict()
-        self.resource_restrictions = dict()
-        self.loose_restrictions = set()
-        self.suspicious_tasks = defaultdict(lambda: 0)
-        self.waiting = dict()
-        self.waiting_data = dict()
+        self.task_nbytes = dict()
+        self.task_prefix_stats = dict()
+        self.long_running = set()
         self.ready = deque()
         self.unrunnable = set()
-        self.idle = set()
-        self.who_has = dict()
-        self.has_what = dict()
-        self.who_wants = defaultdict(set)
+        self.queued = SortedSet(key=_priority_key)
+        self.queued_counts = dict()
         self.wants_what = defaultdict(set)
-        self.exceptions = dict()
-        self.tracebacks = dict()
-        self.exceptions_blame = dict()
         self.datasets = dict()
         self.n_tasks = 0
 
-        self.idle = SortedSet()
+        self._idle_key = dict()
+        self.idle = SortedSet(key=self._idle_key.__getitem__)
         self.saturated = set()
-
-        self._task_collections = [self.tasks, self.dependencies,
-                self.dependents, self.waiting, self.waiting_data,
-                self.released, self.priority, self.nbytes,
-                self.host_restrictions, self.worker_restrictions,
-                self.loose_restrictions, self.ready, self.who_wants,
-                self.wants_what, self.unknown_durations, self.rprocessing,
-                self.resource_restrictions]
+        self.open_workers = set()
+
+        self._task_collections = [self.tasks, self.ready, self.unrunnable,
+                                  self.queued, self.queued_counts,
+                                  self.wants_what, self.long_running]
+
+        # Read-only views mimicking the former per-key dictionaries
+        tasks = self.tasks
+        self.task_state = _StateLegacyMapping(tasks, attrgetter('state'))
+        self.dependencies = _StateLegacyMapping(tasks,
+                lambda ts: _task_keys(ts.dependencies))
+        self.dependents = _StateLegacyMapping(tasks,
+                lambda ts: _task_keys(ts.dependents))
+        self.priority = _StateLegacyMapping(tasks, attrgetter('priority'),
+                _is_not_none('priority'))
+        self.nbytes = _StateLegacyMapping(tasks, attrgetter('nbytes'),
+                _is_not_none('nbytes'))
+        self.who_has = _StateLegacyMapping(tasks, attrgetter('who_has'),
+                attrgetter('who_has'))
+        self.who_wants = _StateLegacyMapping(tasks, attrgetter('who_wants'),
+                attrgetter('who_wants'))
+        self.rprocessing = _StateLegacyMapping(tasks,
+                attrgetter('processing_on'), _is_not_none('processing_on'))
+        self.waiting = _StateLegacyMapping(tasks,
+                lambda ts: _task_keys(ts.waiting_on),
+                lambda ts: ts.state == 'waiting')
+        self.waiting_data = _StateLegacyMapping(tasks,
+                lambda ts: _task_keys(ts.waiters),
+                lambda ts: ts.state in _WAITING_DATA_STATES)
+        self.released = _StateLegacySet(tasks,
+                lambda ts: ts.state == 'released')
+        self.exceptions = _StateLegacyMapping(tasks, attrgetter('exception'),
+                _is_not_none('exception'))
+        self.tracebacks = _StateLegacyMapping(tasks, attrgetter('traceback'),
+                _is_not_none('traceback'))
+        self.exceptions_blame = _StateLegacyMapping(tasks,
+                lambda ts: ts.exception_blame.key,
+                _is_not_none('exception_blame'))
+        self.suspicious_tasks = _StateLegacyMapping(tasks,
+                attrgetter('suspicious'), attrgetter('suspicious'))
+        self.host_restrictions = _StateLegacyMapping(tasks,
+                attrgetter('host_restrictions'),
+                _is_not_none('host_restrictions'))
+        self.worker_restrictions = _StateLegacyMapping(tasks,
+                attrgetter('worker_restrictions'),
+                _is_not_none('worker_restrictions'))
+        self.resource_restrictions = _StateLegacyMapping(tasks,
+                attrgetter('resource_restrictions'),
+                _is_not_none('resource_restrictions'))
+        self.loose_restrictions = _StateLegacySet(tasks,
+                attrgetter('loose_restrictions'))
 
         # Worker state
-        self.ncores = dict()
+        self.worker_index = WorkerIndex()
+        self.ncores = WorkerColumn(self.worker_index, 'q')
         self.workers = SortedSet()
-        self.total_ncores = 0
-        self.total_occupancy = 0
         self.worker_info = dict()
         self.host_info = defaultdict(dict)
         self.worker_resources = dict()
         self.used_resources = dict()
         self.resources = defaultdict(dict)
         self.aliases = dict()
-        self.occupancy = dict()
+        self.occupancy = WorkerColumn(self.worker_index)
+        self.worker_bytes = WorkerColumn(self.worker_index)
+        self.memory_limit = WorkerColumn(self.worker_index)
+        self.peak_bytes = WorkerColumn(self.worker_index)
+        self.processing_bytes = WorkerColumn(self.worker_index)
+        self.processing = dict()
+        self.processing_counts = defaultdict(dict)
+        self.has_what = dict()
 
         self._worker_collections = [self.ncores, self.workers,
                 self.worker_info, self.host_info, self.worker_resources,
-                self.worker_restrictions, self.host_restrictions,
-                self.resource_restrictions,
                 self.used_resources, self.resources, self.aliases,
-                self.occupancy, self.idle, self.saturated, self.processing,
-                self.rprocessing, self.has_what, self.who_has]
+                self.occupancy, self.idle, self._idle_key, self.saturated,
+                self.open_workers, self.processing, self.processing_counts, self.has_what,
+                self.worker_bytes]
 
         self.extensions = {}
         self.plugins = []
@@ -329,7 +613,8 @@ class Scheduler(ServerNode):
                          'run_function': self.run_function,
                          'update_data': self.update_data,
                          'set_resources': self.add_resources,
-                         'retire_workers': self.retire_workers}
+                         'retire_workers': self.retire_workers,
+                         'task_prefixes': self.get_task_prefixes}
 
         self._transitions = {
                  ('released', 'waiting'): self.transition_released_waiting,
@@ -341,6 +626,8 @@ class Scheduler(ServerNode):
                  ('processing', 'erred'): self.transition_processing_erred,
                  ('no-worker', 'released'): self.transition_no_worker_released,
                  ('no-worker', 'waiting'): self.transition_no_worker_waiting,
+                 ('queued', 'released'): self.transition_queued_released,
+                 ('queued', 'processing'): self.transition_queued_processing,
                  ('released', 'forgotten'): self.transition_released_forgotten,
                  ('memory', 'forgotten'): self.transition_memory_forgotten,
                  ('erred', 'forgotten'): self.transition_released_forgotten,
@@ -369,13 +656,23 @@ class Scheduler(ServerNode):
 
     __repr__ = __str__
 
+    @property
+    def total_occupancy(self):
+        return self.occupancy.total
+
+    @property
+    def total_ncores(self):
+        return self.ncores.total
+
     def identity(self, comm=None):
         """ Basic information about ourselves and our cluster """
         d = {'type': type(self).__name__,
              'id': str(self.id),
              'address': self.address,
              'services': {key: v.port for (key, v) in self.services.items()},
-             'workers': dict(self.worker_info)}
+             'workers': dict(self.worker_info),
+             'peak_bytes': dict(self.peak_bytes),
+             'task_prefixes': self.get_task_prefixes()}
         return d
 
     def get_worker_service_addr(self, worker, service_name):
@@ -458,8 +755,6 @@ class Scheduler(ServerNode):
 
             finalize(self, del_scheduler_file)
 
-        self.loop.add_callback(self.reevaluate_occupancy)
-
         return self.finished()
 
     async def finished(self):
@@ -540,7 +835,7 @@ class Scheduler(ServerNode):
 
     def add_worker(self, comm=None, address=None, keys=(), ncores=None,
                    name=None, resolve_address=True, nbytes=None, now=None,
-                   resources=None, host_info=None, **info):
+                   resources=None, host_info=None, links=None, **info):
         """ Add a new worker to the cluster """
         with log_errors():
             local_now = time()
@@ -571,6 +866,8 @@ class Scheduler(ServerNode):
             if resources:
                 self.add_resources(worker=address, resources=resources)
                 self.worker_info[address]['resources'] = resources
+            if links and 'stealing' in self.extensions:
+                self.extensions['stealing'].update_links(address, links)
 
             if address in self.workers:
                 self.log_event(address, merge({'action': 'heartbeat'}, info))
@@ -587,8 +884,8 @@ class Scheduler(ServerNode):
             self.host_info[host]['cores'] += ncores
 
             self.ncores[address] = ncores
+            self.memory_limit[address] = info.get('memory_limit') or 0
             self.workers.add(address)
-            self.total_ncores += ncores
             self.aliases[name] = address
             self.worker_info[address]['name'] = name
             self.worker_info[address]['host'] = host
@@ -598,7 +895,6 @@ class Scheduler(ServerNode):
                 self.worker_bytes[address] = 0
                 self.processing[address] = dict()
                 self.occupancy[address] = 0
-                self.check_idle_saturated(address)
 
             # for key in keys:  # TODO
             #     self.mark_key_in_memory(key, [address])
@@ -606,8 +902,7 @@ class Scheduler(ServerNode):
             self.worker_comms[address] = BatchedSend(interval=5, loop=self.loop)
             self._worker_coroutines.append(self.handle_worker(address))
 
-            if self.ncores[address] > len(self.processing[address]):
-                self.idle.add(address)
+            self.check_idle_saturated(address)
 
             for plugin in self.plugins[:]:
                 try:
@@ -617,17 +912,18 @@ class Scheduler(ServerNode):
 
             if nbytes:
                 for key in nbytes:
-                    state = self.task_state.get(key)
-                    if state in ('processing', 'waiting'):
+                    ts = self.tasks.get(key)
+                    if ts is not None and ts.state in ('processing', 'waiting'):
                         recommendations = self.transition(key, 'memory',
                                 worker=address, nbytes=nbytes[key])
                         self.transitions(recommendations)
 
             recommendations = {}
-            for key in list(self.unrunnable):
-                valid = self.valid_workers(key)
+            for ts in list(self.unrunnable):
+                valid = self.valid_workers(ts)
                 if valid is True or address in valid or name in valid:
-                    recommendations[key] = 'waiting'
+                    recommendations[ts.key] = 'waiting'
+            self._recommend_queued(address, recommendations)
 
             if recommendations:
                 self.transitions(recommendations)
@@ -638,116 +934,242 @@ class Scheduler(ServerNode):
             logger.info("Register %s", str(address))
             return 'OK'
 
+    def new_task(self, key, spec, state):
+        """ Create a new task, and associated states """
+        ts = TaskState(key, spec)
+        ts.state = state
+        self.tasks[key] = ts
+        return ts
+
     def update_graph(self, client=None, tasks=None, keys=None,
                      dependencies=None, restrictions=None, priority=None,
                      loose_restrictions=None, resources=None,
-                     submitting_task=None):
+                     submitting_task=None, templates=None):
         """
         Add new computations to the internal dask graph
 
         This happens whenever the Client calls submit, map, get, or compute.
+
+        Tasks that share their function may come as *templates* rather than
+        in *tasks*, each a dict with the shared ``'function'`` and
+        ``'kwargs'``, if any, and the ``'keys'`` and ``'args'`` of its tasks.
+        Their tasks keep a reference to the shared part, see
+        ``TemplatedTask``.
+
+        Graphs of more than ``UPDATE_GRAPH_CHUNK`` tasks are taken in a chunk
+        at a time, giving control back to the event loop between chunks so
+        that workers and other clients are still served.  In that case this
+        returns a future that completes once the whole graph is in.
+        """
+        if templates:
+            tasks = tasks or {}
+            for template in templates:
+                keys_, args = template.pop('keys'), template.pop('args')
+                for key, a in zip(keys_, args):
+                    tasks[key] = TemplatedTask(template, a)
+
+        steps = self._update_graph(client, tasks, keys, dependencies,
+                                   restrictions, priority, loose_restrictions,
+                                   resources, submitting_task)
+        if len(tasks) <= UPDATE_GRAPH_CHUNK:
+            for _ in steps:
+                pass
+        else:
+            return asyncio.ensure_future(self._run_in_chunks(steps))
+
+    async def _run_in_chunks(self, steps):
+        """ Drive the generator *steps*, yielding to the loop between steps """
+        with log_errors():
+            for _ in steps:
+                await asyncio.sleep(0)
+
+    def _update_graph(self, client, tasks, keys, dependencies, restrictions,
+                      priority, loose_restrictions, resources,
+                      submitting_task):
+        """ See update_graph
+
+        This is a generator that yields between chunks of work.  New tasks are
+        built and linked to each other out of sight of the rest of the
+        scheduler and only join ``self.tasks`` once all of them are built.  If
+        the tasks that they depend on changed in the meantime then we validate
+        and build the graph again, without yielding this time.
         """
         start = time()
         keys = set(keys)
-        self.client_desires_keys(keys=keys, client=client)
         if len(tasks) > 1:
             self.log_event(['all', client], {'action': 'update_graph',
                                              'count': len(tasks)})
 
-        for k in list(tasks):
-            if tasks[k] is k:
-                del tasks[k]
-            if k in self.tasks:
-                del tasks[k]
-
-        n = 0
-        while len(tasks) != n:  # walk thorough new tasks, cancel any bad deps
-            n = len(tasks)
-            for k, deps in list(dependencies.items()):
-                if any(dep not in self.dependencies and dep not in tasks
-                        for dep in deps):  # bad key
-                    logger.info('User asked for computation on lost data, %s', k)
-                    del tasks[k]
-                    del dependencies[k]
-                    if k in keys:
-                        keys.remove(k)
-                    self.report({'op': 'cancelled-key', 'key': k})
-                    self.client_releases_keys(keys=[k], client=client)
-
-        stack = list(keys)
-        touched = set()
-        while stack:
-            k = stack.pop()
-            if k in self.dependencies:
-                continue
-            touched.add(k)
-            if k not in self.tasks and k in tasks:
-                self.tasks[k] = tasks[k]
-                self.dependencies[k] = set(dependencies.get(k, ()))
-                self.released.add(k)
-                self.task_state[k] = 'released'
-                for dep in self.dependencies[k]:
-                    if dep not in self.dependents:
-                        self.dependents[dep] = set()
-                    self.dependents[dep].add(k)
-                if k not in self.dependents:
-                    self.dependents[k] = set()
-
-            stack.extend(self.dependencies[k])
-
-        recommendations = OrderedDict()
-
-        new_priority = priority or order(tasks)  # TODO: define order wrt old graph
         if submitting_task:  # sub-tasks get better priority than parent tasks
             try:
-                generation = self.priority[submitting_task][0] - 0.01
-            except KeyError:  # super-task already cleaned up
+                generation = self.tasks[submitting_task].priority[0] - 0.01
+            except (KeyError, TypeError):  # super-task already cleaned up
                 generation = self.generation
         else:
             self.generation += 1  # older graph generations take precedence
             generation = self.generation
-        for key in set(new_priority) & touched:
-            if key not in self.priority:
-                self.priority[key] = (generation, new_priority[key]) # prefer old
+
+        pause = len(tasks) > UPDATE_GRAPH_CHUNK
+        while True:
+            self._drop_known_and_lost(client, tasks, keys, dependencies)
+            validated = time()
+
+            if priority is None:
+                priority = order(tasks, {k: {dep for dep in deps
+                                             if dep in tasks}
+                                         for k, deps in dependencies.items()
+                                         if k in tasks})
+            ordered = time()
+
+            touched = {}  # key: TaskState, for tasks new to the scheduler
+            new = {}  # and placeholders created earlier for clients
+            placeholders = []
+            stack = list(keys)
+            while stack:
+                k = stack.pop()
+                if k in touched or k not in tasks:
+                    continue
+                ts = self.tasks.get(k)
+                if ts is None:
+                    ts = TaskState(k, tasks[k])
+                    ts.state = 'released'
+                    if k in priority:
+                        ts.priority = (generation, priority[k])
+                    new[k] = ts
+                elif ts.run_spec is None and ts.state == 'released':
+                    placeholders.append(ts)  # filled in once all are built
+                else:
+                    continue
+                touched[k] = ts
+                stack.extend(dependencies.get(k, ()))
+                if pause and len(touched) % UPDATE_GRAPH_CHUNK == 0:
+                    yield
+
+            # Link new tasks to each other now, and to other tasks once all
+            # are built
+            external = []
+            changed = False
+            for i, ts in enumerate(touched.values()):
+                for dep in dependencies.get(ts.key, ()):
+                    dts = new.get(dep)
+                    if dts is not None and ts.key in new:
+                        ts.dependencies.add(dts)
+                        dts.dependents.add(ts)
+                        continue
+                    dts = touched.get(dep) or self.tasks.get(dep)
+                    if dts is None:  # lost since we validated
+                        changed = True
+                    external.append((ts, dts))
+                if pause and (i + 1) % UPDATE_GRAPH_CHUNK == 0:
+                    yield
+
+            if not pause:
+                break
+            if not (changed or
+                    not self.tasks.keys().isdisjoint(new) or
+                    any(self.tasks.get(ts.key) is not ts or
+                        ts.run_spec is not None or ts.state != 'released'
+                        for ts in placeholders) or
+                    any(new.get(dts.key) is not dts and
+                        self.tasks.get(dts.key) is not dts
+                        for ts, dts in external)):
+                break
+            pause = False
+        built = time()
+
+        self.tasks.update(new)
+        for ts in placeholders:
+            ts.run_spec = tasks[ts.key]
+            if ts.key in priority:
+                ts.priority = (generation, priority[ts.key])
+        for ts, dts in external:
+            ts.dependencies.add(dts)
+            dts.dependents.add(ts)
+        if MERGE_PRIORITIES and external:
+            merged = merge_priorities(touched, generation,
+                                      self.get_task_duration)
+            for ts, p in merged.items():
+                ts.priority = p
+
+        self.client_desires_keys(keys=keys, client=client)
 
         if restrictions:
             # *restrictions* is a dict keying task ids to lists of
             # restriction specifications (either worker names or addresses)
-            worker_restrictions = defaultdict(set)
-            host_restrictions = defaultdict(set)
             for k, v in restrictions.items():
                 if v is None:
                     continue
+                ts = self.tasks.get(k)
+                if ts is None:
+                    continue
+                worker_restrictions = set()
+                host_restrictions = set()
                 for w in v:
                     try:
                         w = self.coerce_address(w)
                     except ValueError:
                         # Not a valid address, but perhaps it's a hostname
-                        host_restrictions[k].add(w)
+                        host_restrictions.add(w)
                     else:
-                        worker_restrictions[k].add(w)
-
-            self.worker_restrictions.update(worker_restrictions)
-            self.host_restrictions.update(host_restrictions)
+                        worker_restrictions.add(w)
+                if worker_restrictions:
+                    ts.worker_restrictions = worker_restrictions
+                if host_restrictions:
+                    ts.host_restrictions = host_restrictions
 
             if loose_restrictions:
-                self.loose_restrictions |= set(loose_restrictions)
+                for k in loose_restrictions:
+                    ts = self.tasks.get(k)
+                    if ts is not None:
+                        ts.loose_restrictions = True
 
         if resources:
-            self.resource_restrictions.update(resources)
+            for k, v in resources.items():
+                ts = self.tasks.get(k)
+                if ts is not None:
+                    ts.resource_restrictions = v
 
-        for key in sorted(touched | keys, key=self.priority.get):
-            if self.task_state[key] == 'released':
-                recommendations[key] = 'waiting'
+        existing = [self.tasks[k] for k in keys
+                    if k not in touched and k in self.tasks]
 
-        for key in touched | keys:
-            for dep in self.dependencies[key]:
-                if dep in self.exceptions_blame:
-                    self.exceptions_blame[key] = self.exceptions_blame[dep]
-                    recommendations[key] = 'erred'
+        # Transitions pop recommendations from the end, so that tasks of
+        # higher priority come last here to be the first to take free slots
+        recommendations = OrderedDict()
+        for ts in sorted(chain(touched.values(), existing),
+                         key=_priority_key, reverse=True):
+            if ts.state == 'released' and ts.run_spec is not None:
+                recommendations[ts.key] = 'waiting'
+
+        # Only tasks that were already known can carry blame
+        for ts in chain({ts for ts, dts in external}, existing):
+            for dts in ts.dependencies:
+                if dts.exception_blame is not None:
+                    ts.exception_blame = dts.exception_blame
+                    recommendations[ts.key] = 'erred'
                     break
+        committed = time()
 
-        self.transitions(recommendations)
+        if self.digests is not None:
+            self.digests['update-graph-validate-duration'].add(
+                    validated - start)
+            self.digests['update-graph-order-duration'].add(ordered - validated)
+            self.digests['update-graph-build-duration'].add(built - ordered)
+            self.digests['update-graph-commit-duration'].add(committed - built)
+
+        if pause and len(recommendations) > UPDATE_GRAPH_CHUNK:
+            items = list(recommendations.items())
+            for i in range(0, len(items), UPDATE_GRAPH_CHUNK):
+                if i:
+                    yield
+                # Other messages may have moved or released these meanwhile
+                chunk = OrderedDict()
+                for key, finish in items[i:i + UPDATE_GRAPH_CHUNK]:
+                    ts = self.tasks.get(key)
+                    if ts is not None and ts.state == 'released':
+                        chunk[key] = finish
+                self.transitions(chunk)
+        else:
+            self.transitions(recommendations)
 
         for plugin in self.plugins[:]:
             try:
@@ -759,38 +1181,75 @@ class Scheduler(ServerNode):
                 logger.exception(e)
 
         for key in keys:
-            if self.task_state[key] in ('memory', 'erred'):
+            ts = self.tasks.get(key)
+            if ts is not None and ts.state in ('memory', 'erred'):
                 self.report_on_key(key, client=client)
 
         end = time()
         if self.digests is not None:
+            self.digests['update-graph-transitions-duration'].add(
+                    end - committed)
             self.digests['update-graph-duration'].add(end - start)
 
         # TODO: balance workers
 
+    def _drop_known_and_lost(self, client, tasks, keys, dependencies):
+        """ Remove tasks that we already know or that can no longer run
+
+        Tasks depending on data that is lost are cancelled, along with all of
+        their dependents, in a single pass over the graph.
+        """
+        for k in list(tasks):
+            if tasks[k] is k:
+                del tasks[k]
+            elif k in self.tasks and self.tasks[k].run_spec is not None:
+                del tasks[k]
+
+        lost = []
+        for k, deps in dependencies.items():
+            for dep in deps:
+                if dep not in tasks and dep not in self.tasks:
+                    lost.append(k)
+                    break
+        if not lost:
+            return
+
+        dependents = defaultdict(list)
+        for k, deps in dependencies.items():
+            for dep in deps:
+                dependents[dep].append(k)
+        while lost:
+            k = lost.pop()
+            if k not in dependencies:
+                continue
+            logger.info('User asked for computation on lost data, %s', k)
+            tasks.pop(k, None)
+            del dependencies[k]
+            keys.discard(k)
+            self.report({'op': 'cancelled-key', 'key': k})
+            self.client_releases_keys(keys=[k], client=client)
+            if k not in self.tasks:
+                lost.extend(dependents.pop(k, ()))
+
     def stimulus_task_finished(self, key=None, worker=None, **kwargs):
         """ Mark that a task has finished execution on a particular worker """
         logger.debug("Stimulus task finished %s, %s", key, worker)
-        if key not in self.task_state:
+        ts = self.tasks.get(key)
+        if ts is None:
             return {}
 
-        if self.task_state[key] == 'processing':
+        if ts.state == 'processing':
             recommendations = self.transition(key, 'memory', worker=worker,
                                               **kwargs)
-
-            if self.task_state.get(key) == 'memory':
-                if key not in self.has_what[worker]:
-                    self.worker_bytes[worker] += self.nbytes.get(key,
-                                                                 DEFAULT_DATA_SIZE)
-                self.who_has[key].add(worker)
-                self.has_what[worker].add(key)
         else:
             logger.debug("Received already computed task, worker: %s, state: %s"
                          ", key: %s, who_has: %s",
-                         worker, self.task_state.get(key), key,
-                         self.who_has.get(key))
-            if worker not in self.who_has.get(key, ()):
+                         worker, ts.state, key, ts.who_has)
+            if worker not in ts.who_has:
                 self.worker_comms[worker].send({'op': 'release-task', 'key': key})
+                if 'stealing' in self.extensions:
+                    self.extensions['stealing'].add_wasted_compute(
+                            key, worker, kwargs.get('startstops'))
             recommendations = {}
 
         return recommendations
@@ -800,10 +1259,11 @@ class Scheduler(ServerNode):
         """ Mark that a task has erred on a particular worker """
         logger.debug("Stimulus task erred %s, %s", key, worker)
 
-        if key not in self.task_state:
+        ts = self.tasks.get(key)
+        if ts is None:
             return {}
 
-        if self.task_state[key] == 'processing':
+        if ts.state == 'processing':
             recommendations = self.transition(key, 'erred', cause=key,
                     exception=exception, traceback=traceback, worker=worker,
                     **kwargs)
@@ -817,17 +1277,19 @@ class Scheduler(ServerNode):
         """ Mark that certain keys have gone missing.  Recover. """
         with log_errors():
             logger.debug("Stimulus missing data %s, %s", key, worker)
-            if key and self.task_state.get(key) in (None, 'memory'):
-                return {}
+            if key:
+                ts = self.tasks.get(key)
+                if ts is None or ts.state == 'memory':
+                    return {}
 
             recommendations = OrderedDict()
 
-            if self.task_state.get(cause) == 'memory':  # couldn't find this
-                for w in set(self.who_has[cause]):  # TODO: this behavior is extreme
+            cts = self.tasks.get(cause)
+            if cts is not None and cts.state == 'memory':  # couldn't find this
+                for w in cts.who_has:  # TODO: this behavior is extreme
                     self.has_what[w].remove(cause)
-                    self.who_has[cause].remove(w)
-                    self.worker_bytes[w] -= self.nbytes.get(cause,
-                                                    DEFAULT_DATA_SIZE)
+                    self.worker_bytes[w] -= cts.get_nbytes()
+                cts.who_has = _NO_WORKERS
                 recommendations[cause] = 'released'
 
             if key:
@@ -836,7 +1298,7 @@ class Scheduler(ServerNode):
             self.transitions(recommendations)
 
             if self.validate:
-                assert cause not in self.who_has
+                assert cts is None or not cts.who_has
 
             return {}
 
@@ -866,29 +1328,32 @@ class Scheduler(ServerNode):
 
             self.host_info[host]['cores'] -= self.ncores[address]
             self.host_info[host]['addresses'].remove(address)
-            self.total_ncores -= self.ncores[address]
 
             if not self.host_info[host]['addresses']:
                 del self.host_info[host]
 
             del self.worker_comms[address]
-            del self.ncores[address]
             self.workers.remove(address)
             del self.aliases[self.worker_info[address]['name']]
             del self.worker_info[address]
             if address in self.idle:
                 self.idle.remove(address)
+                del self._idle_key[address]
             if address in self.saturated:
                 self.saturated.remove(address)
+            self.open_workers.discard(address)
 
             recommendations = OrderedDict()
 
-            in_flight = set(self.processing.pop(address))
+            in_flight = set(self.processing[address])
+            for k in in_flight:
+                self.release_occupancy(self.tasks[k], address)
+            del self.processing[address]
             for k in list(in_flight):
-                # del self.rprocessing[k]
+                ts = self.tasks[k]
                 if not safe:
-                    self.suspicious_tasks[k] += 1
-                if not safe and self.suspicious_tasks[k] > self.allowed_failures:
+                    ts.suspicious += 1
+                if not safe and ts.suspicious > self.allowed_failures:
                     e = pickle.dumps(KilledWorker(k, address))
                     r = self.transition(k, 'erred', exception=e, cause=k)
                     recommendations.update(r)
@@ -896,14 +1361,14 @@ class Scheduler(ServerNode):
                 else:
                     recommendations[k] = 'released'
 
-            self.total_occupancy -= self.occupancy.pop(address)
-            del self.worker_bytes[address]
+            self.worker_index.remove(address)
             self.remove_resources(address)
 
             for key in self.has_what.pop(address):
-                self.who_has[key].remove(address)
-                if not self.who_has[key]:
-                    if key in self.tasks:
+                ts = self.tasks[key]
+                ts.who_has.remove(address)
+                if not ts.who_has:
+                    if ts.run_spec is not None:
                         recommendations[key] = 'released'
                     else:
                         recommendations[key] = 'forgotten'
@@ -911,7 +1376,8 @@ class Scheduler(ServerNode):
             self.transitions(recommendations)
 
             if self.validate:
-                assert all(self.who_has.values()), len(self.who_has)
+                assert all(ts.who_has for ts in self.tasks.values()
+                           if ts.state == 'memory')
 
             for plugin in self.plugins[:]:
                 try:
@@ -936,49 +1402,65 @@ class Scheduler(ServerNode):
     def cancel_key(self, key, client, retries=5):
         """ Cancel a particular key and all dependents """
         # TODO: this should be converted to use the transition mechanism
-        if key not in self.who_wants:  # no key yet, lets try again in 500ms
+        ts = self.tasks.get(key)
+        if ts is None or not ts.who_wants:  # no key yet, lets try again in 500ms
             if retries:
                 self.loop.add_future(gen.sleep(0.2),
                         lambda _: self.cancel_key(key, client, retries - 1))
             return
-        if self.who_wants[key] == {client}:  # no one else wants this key
-            for dep in list(self.dependents[key]):
-                self.cancel_key(dep, client)
+        if ts.who_wants == {client}:  # no one else wants this key
+            for dts in list(ts.dependents):
+                self.cancel_key(dts.key, client)
         logger.debug("Scheduler cancels key %s", key)
         self.report({'op': 'cancelled-key', 'key': key})
         self.client_releases_keys(keys=[key], client=client)
 
     def client_desires_keys(self, keys=None, client=None):
         for k in keys:
-            self.who_wants[k].add(client)
+            ts = self.tasks.get(k)
+            if ts is None:
+                # For publish, queues etc.
+                ts = self.new_task(k, None, 'released')
+            if ts.who_wants is None:
+                ts.who_wants = set()
+            ts.who_wants.add(client)
             self.wants_what[client].add(k)
 
-            if self.task_state.get(k) in ('memory', 'erred'):
+            if ts.state in ('memory', 'erred'):
                 self.report_on_key(k, client=client)
 
     def client_releases_keys(self, keys=None, client=None):
         """ Remove keys from client desired list """
-        keys2 = set()
+        tasks2 = set()
         for key in list(keys):
             if key in self.wants_what[client]:
                 self.wants_what[client].remove(key)
-                s = self.who_wants[key]
-                s.remove(client)
-                if not s:
-                    del self.who_wants[key]
-                    keys2.add(key)
-
-        for key in keys2:
-            if key in self.waiting_data and not self.waiting_data[key]:
-                r = self.transition(key, 'released')
+                ts = self.tasks.get(key)
+                if ts is None or not ts.who_wants:
+                    continue
+                ts.who_wants.discard(client)
+                if not ts.who_wants:
+                    ts.who_wants = None
+                    tasks2.add(ts)
+
+        for ts in tasks2:
+            if (ts.state in ('waiting', 'processing', 'memory', 'no-worker',
+                             'queued')
+                    and not ts.waiters):
+                r = self.transition(ts.key, 'released')
                 self.transitions(r)
-            if key in self.dependents and not self.dependents[key]:
-                r = self.transition(key, 'forgotten')
+            if ts.state != 'forgotten' and not ts.dependents:
+                r = self.transition(ts.key, 'forgotten')
                 self.transitions(r)
 
     def client_wants_keys(self, keys=None, client=None):
         for k in keys:
-            self.who_wants[k].add(client)
+            ts = self.tasks.get(k)
+            if ts is None:
+                ts = self.new_task(k, None, 'released')
+            if ts.who_wants is None:
+                ts.who_wants = set()
+            ts.who_wants.add(client)
             self.wants_what[client].add(k)
 
     ######################################
@@ -986,79 +1468,80 @@ class Scheduler(ServerNode):
     ######################################
 
     def validate_released(self, key):
-        assert key in self.dependencies
-        assert self.task_state[key] == 'released'
-        assert key not in self.waiting_data
-        assert key not in self.who_has
-        assert key not in self.rprocessing
-        # assert key not in self.ready
-        assert key not in self.waiting
-        assert not any(key in self.waiting_data.get(dep, ())
-                       for dep in self.dependencies[key])
-        assert key in self.released
+        ts = self.tasks[key]
+        assert ts.state == 'released'
+        assert not ts.waiters
+        assert not ts.waiting_on
+        assert not ts.who_has
+        assert not ts.processing_on
+        assert not any(ts in dts.waiters for dts in ts.dependencies)
+        assert ts not in self.unrunnable
 
     def validate_waiting(self, key):
-        assert key in self.waiting
-        assert key in self.waiting_data
-        assert key not in self.who_has
-        assert key not in self.rprocessing
-        assert key not in self.released
-        for dep in self.dependencies[key]:
-            assert (dep in self.who_has) + (dep in self.waiting[key]) == 1
-            assert key in self.waiting_data[dep]
+        ts = self.tasks[key]
+        assert not ts.who_has
+        assert not ts.processing_on
+        assert ts not in self.unrunnable
+        for dts in ts.dependencies:
+            assert bool(dts.who_has) + (dts in ts.waiting_on) == 1
+            assert ts in dts.waiters
 
     def validate_processing(self, key):
-        assert key not in self.waiting
-        assert key in self.waiting_data
-        assert key in self.rprocessing
-        w = self.rprocessing[key]
+        ts = self.tasks[key]
+        assert not ts.waiting_on
+        w = ts.processing_on
+        assert w
         assert key in self.processing[w]
-        assert key not in self.who_has
-        for dep in self.dependencies[key]:
-            assert dep in self.who_has
-            assert key in self.waiting_data[dep]
+        assert not ts.who_has
+        for dts in ts.dependencies:
+            assert dts.who_has
+            assert ts in dts.waiters
 
     def validate_memory(self, key):
-        assert key in self.who_has
-        assert key not in self.rprocessing
-        assert key not in self.waiting
-        assert key not in self.released
-        for dep in self.dependents[key]:
-            assert (dep in self.who_has) + (dep in self.waiting_data[key]) == 1
-
-    def validate_queue(self, key):
-        # assert key in self.ready
-        assert key not in self.released
-        assert key not in self.rprocessing
-        assert key not in self.who_has
-        assert key not in self.waiting
-        for dep in self.dependencies[key]:
-            assert dep in self.who_has
+        ts = self.tasks[key]
+        assert ts.who_has
+        assert not ts.processing_on
+        assert not ts.waiting_on
+        assert ts not in self.unrunnable
+        for dts in ts.dependents:
+            assert bool(dts.who_has) + (dts in ts.waiters) == 1
 
     def validate_no_worker(self, key):
-        assert key in self.unrunnable
-        assert key not in self.waiting
-        assert key not in self.released
-        assert key not in self.rprocessing
-        assert key not in self.who_has
-        for dep in self.dependencies[key]:
-            assert dep in self.who_has
+        ts = self.tasks[key]
+        assert ts in self.unrunnable
+        assert not ts.waiting_on
+        assert not ts.processing_on
+        assert not ts.who_has
+        for dts in ts.dependencies:
+            assert dts.who_has
+
+    def validate_queued(self, key):
+        ts = self.tasks[key]
+        assert ts in self.queued
+        assert not ts.dependencies
+        assert not ts.processing_on
+        assert not ts.who_has
 
     def validate_erred(self, key):
-        assert key in self.exceptions_blame
-        assert key not in self.who_has
+        ts = self.tasks[key]
+        assert ts.exception_blame is not None
+        assert not ts.who_has
 
-    def validate_key(self, key):
+    def validate_key(self, key, ts=None):
         try:
-            try:
-                func = getattr(self, 'validate_' + self.task_state[key].replace('-', '_'))
-            except KeyError:
+            if ts is None:
+                ts = self.tasks.get(key)
+            if ts is None:
                 logger.debug("Key lost: %s", key)
-            except AttributeError:
-                logger.info("self.validate_%s not found",
-                            self.task_state[key].replace('-', '_'))
             else:
-                func(key)
+                validate_task_state(ts)
+                try:
+                    func = getattr(self, 'validate_' + ts.state.replace('-', '_'))
+                except AttributeError:
+                    logger.info("self.validate_%s not found",
+                                ts.state.replace('-', '_'))
+                else:
+                    func(key)
         except Exception as e:
             logger.exception(e)
             if LOG_PDB:
@@ -1066,11 +1549,21 @@ class Scheduler(ServerNode):
             raise
 
     def validate_state(self, allow_overlap=False):
-        validate_state(self.dependencies, self.dependents, self.waiting,
-                self.waiting_data, self.ready, self.who_has,
-                self.processing, None, self.released, self.who_wants,
-                self.wants_what, tasks=self.tasks, erred=self.exceptions_blame,
-                allow_overlap=allow_overlap)
+        for key, ts in self.tasks.items():
+            assert ts.key == key, (key, ts)
+            validate_task_state(ts)
+            if ts.processing_on is not None:
+                assert key in self.processing[ts.processing_on]
+            for w in ts.who_has:
+                assert key in self.has_what[w]
+            for client in ts.who_wants or ():
+                assert key in self.wants_what[client]
+            assert (ts in self.unrunnable) == (ts.state == 'no-worker')
+            assert (ts in self.queued) == (ts.state == 'queued')
+
+        assert self.queued_counts == dict(frequencies(ts.prefix
+                                                      for ts in self.queued))
+
         if not (set(self.ncores) ==
                 set(self.workers) ==
                 set(self.has_what) ==
@@ -1079,21 +1572,48 @@ class Scheduler(ServerNode):
                 set(self.worker_comms)):
             raise ValueError("Workers not the same in all collections")
 
-        assert self.worker_bytes == {w: sum(self.nbytes[k] for k in keys)
+        assert self.worker_bytes == {w: sum(self.tasks[k].get_nbytes()
+                                            for k in keys)
                                      for w, keys in self.has_what.items()}
 
-        for key, workers in self.who_has.items():
-            for worker in workers:
-                assert key in self.has_what[worker]
-
         for worker, keys in self.has_what.items():
             for key in keys:
-                assert worker in self.who_has[key]
+                assert worker in self.tasks[key].who_has
 
-        assert all(self.who_has.values())
+        for worker, processing in self.processing.items():
+            for key in processing:
+                assert self.tasks[key].processing_on == worker
+
+        counts = defaultdict(dict)
+        for worker, processing in self.processing.items():
+            for key in processing:
+                if key not in self.long_running:
+                    c = counts[self.tasks[key].prefix]
+                    c[worker] = c.get(worker, 0) + 1
+        assert counts == self.processing_counts
 
         for worker, occ in self.occupancy.items():
-            assert abs(sum(self.processing[worker].values()) - occ) < 1e-8
+            expected = sum(map(self.get_processing_cost,
+                               map(self.tasks.__getitem__,
+                                   self.processing[worker])))
+            assert abs(expected - occ) <= 1e-8 * (1 + expected)
+            expected = sum(self.get_task_nbytes(self.tasks[key])
+                           for key in self.processing[worker]
+                           if key not in self.long_running)
+            nbytes = self.processing_bytes[worker]
+            assert abs(expected - nbytes) <= 1e-8 * (1 + expected)
+
+        for column in self.worker_index.columns:
+            total = sum(column.values())
+            assert abs(total - column.total) <= 1e-6 * (1 + abs(total))
+
+        assert set(self.idle) == set(self._idle_key) <= set(self.workers)
+        assert list(self.idle) == sorted(self.idle, key=self._idle_key.get)
+        for w in self.idle:
+            assert self._idle_key[w] == (self.occupancy[w] / self.ncores[w], w)
+        assert self.open_workers == {w for w in self.workers
+                                     if len(self.processing[w])
+                                     < self.worker_slots(w)}
 
     ###################
     # Manage Messages #
@@ -1104,12 +1624,24 @@ class Scheduler(ServerNode):
         Publish updates to all listening Queues and Comms
 
         If the message contains a key then we only send the message to those
-        comms that care about the key.
+        comms that care about the key.  Reports listed in ``BULK_REPORTS``
+        are gathered into messages with a list of keys per comm, see
+        ``BatchedSend.send_bulk``.
         """
+        bulk = BULK_REPORTS.get(msg.get('op'))
+        if bulk is not None:
+            op, fields = bulk
+            header = {'op': op}
+            for field in fields:
+                header[field] = msg.get(field)
+
         if client is not None:
             try:
                 comm = self.comms[client]
-                comm.send(msg)
+                if bulk is None:
+                    comm.send(msg)
+                else:
+                    comm.send_bulk(header, keys=msg['key'])
             except CommClosedError:
                 if self.status == 'running':
                     logger.critical("Tried writing to closed comm: %s", msg)
@@ -1117,16 +1649,20 @@ class Scheduler(ServerNode):
                 pass
 
         if 'key' in msg:
-            if msg['key'] not in self.who_wants:
+            ts = self.tasks.get(msg['key'])
+            if ts is None or not ts.who_wants:
                 return
             comms = [self.comms[c]
-                     for c in self.who_wants.get(msg['key'], ())
+                     for c in ts.who_wants
                      if c in self.comms]
         else:
             comms = self.comms.values()
         for c in comms:
             try:
-                c.send(msg)
+                if bulk is None:
+                    c.send(msg)
+                else:
+                    c.send_bulk(header, keys=msg['key'])
                 # logger.debug("Scheduler sends message to client %s", msg)
             except CommClosedError:
                 if self.status == 'running':
@@ -1214,7 +1750,7 @@ class Scheduler(ServerNode):
                             if 'client' not in msg:
                                 msg['client'] = client
                             result = handler(**msg)
-                            if isinstance(result, gen.Future):
+                            if inspect.isawaitable(result):
                                 await result
                         except Exception as e:
                             logger.exception(e)
@@ -1234,24 +1770,28 @@ class Scheduler(ServerNode):
     def send_task_to_worker(self, worker, key):
         """ Send a single computational task to a worker """
         try:
+            ts = self.tasks[key]
             msg = {'op': 'compute-task',
                    'key': key,
-                   'priority': self.priority[key],
-                   'duration': self.get_task_duration(key)}
-            if key in self.resource_restrictions:
-                msg['resource_restrictions'] = self.resource_restrictions[key]
+                   'priority': ts.priority,
+                   'duration': self.get_task_duration(ts)}
+            if ts.resource_restrictions:
+                msg['resource_restrictions'] = ts.resource_restrictions
 
-            deps = self.dependencies[key]
+            deps = ts.dependencies
             if deps:
-                msg['who_has'] = {dep: list(self.who_has[dep]) for dep in deps}
-                msg['nbytes'] = {dep: self.nbytes.get(dep) for dep in deps}
+                msg['who_has'] = {dts.key: list(dts.who_has) for dts in deps}
+                msg['nbytes'] = {dts.key: dts.nbytes for dts in deps}
 
             if self.validate and deps:
                 assert all(msg['who_has'].values())
 
-            task = self.tasks[key]
+            task = ts.run_spec
             if type(task) is dict:
                 msg.update(task)
+            elif type(task) is TemplatedTask:
+                msg.update(task.template)
+                msg['args'] = task.args
             else:
                 msg['task'] = task
 
@@ -1278,21 +1818,24 @@ class Scheduler(ServerNode):
         self.transitions(r)
 
     def handle_missing_data(self, key=None, worker=None, client=None, **msg):
-        if self.rprocessing.get(key) != worker:
+        ts = self.tasks.get(key)
+        if ts is None or ts.processing_on != worker:
             return
         r = self.stimulus_missing_data(key=key, ensure=False, **msg)
         self.transitions(r)
         if self.validate:
-            assert all(self.who_has.values())
+            assert all(ts.who_has for ts in self.tasks.values()
+                       if ts.state == 'memory')
 
     def release_worker_data(self, stream=None, keys=None, worker=None):
         hw = self.has_what[worker]
         recommendations = dict()
         for key in set(keys) & hw:
+            ts = self.tasks[key]
             hw.remove(key)
-            wh = self.who_has[key]
-            wh.remove(worker)
-            if not wh:
+            self.worker_bytes[worker] -= ts.get_nbytes()
+            ts.who_has.remove(worker)
+            if not ts.who_has:
                 recommendations[key] = 'released'
         if recommendations:
             self.transitions(recommendations)
@@ -1305,28 +1848,20 @@ class Scheduler(ServerNode):
         """
         self.extensions['stealing'].remove_key_from_stealable(key)
 
-        try:
-            actual_worker = self.rprocessing[key]
-        except KeyError:
+        ts = self.tasks.get(key)
+        if ts is None or ts.processing_on is None:
             logger.debug("Received long-running signal from duplicate task. "
                          "Ignoring.")
             return
+        actual_worker = ts.processing_on
 
         if compute_duration:
-            ks = key_split(key)
-            old_duration = self.task_duration.get(ks, 0)
-            new_duration = compute_duration
-            if not old_duration:
-                avg_duration = new_duration
-            else:
-                avg_duration = (0.5 * old_duration
-                              + 0.5 * new_duration)
-
-            self.task_duration[ks] = avg_duration
+            self.record_task_duration(ts.prefix, compute_duration)
 
-        worker = self.rprocessing[key]
-        self.occupancy[actual_worker] -= self.processing[actual_worker][key]
-        self.processing[actual_worker][key] = 0
+        if key not in self.long_running:
+            self.release_occupancy(ts, actual_worker)
+            self.processing[actual_worker][key] = 0
+            self.long_running.add(key)
 
     async def handle_worker(self, worker):
         """
@@ -1477,7 +2012,10 @@ class Scheduler(ServerNode):
     async def gather(self, comm=None, keys=None):
         """ Collect data in from workers """
         keys = list(keys)
-        who_has = {key: self.who_has.get(key, ()) for key in keys}
+        who_has = {}
+        for key in keys:
+            ts = self.tasks.get(key)
+            who_has[key] = ts.who_has if ts is not None else ()
 
         data, missing_keys, missing_workers = await gather_from_workers(
                 who_has, rpc=self.rpc, close=False)
@@ -1486,7 +2024,8 @@ class Scheduler(ServerNode):
         else:
             logger.debug("Couldn't gather keys %s state: %s workers: %s",
                          missing_keys,
-                         [self.task_state.get(key) for key in missing_keys],
+                         [self.tasks[key].state if key in self.tasks else None
+                          for key in missing_keys],
                          missing_workers)
             result = {'status': 'error', 'keys': missing_keys}
             with log_errors():
@@ -1495,11 +2034,12 @@ class Scheduler(ServerNode):
                 for key, workers in missing_keys.items():
                     logger.exception("Workers don't have promised keys. "
                                      "This should never occur")
+                    ts = self.tasks[key]
                     for worker in workers:
                         if worker in self.workers and key in self.has_what[worker]:
                             self.has_what[worker].remove(key)
-                            self.who_has[key].remove(worker)
-                            self.worker_bytes[worker] -= self.nbytes.get(key, DEFAULT_DATA_SIZE)
+                            ts.who_has.remove(worker)
+                            self.worker_bytes[worker] -= ts.get_nbytes()
                             self.transitions({key: 'released'})
 
         self.log_event('all', {'action': 'gather',
@@ -1562,7 +2102,7 @@ class Scheduler(ServerNode):
                                              'client': client})
             start = time()
             while time() < start + 10 and len(self.workers) < n_workers:
-                yield gen.sleep(0.01)
+                await asyncio.sleep(0.01)
 
             self.report({'op': 'restart'})
 
@@ -1609,21 +2149,25 @@ class Scheduler(ServerNode):
         average expected load.
         """
         with log_errors():
-            keys = set(keys or self.who_has)
+            tasks = self.tasks
+            if keys:
+                keys = set(keys)
+            else:
+                keys = {k for k, ts in tasks.items() if ts.who_has}
             workers = set(workers or self.workers)
 
-            if not keys.issubset(self.who_has):
+            missing = [k for k in keys if k not in tasks or not tasks[k].who_has]
+            if missing:
                 return {'status': 'missing-data',
-                        'keys': list(keys - set(self.who_has))}
+                        'keys': missing}
 
-            workers_by_key = {k: self.who_has.get(k, set()) & workers for k in keys}
+            workers_by_key = {k: tasks[k].who_has & workers for k in keys}
             keys_by_worker = {w: set() for w in workers}
             for k, v in workers_by_key.items():
                 for vv in v:
                     keys_by_worker[vv].add(k)
 
-            worker_bytes = {w: sum(self.nbytes.get(k, DEFAULT_DATA_SIZE)
-                                   for k in v)
+            worker_bytes = {w: sum(tasks[k].get_nbytes() for k in v)
                             for w, v in keys_by_worker.items()}
             avg = sum(worker_bytes.values()) / len(worker_bytes)
 
@@ -1634,7 +2178,7 @@ class Scheduler(ServerNode):
             recipient = next(recipients)
             msgs = []  # (sender, recipient, key)
             for sender in sorted_workers[:len(workers) // 2]:
-                sender_keys = {k: self.nbytes.get(k, DEFAULT_DATA_SIZE)
+                sender_keys = {k: tasks[k].get_nbytes()
                                 for k in keys_by_worker[sender]}
                 sender_keys = iter(sorted(sender_keys.items(),
                                           key=second, reverse=True))
@@ -1678,10 +2222,10 @@ class Scheduler(ServerNode):
                                                if 'keys' in r], [])}
 
             for sender, recipient, key in msgs:
-                self.who_has[key].add(recipient)
+                ts = tasks[key]
+                ts.who_has.add(recipient)
                 self.has_what[recipient].add(key)
-                self.worker_bytes[recipient] += self.nbytes.get(key,
-                                                        DEFAULT_DATA_SIZE)
+                self.add_worker_bytes(recipient, ts.get_nbytes())
                 self.transition_log.append((key, 'memory', 'memory', {},
                                             self._transition_counter, sender,
                                             recipient))
@@ -1691,10 +2235,10 @@ class Scheduler(ServerNode):
                          for r, v in to_senders.items()}
 
             for sender, recipient, key in msgs:
-                self.who_has[key].remove(sender)
+                ts = tasks[key]
+                ts.who_has.remove(sender)
                 self.has_what[sender].remove(key)
-                self.worker_bytes[sender] -= self.nbytes.get(key,
-                                                             DEFAULT_DATA_SIZE)
+                self.worker_bytes[sender] -= ts.get_nbytes()
 
             return {'status': 'OK'}
 
@@ -1727,16 +2271,18 @@ class Scheduler(ServerNode):
         if n == 0:
             raise ValueError("Can not use replicate to delete data")
 
-        if not keys.issubset(self.who_has):
+        tasks = self.tasks
+        missing = [k for k in keys if k not in tasks or not tasks[k].who_has]
+        if missing:
             return {'status': 'missing-data',
-                    'keys': list(keys - set(self.who_has))}
+                    'keys': missing}
 
         # Delete extraneous data
         if delete:
-            del_keys = {k: random.sample(self.who_has[k] & workers,
-                                         len(self.who_has[k] & workers) - n)
+            del_keys = {k: random.sample(tasks[k].who_has & workers,
+                                         len(tasks[k].who_has & workers) - n)
                         for k in keys
-                        if len(self.who_has[k] & workers) > n}
+                        if len(tasks[k].who_has & workers) > n}
             del_workers = {k: v for k, v in reverse_dict(del_keys).items() if v}
             [await self.rpc(addr=worker).delete_data(keys=list(keys),
                                                      report=False)
@@ -1745,26 +2291,27 @@ class Scheduler(ServerNode):
             for worker, keys in del_workers.items():
                 self.has_what[worker] -= keys
                 for key in keys:
-                    self.who_has[key].remove(worker)
-                    self.worker_bytes[worker] -= self.nbytes.get(key,
-                                                            DEFAULT_DATA_SIZE)
+                    ts = tasks[key]
+                    ts.who_has.remove(worker)
+                    self.worker_bytes[worker] -= ts.get_nbytes()
                 self.log_event(worker, {'action': 'replicate-remove',
                                         'keys': keys})
 
-        keys = {k for k in keys if len(self.who_has[k] & workers) < n}
+        keys = {k for k in keys if len(tasks[k].who_has & workers) < n}
         # Copy not-yet-filled data
         while keys:
             gathers = defaultdict(dict)
             for k in list(keys):
-                missing = workers - self.who_has[k]
-                count = min(max(n - len(self.who_has[k] & workers), 0),
-                            branching_factor * len(self.who_has[k]))
+                who_has = tasks[k].who_has
+                missing = workers - who_has
+                count = min(max(n - len(who_has & workers), 0),
+                            branching_factor * len(who_has))
                 if not count:
                     keys.remove(k)
                 else:
                     sample = random.sample(missing, count)
                     for w in sample:
-                        gathers[w][k] = list(self.who_has[k])
+                        gathers[w][k] = list(who_has)
 
             results = {w: await self.rpc(addr=w).gather(who_has=who_has)
                        for w, who_has in gathers.items()}
@@ -1810,12 +2357,11 @@ class Scheduler(ServerNode):
             if all(self.processing.values()):
                 return []
 
-            limit_bytes = {w: self.worker_info[w]['memory_limit']
-                            for w in self.worker_info}
+            limit_bytes = self.memory_limit
             worker_bytes = self.worker_bytes
 
-            limit = sum(limit_bytes.values())
-            total = sum(worker_bytes.values())
+            limit = limit_bytes.total
+            total = worker_bytes.total
             idle = sorted(self.idle, key=worker_bytes.get, reverse=True)
 
             to_close = []
@@ -1830,6 +2376,28 @@ class Scheduler(ServerNode):
 
             return to_close
 
+    def add_worker_bytes(self, worker, nbytes):
+        """ Count *nbytes* of new data on a worker, keeping its peak """
+        total = self.worker_bytes[worker] + nbytes
+        self.worker_bytes[worker] = total
+        if total > self.peak_bytes[worker]:
+            self.peak_bytes[worker] = total
+
+    def workers_over_memory(self, fraction):
+        """ Workers holding more than *fraction* of their memory limit
+
+        Workers with an unknown memory limit are left out.
+        """
+        limit = self.memory_limit
+        nbytes = self.worker_bytes
+        if np is None:
+            return [w for w in limit
+                    if limit[w] and nbytes[w] > fraction * limit[w]]
+        limits = limit.array()
+        over = (nbytes.array() > fraction * limits) & (limits > 0)
+        addresses = self.worker_index.addresses
+        return [addresses[row] for row in np.flatnonzero(over)]
+
     async def retire_workers(self, comm=None, workers=None, remove=True, close=False,
                              close_workers=False):
         if close:
@@ -1851,7 +2419,8 @@ class Scheduler(ServerNode):
             workers = set(workers)
             if len(workers) > 0:
                 keys = set.union(*[self.has_what[w] for w in workers])
-                keys = {k for k in keys if self.who_has[k].issubset(workers)}
+                keys = {k for k in keys
+                        if self.tasks[k].who_has.issubset(workers)}
             else:
                 keys = set()
 
@@ -1886,12 +2455,12 @@ class Scheduler(ServerNode):
         if worker not in self.worker_info:
             return 'not found'
         for key in keys:
-            if key in self.who_has:
+            ts = self.tasks.get(key)
+            if ts is not None and ts.who_has:
                 if key not in self.has_what[worker]:
-                    self.worker_bytes[worker] += self.nbytes.get(key,
-                                                            DEFAULT_DATA_SIZE)
+                    self.add_worker_bytes(worker, ts.get_nbytes())
                 self.has_what[worker].add(key)
-                self.who_has[key].add(worker)
+                ts.who_has.add(worker)
             # else:
                 # TODO: delete key from worker
         return 'OK'
@@ -1908,47 +2477,44 @@ class Scheduler(ServerNode):
             who_has = {k: [self.coerce_address(vv) for vv in v]
                        for k, v in who_has.items()}
             logger.debug("Update data %s", who_has)
-            if client:
-                self.client_wants_keys(keys=list(who_has), client=client)
-
-            # for key, workers in who_has.items():  # TODO
-            #     self.mark_key_in_memory(key, workers)
-
-            self.nbytes.update(nbytes)
 
             for key, workers in who_has.items():
-                if key not in self.dependents:
-                    self.dependents[key] = set()
-                if key not in self.dependencies:
-                    self.dependencies[key] = set()
-                self.task_state[key] = 'memory'
-                if key not in self.who_has:
-                    self.who_has[key] = set()
+                ts = self.tasks.get(key)
+                if ts is None:
+                    ts = self.new_task(key, None, 'memory')
+                ts.state = 'memory'
+                if key in nbytes:
+                    ts.nbytes = nbytes[key]
+                if not ts.who_has:
+                    ts.who_has = set()
                 for w in workers:
                     if key not in self.has_what[w]:
-                        self.worker_bytes[w] += self.nbytes.get(key,
-                                                            DEFAULT_DATA_SIZE)
+                        self.add_worker_bytes(w, ts.get_nbytes())
                     self.has_what[w].add(key)
-                    self.who_has[key].add(w)
-                if key not in self.waiting_data:
-                    self.waiting_data[key] = set()
+                    ts.who_has.add(w)
+
+            if client:
+                self.client_wants_keys(keys=list(who_has), client=client)
+
+            for key, workers in who_has.items():
                 self.report({'op': 'key-in-memory',
                              'key': key,
                              'workers': list(workers)})
 
     def report_on_key(self, key, client=None):
-        if key not in self.task_state:
+        ts = self.tasks.get(key)
+        if ts is None:
             self.report({'op': 'cancelled-key',
                          'key': key}, client=client)
-        elif self.task_state[key] == 'memory':
+        elif ts.state == 'memory':
             self.report({'op': 'key-in-memory',
                          'key': key}, client=client)
-        elif self.task_state[key] == 'erred':
-            failing_key = self.exceptions_blame[key]
+        elif ts.state == 'erred':
+            failing_ts = ts.exception_blame
             self.report({'op': 'task-erred',
                          'key': key,
-                         'exception': self.exceptions[failing_key],
-                         'traceback': self.tracebacks.get(failing_key, None)},
+                         'exception': failing_ts.exception,
+                         'traceback': failing_ts.traceback},
                          client=client)
 
     async def feed(self, comm, function=None, setup=None, teardown=None, interval=1, **kwargs):
@@ -1990,9 +2556,11 @@ class Scheduler(ServerNode):
 
     def get_who_has(self, comm=None, keys=None):
         if keys is not None:
-            return {k: list(self.who_has.get(k, [])) for k in keys}
+            return {k: list(self.tasks[k].who_has) if k in self.tasks else []
+                    for k in keys}
         else:
-            return valmap(list, self.who_has)
+            return {k: list(ts.who_has) for k, ts in self.tasks.items()
+                    if ts.who_has}
 
     def get_has_what(self, comm=None, workers=None):
         if workers is not None:
@@ -2006,14 +2574,15 @@ class Scheduler(ServerNode):
             workers = map(self.coerce_address, workers)
             return {w: self.ncores.get(w, None) for w in workers}
         else:
-            return self.ncores
+            return dict(self.ncores)
 
     def get_nbytes(self, comm=None, keys=None, summary=True):
         with log_errors():
             if keys is not None:
-                result = {k: self.nbytes[k] for k in keys}
+                result = {k: self.tasks[k].nbytes for k in keys}
             else:
-                result = self.nbytes
+                result = {k: ts.nbytes for k, ts in self.tasks.items()
+                          if ts.nbytes is not None}
 
             if summary:
                 out = defaultdict(lambda: 0)
@@ -2023,26 +2592,173 @@ class Scheduler(ServerNode):
 
             return result
 
-    def get_comm_cost(self, key, worker):
+    def get_comm_cost(self, ts, worker):
         """
-        Get the estimated communication cost (in s.) to compute key
+        Get the estimated communication cost (in s.) to compute the task
         on the given worker.
         """
-        return (sum(self.nbytes[d] for d in
-                    self.dependencies[key] - self.has_what[worker])
+        return (sum(dts.get_nbytes() for dts in ts.dependencies
+                    if worker not in dts.who_has)
                 / BANDWIDTH)
 
-    def get_task_duration(self, key, default=0.5):
+    def get_task_duration(self, ts, default=DEFAULT_TASK_DURATION):
         """
-        Get the estimated computation cost of the given key
+        Get the estimated computation cost of the given task
         (not including any communication cost).
         """
-        ks = key_split(key)
+        return self.task_duration.get(ts.prefix, default)
+
+    def get_processing_cost(self, ts):
+        """
+        Get the estimated time to run the given processing task on its
+        worker, including communication.  Long-running tasks cost nothing.
+        """
+        if ts.key in self.long_running:
+            return 0
+        return (self.get_task_duration(ts)
+                + self.processing[ts.processing_on][ts.key])
+
+    def set_task_duration(self, prefix, duration):
+        """
+        Set the estimated computation cost of tasks with the given prefix
+
+        The occupancy of each worker changes by the difference times the
+        number of such tasks it is processing, without visiting those tasks.
+        """
+        change = duration - self.task_duration.get(prefix,
+                                                   DEFAULT_TASK_DURATION)
+        self.task_duration[prefix] = duration
+        if change:
+            for w, n in self.processing_counts.get(prefix, {}).items():
+                self.occupancy[w] += n * change
+                self.check_idle_saturated(w)
+
+    def prefix_stats(self, prefix):
+        """ The ``TaskPrefixStats`` of a key prefix, created if new """
         try:
-            return self.task_duration[ks]
+            return self.task_prefix_stats[prefix]
         except KeyError:
-            self.unknown_durations[ks].add(key)
-            return default
+            stats = TaskPrefixStats(TASK_STATISTICS_HALFLIFE)
+            self.task_prefix_stats[prefix] = stats
+            return stats
+
+    def record_task_duration(self, prefix, duration):
+        """ Add the duration of a finished task to the statistics of its
+        prefix, and expect their mean from the others """
+        stats = self.prefix_stats(prefix)
+        stats.add_duration(duration)
+        self.set_task_duration(prefix, stats.duration.mean)
+
+    def record_task_nbytes(self, prefix, nbytes):
+        """ Add the size of the result of a finished task to the statistics
+        of its prefix, and expect their mean from the others """
+        stats = self.prefix_stats(prefix)
+        stats.add_nbytes(nbytes)
+        self.set_task_nbytes(prefix, stats.nbytes.mean)
+
+    def task_counts(self):
+        """ Count tasks by state in a single pass over ``self.tasks``
+
+        Returns a dictionary with the number of tasks in each state, along
+        with ``'in-memory'`` (tasks with a replica somewhere),
+        ``'exceptions'`` (tasks holding their own exception) and
+        ``'failed'`` (erred tasks, blamed on themselves or a dependency).
+        The legacy views like ``self.who_has`` and ``self.waiting`` would
+        each take their own pass over all tasks to compute their length.
+        """
+        counts = defaultdict(int)
+        in_memory = exceptions = failed = 0
+        for ts in self.tasks.values():
+            counts[ts.state] += 1
+            if ts.who_has:
+                in_memory += 1
+            if ts.exception is not None:
+                exceptions += 1
+            if ts.exception_blame is not None:
+                failed += 1
+        counts['in-memory'] = in_memory
+        counts['exceptions'] = exceptions
+        counts['failed'] = failed
+        return counts
+
+    def get_task_prefixes(self, comm=None, prefixes=None):
+        """ Summaries of the statistics of tasks by key prefix
+
+        Returns a dictionary like ``{'inc': {'duration': {'mean': 0.01,
+        'std': 0.002, 'p50': 0.01, 'p95': 0.013, 'count': 100}, 'nbytes':
+        {...}, 'failures': 0, 'failure-rate': 0.0, 'queued': 0}}``.
+        Prefixes whose tasks have not finished yet only have ``'queued'``.
+        """
+        if prefixes is None:
+            prefixes = set(self.task_prefix_stats).union(self.queued_counts)
+        result = {}
+        for prefix in prefixes:
+            stats = self.task_prefix_stats.get(prefix)
+            queued = self.queued_counts.get(prefix, 0)
+            if stats is not None:
+                result[prefix] = stats.summary()
+                result[prefix]['queued'] = queued
+            elif queued:
+                result[prefix] = {'queued': queued}
+        return result
+
+    def get_task_nbytes(self, ts, default=DEFAULT_DATA_SIZE):
+        """
+        Get the estimated number of bytes of the result of the given task
+        """
+        return self.task_nbytes.get(ts.prefix, default)
+
+    def set_task_nbytes(self, prefix, nbytes):
+        """
+        Set the estimated number of bytes of the results of tasks with the
+        given prefix, updating ``processing_bytes`` like
+        ``set_task_duration`` updates occupancy
+        """
+        change = nbytes - self.task_nbytes.get(prefix, DEFAULT_DATA_SIZE)
+        self.task_nbytes[prefix] = nbytes
+        if change:
+            for w, n in self.processing_counts.get(prefix, {}).items():
+                self.processing_bytes[w] += n * change
+
+    def consume_occupancy(self, ts, worker, comm=None):
+        """ Count a task processing on a worker towards its occupancy, and
+        its expected result towards the worker's memory """
+        if comm is None:
+            comm = self.get_comm_cost(ts, worker)
+        self.processing[worker][ts.key] = comm
+        counts = self.processing_counts[ts.prefix]
+        counts[worker] = counts.get(worker, 0) + 1
+        self.occupancy[worker] += self.get_task_duration(ts) + comm
+        self.processing_bytes[worker] += self.get_task_nbytes(ts)
+        self._rekey_idle(worker)
+
+    def release_occupancy(self, ts, worker):
+        """ Stop counting a task towards the occupancy of a worker
+
+        Returns the estimated time that it took off the worker's occupancy.
+        """
+        comm = self.processing[worker].pop(ts.key)
+        if ts.key in self.long_running:  # already taken off when it seceded
+            self.long_running.remove(ts.key)
+            cost = nbytes = 0
+        else:
+            counts = self.processing_counts[ts.prefix]
+            if counts[worker] > 1:
+                counts[worker] -= 1
+            else:
+                del counts[worker]
+                if not counts:
+                    del self.processing_counts[ts.prefix]
+            cost = self.get_task_duration(ts) + comm
+            nbytes = self.get_task_nbytes(ts)
+        if self.processing[worker]:
+            self.occupancy[worker] -= cost
+            self.processing_bytes[worker] -= nbytes
+        else:  # don't let rounding errors accumulate
+            self.occupancy[worker] = 0
+            self.processing_bytes[worker] = 0
+        self._rekey_idle(worker)
+        return cost
 
     def run_function(self, stream, function, args=(), kwargs={}):
         """ Run a function within this process
@@ -2061,59 +2777,47 @@ class Scheduler(ServerNode):
 
     def transition_released_waiting(self, key):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
-                assert key in self.tasks
-                assert key in self.dependencies
-                assert key in self.dependents
-                assert key not in self.waiting
-                assert key not in self.who_has
-                assert key not in self.rprocessing
-                # assert all(dep in self.task_state
-                #            for dep in self.dependencies[key])
-
-            if not all(dep in self.task_state for dep in
-                    self.dependencies[key]):
-                return {key: 'forgotten'}
+                assert ts.run_spec is not None
+                assert not ts.waiting_on
+                assert not ts.who_has
+                assert not ts.processing_on
 
-            self.waiting[key] = set()
+            if any(dts.state == 'forgotten' for dts in ts.dependencies):
+                return {key: 'forgotten'}
 
             recommendations = OrderedDict()
 
-            for dep in self.dependencies[key]:
-                if dep in self.exceptions_blame:
-                    self.exceptions_blame[key] = self.exceptions_blame[dep]
+            for dts in ts.dependencies:
+                if dts.exception_blame is not None:
+                    ts.exception_blame = dts.exception_blame
                     recommendations[key] = 'erred'
                     return recommendations
 
-            for dep in self.dependencies[key]:
-                if dep not in self.who_has:
-                    self.waiting[key].add(dep)
-                if dep in self.released:
-                    recommendations[dep] = 'waiting'
+            for dts in ts.dependencies:
+                if not dts.who_has:
+                    ts.waiting_on.add(dts)
+                if dts.state == 'released':
+                    recommendations[dts.key] = 'waiting'
                 else:
-                    self.waiting_data[dep].add(key)
+                    dts.waiters.add(ts)
 
-            self.waiting_data[key] = {dep for dep in self.dependents[key]
-                                          if dep not in self.who_has
-                                          and dep not in self.released
-                                          and dep not in self.exceptions_blame}
+            ts.waiters = {dts for dts in ts.dependents
+                          if not dts.who_has
+                          and dts.state != 'released'
+                          and dts.exception_blame is None}
 
-            if not self.waiting[key]:
+            if not ts.waiting_on:
                 if self.workers:
-                    self.task_state[key] = 'waiting'
+                    ts.state = 'waiting'
                     recommendations[key] = 'processing'
                 else:
-                    self.unrunnable.add(key)
-                    del self.waiting[key]
-                    self.task_state[key] = 'no-worker'
+                    self.unrunnable.add(ts)
+                    ts.state = 'no-worker'
             else:
-                self.task_state[key] = 'waiting'
-
-            if self.validate:
-                if self.task_state[key] == 'waiting':
-                    assert key in self.waiting
-
-            self.released.remove(key)
+                ts.state = 'waiting'
 
             return recommendations
         except Exception as e:
@@ -2124,37 +2828,37 @@ class Scheduler(ServerNode):
 
     def transition_no_worker_waiting(self, key):
         try:
-            if self.validate:
-                assert key in self.unrunnable
-                assert key not in self.waiting
-                assert key not in self.who_has
-                assert key not in self.rprocessing
+            ts = self.tasks[key]
 
-            self.unrunnable.remove(key)
+            if self.validate:
+                assert ts in self.unrunnable
+                assert not ts.waiting_on
+                assert not ts.who_has
+                assert not ts.processing_on
 
-            if not all(dep in self.task_state for dep in
-                    self.dependencies[key]):
+            if any(dts.state == 'forgotten' for dts in ts.dependencies):
                 return {key: 'forgotten'}
 
-            recommendations = OrderedDict()
+            self.unrunnable.remove(ts)
 
-            self.waiting[key] = set()
+            recommendations = OrderedDict()
 
-            for dep in self.dependencies[key]:
-                if dep not in self.who_has:
-                    self.waiting[key].add(dep)
-                if dep in self.released:
-                    recommendations[dep] = 'waiting'
+            for dts in ts.dependencies:
+                if not dts.who_has:
+                    ts.waiting_on.add(dts)
+                if dts.state == 'released':
+                    recommendations[dts.key] = 'waiting'
                 else:
-                    self.waiting_data[dep].add(key)
+                    dts.waiters.add(ts)
 
-            self.task_state[key] = 'waiting'
+            ts.state = 'waiting'
 
-            if not self.waiting[key]:
+            if not ts.waiting_on:
                 if self.workers:
                     recommendations[key] = 'processing'
                 else:
-                    self.task_state[key] = 'no-worker'
+                    self.unrunnable.add(ts)
+                    ts.state = 'no-worker'
 
             return recommendations
         except Exception as e:
@@ -2165,66 +2869,171 @@ class Scheduler(ServerNode):
 
     def transition_waiting_processing(self, key):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
-                assert key in self.waiting
-                assert not self.waiting[key]
-                assert key not in self.who_has
-                assert key not in self.exceptions_blame
-                assert key not in self.rprocessing
-                # assert key not in self.readyset
-                assert key not in self.unrunnable
-                assert all(dep in self.who_has
-                           for dep in self.dependencies[key])
-
-            if any(not self.who_has[dep] for dep in self.dependencies[key]):
+                assert not ts.waiting_on
+                assert not ts.who_has
+                assert ts.exception_blame is None
+                assert not ts.processing_on
+                assert ts not in self.unrunnable
+                assert all(dts.who_has for dts in ts.dependencies)
+
+            if any(not dts.who_has for dts in ts.dependencies):
                 return {}
 
-            del self.waiting[key]
+            valid_workers = self.valid_workers(ts)
 
-            valid_workers = self.valid_workers(key)
-
-            if not valid_workers and key not in self.loose_restrictions and self.ncores:
-                self.unrunnable.add(key)
-                self.task_state[key] = 'no-worker'
+            if not valid_workers and not ts.loose_restrictions and self.ncores:
+                self.unrunnable.add(ts)
+                ts.state = 'no-worker'
                 return {}
 
-            if self.dependencies.get(key, None) or valid_workers is not True:
-                worker = decide_worker(self.dependencies, self.occupancy,
-                        self.who_has, valid_workers, self.loose_restrictions,
-                        partial(self.worker_objective, key), key)
+            queue = (not ts.dependencies and valid_workers is True
+                     and WORKER_SATURATION < float('inf'))
+            if ts.dependencies or valid_workers is not True:
+                worker = decide_worker(ts, self.workers, valid_workers,
+                                       self.choose_worker)
+            elif queue:
+                worker = self.worker_with_slot(ts)
+                if worker is None:
+                    ts.state = 'queued'
+                    self.queued.add(ts)
+                    counts = self.queued_counts
+                    counts[ts.prefix] = counts.get(ts.prefix, 0) + 1
+                    return {}
             elif self.idle:
-                if len(self.idle) < 20:  # smart but linear in small case
-                    worker = min(self.idle, key=self.occupancy.get)
-                else:  # dumb but fast in large case
-                    worker = self.idle[self.n_tasks % len(self.idle)]
+                worker = self.idle[0]  # least busy, kept in order
             else:
                 if len(self.workers) < 20:  # smart but linear in small case
                     worker = min(self.workers, key=self.occupancy.get)
                 else:  # dumb but fast in large case
                     worker = self.workers[self.n_tasks % len(self.workers)]
 
+            if worker and not queue and self.over_memory_target(ts, worker):
+                # Look further for a worker with room for the result
+                pool = (self.workers if valid_workers is True
+                        else valid_workers)
+                if len(pool) > 1:
+                    worker = self.choose_worker(ts, pool)
+
             assert worker
 
-            ks = key_split(key)
+            self._add_to_processing(ts, worker)
+
+            return {}
+        except Exception as e:
+            logger.exception(e)
+            if LOG_PDB:
+                import pdb; pdb.set_trace()
+            raise
+
+    def _add_to_processing(self, ts, worker):
+        """ Send a task to a worker to compute """
+        self.consume_occupancy(ts, worker)
+        ts.processing_on = worker
+        ts.state = 'processing'
+        self.consume_resources(ts, worker)
+        self.check_idle_saturated(worker)
+        self.n_tasks += 1
+
+        # logger.debug("Send job to worker: %s, %s", worker, key)
+
+        self.send_task_to_worker(worker, ts.key)
+
+    def worker_slots(self, worker):
+        """ Number of tasks a worker may process before tasks without
+        dependencies or restrictions wait in the queue """
+        if WORKER_SATURATION == float('inf'):
+            return float('inf')
+        return max(1, int(ceil(WORKER_SATURATION * self.ncores[worker])))
+
+    def worker_with_slot(self, ts):
+        """ A worker that may take a task without dependencies or
+        restrictions, or None if all are saturated, see ``worker_slots``
+
+        We prefer idle workers in order of occupancy.  Workers without room
+        for the result of *ts*, see ``over_memory_target``, only get it if
+        all workers are short of room.
+        """
+        open_workers = self.open_workers
+        if not open_workers:
+            return None
+        over = self.over_memory_target
+        for w in self.idle:
+            if w in open_workers and not over(ts, w):
+                return w
+        if len(open_workers) < 20:  # smart but linear in small case
+            roomy = [w for w in open_workers if not over(ts, w)]
+            if roomy:
+                return min(roomy,
+                           key=lambda w: self.occupancy[w] / self.ncores[w])
+        else:  # dumb but fast in large case
+            for w in open_workers:
+                if not over(ts, w):
+                    return w
+        if any(not over(ts, w) for w in self.workers):
+            return None  # wait for a worker with room
+        return min(open_workers,
+                   key=lambda w: self.occupancy[w] / self.ncores[w])
+
+    def _recommend_queued(self, worker, recommendations):
+        """ Recommend queued tasks to fill the free slots of a worker """
+        if self.queued and worker in self.processing:
+            n = self.worker_slots(worker) - len(self.processing[worker])
+            for ts in self.queued.islice(0, max(n, 0)):
+                recommendations.setdefault(ts.key, 'processing')
+
+    def _remove_from_queue(self, ts):
+        self.queued.remove(ts)
+        counts = self.queued_counts
+        if counts[ts.prefix] > 1:
+            counts[ts.prefix] -= 1
+        else:
+            del counts[ts.prefix]
 
-            duration = self.get_task_duration(ks)
-            comm = self.get_comm_cost(key, worker)
+    @property
+    def queued_occupancy(self):
+        """ Expected time to compute all queued tasks """
+        return sum(n * self.task_duration.get(prefix, DEFAULT_TASK_DURATION)
+                   for prefix, n in self.queued_counts.items())
 
-            self.processing[worker][key] = duration + comm
-            self.rprocessing[key] = worker
-            self.occupancy[worker] += duration + comm
-            self.total_occupancy += duration + comm
-            self.task_state[key] = 'processing'
-            self.consume_resources(key, worker)
-            self.check_idle_saturated(worker)
-            self.n_tasks += 1
+    def transition_queued_processing(self, key):
+        try:
+            ts = self.tasks[key]
+
+            if self.validate:
+                assert ts in self.queued
+                assert not ts.dependencies
+                assert not ts.who_has
+                assert not ts.processing_on
+
+            worker = self.worker_with_slot(ts)
+            if worker is None:
+                return {}
 
-            # logger.debug("Send job to worker: %s, %s", worker, key)
+            self._remove_from_queue(ts)
+            self._add_to_processing(ts, worker)
 
-            self.send_task_to_worker(worker, key)
+            return {}
+        except Exception as e:
+            logger.exception(e)
+            if LOG_PDB:
+                import pdb; pdb.set_trace()
+            raise
+
+    def transition_queued_released(self, key):
+        try:
+            ts = self.tasks[key]
 
             if self.validate:
-                assert key not in self.waiting
+                assert ts.state == 'queued'
+                assert not ts.who_has
+                assert not ts.processing_on
+
+            self._remove_from_queue(ts)
+            ts.state = 'released'
+            ts.waiters.clear()
 
             return {}
         except Exception as e:
@@ -2235,61 +3044,27 @@ class Scheduler(ServerNode):
 
     def transition_waiting_memory(self, key, nbytes=None, worker=None, **kwargs):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
-                assert key not in self.rprocessing
-                assert key in self.waiting
-                assert self.task_state[key] == 'waiting'
+                assert not ts.processing_on
+                assert ts.state == 'waiting'
 
-            del self.waiting[key]
+            ts.waiting_on.clear()
 
             if nbytes is not None:
-                self.nbytes[key] = nbytes
-
-            if key not in self.who_has:
-                self.who_has[key] = set()
-
-            self.who_has[key].add(worker)
-            self.has_what[worker].add(key)
-            self.worker_bytes[worker] += nbytes or DEFAULT_DATA_SIZE
+                ts.nbytes = nbytes
 
             self.check_idle_saturated(worker)
 
             recommendations = OrderedDict()
 
-            deps = self.dependents.get(key, [])
-            if len(deps) > 1:
-                deps = sorted(deps, key=self.priority.get, reverse=True)
-
-            for dep in deps:
-                if dep in self.waiting:
-                    s = self.waiting[dep]
-                    s.remove(key)
-                    if not s:  # new task ready to run
-                        recommendations[dep] = 'processing'
-
-            for dep in self.dependencies.get(key, []):
-                if dep in self.waiting_data:
-                    s = self.waiting_data[dep]
-                    s.remove(key)
-                    if (not s and dep and
-                        dep not in self.who_wants and
-                        not self.waiting_data.get(dep)):
-                        recommendations[dep] = 'released'
-
-            if (not self.waiting_data.get(key) and
-                key not in self.who_wants):
-                recommendations[key] = 'released'
-            else:
-                msg = {'op': 'key-in-memory',
-                       'key': key}
-                self.report(msg)
-
-            self.task_state[key] = 'memory'
+            self._add_to_memory(ts, worker, recommendations)
 
             if self.validate:
-                assert key not in self.rprocessing
-                assert key not in self.waiting
-                assert self.who_has[key]
+                assert not ts.processing_on
+                assert not ts.waiting_on
+                assert ts.who_has
 
             return recommendations
         except Exception as e:
@@ -2301,19 +3076,15 @@ class Scheduler(ServerNode):
     def transition_processing_memory(self, key, nbytes=None, type=None,
             worker=None, startstops=None, **kwargs):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
-                assert key in self.rprocessing
-                w = self.rprocessing[key]
-                assert key in self.processing[w]
-                assert key not in self.waiting
-                assert key not in self.who_has
-                assert key not in self.exceptions_blame
-                # assert all(dep in self.waiting_data[key ] for dep in
-                #         self.dependents[key] if self.task_state[dep] in
-                #         ['waiting', 'queue', 'stacks'])
-                # assert key not in self.nbytes
-
-                assert self.task_state[key] == 'processing'
+                assert ts.processing_on
+                assert key in self.processing[ts.processing_on]
+                assert not ts.waiting_on
+                assert not ts.who_has
+                assert ts.exception_blame is None
+                assert ts.state == 'processing'
 
             if worker not in self.processing:
                 return {key: 'released'}
@@ -2330,56 +3101,29 @@ class Scheduler(ServerNode):
             #############################
             # Update Timing Information #
             #############################
-            if compute_start and self.processing[worker].get(key, True):
+            if compute_start and key not in self.long_running:
                 # Update average task duration for worker
                 info = self.worker_info[worker]
-                ks = key_split(key)
-                old_duration = self.task_duration.get(ks, 0)
-                new_duration = compute_stop - compute_start
-                if not old_duration:
-                    avg_duration = new_duration
-                else:
-                    avg_duration = (0.5 * old_duration
-                                  + 0.5 * new_duration)
-
-                self.task_duration[ks] = avg_duration
-
-                if ks in self.unknown_durations:
-                    for k in self.unknown_durations.pop(ks):
-                        if k in self.rprocessing:
-                            w = self.rprocessing[k]
-                            old = self.processing[w][k]
-                            comm = self.get_comm_cost(k, w)
-                            self.processing[w][k] = avg_duration + comm
-                            self.occupancy[w] += avg_duration + comm - old
-                            self.total_occupancy += avg_duration + comm - old
+                self.record_task_duration(ts.prefix,
+                                          compute_stop - compute_start)
 
                 info['last-task'] = compute_stop
 
             ############################
             # Update State Information #
             ############################
+            self.prefix_stats(ts.prefix).add_success()
             if nbytes is not None:
-                self.nbytes[key] = nbytes
+                ts.nbytes = nbytes
+                self.record_task_nbytes(ts.prefix, nbytes)
 
-            self.who_has[key] = set()
-            self.release_resources(key, worker)
+            self.release_resources(ts, worker)
 
             assert worker
 
-            self.who_has[key].add(worker)
-            self.has_what[worker].add(key)
-            self.worker_bytes[worker] += self.nbytes.get(key,
-                                                         DEFAULT_DATA_SIZE)
-
-            w = self.rprocessing.pop(key)
-            duration = self.processing[w].pop(key)
-            if not self.processing[w]:
-                self.total_occupancy -= self.occupancy[w]
-                self.occupancy[w] = 0
-            else:
-                self.total_occupancy -= duration
-                self.occupancy[w] -= duration
+            w = ts.processing_on
+            self.release_occupancy(ts, w)
+            ts.processing_on = None
             self.check_idle_saturated(w)
             if w != worker:
                 logger.debug("Unexpected worker completed task, likely due to"
@@ -2395,44 +3139,15 @@ class Scheduler(ServerNode):
 
             recommendations = OrderedDict()
 
-            deps = self.dependents.get(key, [])
-            if len(deps) > 1:
-                deps = sorted(deps, key=self.priority.get, reverse=True)
-
-            for dep in deps:
-                if dep in self.waiting:
-                    s = self.waiting[dep]
-                    s.remove(key)
-                    if not s:  # new task ready to run
-                        recommendations[dep] = 'processing'
-
-            for dep in self.dependencies.get(key, []):
-                if dep in self.waiting_data:
-                    s = self.waiting_data[dep]
-                    s.remove(key)
-                    if (not s and dep and
-                        dep not in self.who_wants and
-                        not self.waiting_data.get(dep)):
-                        recommendations[dep] = 'released'
-
-            if (not self.waiting_data.get(key) and
-                key not in self.who_wants):
-                recommendations[key] = 'released'
-            else:
-                msg = {'op': 'key-in-memory',
-                       'key': key}
-                if type is not None:
-                    msg['type'] = type
-                self.report(msg)
-
-            self.task_state[key] = 'memory'
+            self._recommend_queued(w, recommendations)
+            self._add_to_memory(ts, worker, recommendations, type=type)
 
             if key in self.wants_what['fire-and-forget']:
                 self.client_releases_keys(client='fire-and-forget', keys=[key])
 
             if self.validate:
-                assert key not in self.rprocessing
-                assert key not in self.waiting
+                assert not ts.processing_on
+                assert not ts.waiting_on
 
             return recommendations
         except Exception as e:
@@ -2441,58 +3156,93 @@ class Scheduler(ServerNode):
                 import pdb; pdb.set_trace()
             raise
 
+    def _add_to_memory(self, ts, worker, recommendations, type=None):
+        """ Add *ts* to the set of in-memory tasks held by *worker*
+
+        Dependents that were only waiting on *ts* become ready to run and
+        dependencies that no longer have anyone waiting on them are released.
+        """
+        key = ts.key
+
+        if not ts.who_has:
+            ts.who_has = set()
+        ts.who_has.add(worker)
+        self.has_what[worker].add(key)
+        self.add_worker_bytes(worker, ts.get_nbytes())
+
+        deps = ts.dependents
+        if len(deps) > 1:
+            deps = sorted(deps, key=attrgetter('priority'), reverse=True)
+
+        for dts in deps:
+            s = dts.waiting_on
+            if ts in s:
+                s.remove(ts)
+                if not s:  # new task ready to run
+                    recommendations[dts.key] = 'processing'
+
+        for dts in ts.dependencies:
+            s = dts.waiters
+            if ts in s:
+                s.remove(ts)
+                if not s and not dts.who_wants:
+                    recommendations[dts.key] = 'released'
+
+        if not ts.waiters and not ts.who_wants:
+            recommendations[key] = 'released'
+        else:
+            msg = {'op': 'key-in-memory',
+                   'key': key}
+            if type is not None:
+                msg['type'] = type
+            self.report(msg)
+
+        ts.state = 'memory'
+
     def transition_memory_released(self, key, safe=False):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
-                assert key in self.who_has
-                assert key not in self.released
-                # assert key not in self.readyset
-                assert key not in self.waiting
-                assert key not in self.rprocessing
+                assert not ts.waiting_on
+                assert not ts.processing_on
                 if safe:
-                    assert not self.waiting_data.get(key)
-                # assert key not in self.who_wants
+                    assert not ts.waiters
 
             recommendations = OrderedDict()
 
-            for dep in self.waiting_data.get(key, ()):  # lost dependency
-                dep_state = self.task_state[dep]
-                if dep_state in ('no-worker', 'processing'):
-                    recommendations[dep] = 'waiting'
-                if dep_state == 'waiting':
-                    self.waiting[dep].add(key)
+            for dts in ts.waiters:  # lost dependency
+                if dts.state in ('no-worker', 'processing'):
+                    recommendations[dts.key] = 'waiting'
+                elif dts.state == 'waiting':
+                    dts.waiting_on.add(ts)
 
-            workers = self.who_has.pop(key)
-            for w in workers:
+            for w in ts.who_has:
                 if w in self.worker_info:  # in case worker has died
                     self.has_what[w].remove(key)
-                    self.worker_bytes[w] -= self.nbytes.get(key,
-                                                            DEFAULT_DATA_SIZE)
+                    self.worker_bytes[w] -= ts.get_nbytes()
                     try:
                         self.worker_comms[w].send({'op': 'delete-data',
                                                    'keys': [key],
                                                    'report': False})
                     except EnvironmentError:
                         self.loop.add_callback(self.remove_worker, address=w)
+            ts.who_has = _NO_WORKERS
 
-            self.released.add(key)
-
-            self.task_state[key] = 'released'
+            ts.state = 'released'
             self.report({'op': 'lost-data', 'key': key})
 
-            if key not in self.tasks: # pure data
+            if ts.run_spec is None:  # pure data
                 recommendations[key] = 'forgotten'
-            elif not all(dep in self.task_state
-                         for dep in self.dependencies[key]):
+            elif any(dts.state == 'forgotten' for dts in ts.dependencies):
                 recommendations[key] = 'forgotten'
-            elif key in self.who_wants or self.waiting_data.get(key):
+            elif ts.who_wants or ts.waiters:
                 recommendations[key] = 'waiting'
 
-            if key in self.waiting_data:
-                del self.waiting_data[key]
+            ts.waiters.clear()
 
             if self.validate:
-                assert key not in self.waiting
+                assert not ts.waiting_on
 
             return recommendations
         except Exception as e:
@@ -2503,29 +3253,30 @@ class Scheduler(ServerNode):
 
     def transition_released_erred(self, key):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
                 with log_errors(pdb=LOG_PDB):
-                    assert key in self.exceptions_blame
-                    assert key not in self.who_has
-                    assert key not in self.waiting
-                    assert key not in self.waiting_data
+                    assert ts.exception_blame is not None
+                    assert not ts.who_has
+                    assert not ts.waiting_on
+                    assert not ts.waiters
 
             recommendations = {}
 
-            failing_key = self.exceptions_blame[key]
+            failing_ts = ts.exception_blame
 
-            for dep in self.dependents[key]:
-                self.exceptions_blame[dep] = failing_key
-                if dep not in self.who_has:
-                    recommendations[dep] = 'erred'
+            for dts in ts.dependents:
+                dts.exception_blame = failing_ts
+                if not dts.who_has:
+                    recommendations[dts.key] = 'erred'
 
             self.report({'op': 'task-erred',
                          'key': key,
-                         'exception': self.exceptions[failing_key],
-                         'traceback': self.tracebacks.get(failing_key, None)})
+                         'exception': failing_ts.exception,
+                         'traceback': failing_ts.traceback})
 
-            self.task_state[key] = 'erred'
-            self.released.remove(key)
+            ts.state = 'erred'
 
             # TODO: waiting data?
             return recommendations
@@ -2537,40 +3288,38 @@ class Scheduler(ServerNode):
 
     def transition_waiting_released(self, key):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
-                assert key in self.waiting
-                assert key in self.waiting_data
-                assert key not in self.who_has
-                assert key not in self.rprocessing
+                assert not ts.who_has
+                assert not ts.processing_on
 
             recommendations = {}
 
-            del self.waiting[key]
+            ts.waiting_on.clear()
 
-            for dep in self.dependencies[key]:
-                if dep in self.waiting_data:
-                    if key in self.waiting_data[dep]:
-                        self.waiting_data[dep].remove(key)
-                    if not self.waiting_data[dep] and dep not in self.who_wants:
-                        recommendations[dep] = 'released'
-                    assert self.task_state[dep] != 'erred'
+            for dts in ts.dependencies:
+                if dts.state in _WAITING_DATA_STATES:
+                    s = dts.waiters
+                    if ts in s:
+                        s.remove(ts)
+                    if not s and not dts.who_wants:
+                        recommendations[dts.key] = 'released'
+                    assert dts.state != 'erred'
 
-            self.task_state[key] = 'released'
-            self.released.add(key)
+            ts.state = 'released'
 
             if self.validate:
-                assert not any(key in self.waiting_data.get(dep, ())
-                               for dep in self.dependencies[key])
+                assert not any(ts in dts.waiters for dts in ts.dependencies)
 
-            if any(dep not in self.task_state for dep in
-                    self.dependencies[key]):
+            if any(dts.state == 'forgotten' for dts in ts.dependencies):
                 recommendations[key] = 'forgotten'
 
-            elif (key not in self.exceptions_blame and
-                 (key in self.who_wants or self.waiting_data.get(key))):
+            elif (ts.exception_blame is None and
+                  (ts.who_wants or ts.waiters)):
                 recommendations[key] = 'waiting'
 
-            del self.waiting_data[key]
+            ts.waiters.clear()
 
             return recommendations
         except Exception as e:
@@ -2581,41 +3330,41 @@ class Scheduler(ServerNode):
 
     def transition_processing_released(self, key):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
-                assert key in self.rprocessing
-                assert key not in self.who_has
-                assert self.task_state[key] == 'processing'
+                assert ts.processing_on
+                assert not ts.who_has
+                assert ts.state == 'processing'
 
-            w = self.rprocessing.pop(key)
+            w = ts.processing_on
+            ts.processing_on = None
             if w in self.workers:
-                duration = self.processing[w].pop(key)
-                self.occupancy[w] -= duration
-                self.total_occupancy -= duration
+                self.release_occupancy(ts, w)
                 self.check_idle_saturated(w)
-                self.release_resources(key, w)
+                self.release_resources(ts, w)
                 self.worker_comms[w].send({'op': 'release-task', 'key': key})
 
-            self.released.add(key)
-            self.task_state[key] = 'released'
+            ts.state = 'released'
 
             recommendations = OrderedDict()
+            self._recommend_queued(w, recommendations)
 
-            if any(dep not in self.task_state
-                   for dep in self.dependencies[key]):
+            if any(dts.state == 'forgotten' for dts in ts.dependencies):
                 recommendations[key] = 'forgotten'
-            elif self.waiting_data[key] or key in self.who_wants:
+            elif ts.waiters or ts.who_wants:
                 recommendations[key] = 'waiting'
             else:
-                for dep in self.dependencies[key]:
-                    if dep not in self.released:
-                        assert key in self.waiting_data[dep]
-                        self.waiting_data[dep].remove(key)
-                        if not self.waiting_data[dep] and dep not in self.who_wants:
-                            recommendations[dep] = 'released'
-                del self.waiting_data[key]
+                for dts in ts.dependencies:
+                    if dts.state != 'released':
+                        s = dts.waiters
+                        s.remove(ts)
+                        if not s and not dts.who_wants:
+                            recommendations[dts.key] = 'released'
+                ts.waiters.clear()
 
             if self.validate:
-                assert key not in self.rprocessing
+                assert not ts.processing_on
 
             return recommendations
         except Exception as e:
@@ -2627,59 +3376,60 @@ class Scheduler(ServerNode):
     def transition_processing_erred(self, key, cause=None, exception=None,
             traceback=None, **kwargs):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
-                assert cause or key in self.exceptions_blame
-                assert key in self.rprocessing
-                assert key not in self.who_has
-                assert key not in self.waiting
+                assert cause or ts.exception_blame is not None
+                assert ts.processing_on
+                assert not ts.who_has
+                assert not ts.waiting_on
 
             if exception:
-                self.exceptions[key] = exception
+                ts.exception = exception
             if traceback:
-                self.tracebacks[key] = traceback
+                ts.traceback = traceback
             if cause:
-                self.exceptions_blame[key] = cause
+                ts.exception_blame = self.tasks[cause]
 
-            failing_key = self.exceptions_blame[key]
+            self.prefix_stats(ts.prefix).add_failure()
+            failing_ts = ts.exception_blame
 
             recommendations = {}
 
-            for dep in self.dependents[key]:
-                self.exceptions_blame[dep] = key
-                recommendations[dep] = 'erred'
-
-            for dep in self.dependencies.get(key, []):
-                if dep in self.waiting_data:
-                    s = self.waiting_data[dep]
-                    if key in s:
-                        s.remove(key)
-                    if (not s and dep and
-                        dep not in self.who_wants and
-                        not self.waiting_data.get(dep)):
-                        recommendations[dep] = 'released'
-
-            w = self.rprocessing.pop(key)
+            for dts in ts.dependents:
+                dts.exception_blame = failing_ts
+                recommendations[dts.key] = 'erred'
+
+            for dts in ts.dependencies:
+                if dts.state in _WAITING_DATA_STATES:
+                    s = dts.waiters
+                    if ts in s:
+                        s.remove(ts)
+                    if not s and not dts.who_wants:
+                        recommendations[dts.key] = 'released'
+
+            w = ts.processing_on
+            ts.processing_on = None
             if w in self.processing:
-                duration = self.processing[w].pop(key)
-                self.occupancy[w] -= duration
-                self.total_occupancy -= duration
+                self.release_occupancy(ts, w)
                 self.check_idle_saturated(w)
-                self.release_resources(key, w)
+                self.release_resources(ts, w)
+                self._recommend_queued(w, recommendations)
 
-            del self.waiting_data[key]  # do anything with this?
+            ts.waiters.clear()  # do anything with this?
 
-            self.task_state[key] = 'erred'
+            ts.state = 'erred'
 
             self.report({'op': 'task-erred',
                          'key': key,
-                         'exception': self.exceptions[failing_key],
-                         'traceback': self.tracebacks.get(failing_key)})
+                         'exception': failing_ts.exception,
+                         'traceback': failing_ts.traceback})
 
             if key in self.wants_what['fire-and-forget']:
                 self.client_releases_keys(client='fire-and-forget', keys=[key])
 
             if self.validate:
-                assert key not in self.rprocessing
+                assert not ts.processing_on
 
             return recommendations
         except Exception as e:
@@ -2689,84 +3439,56 @@ class Scheduler(ServerNode):
             raise
 
     def remove_key(self, key):
-        if key in self.tasks:
-            del self.tasks[key]
-        del self.task_state[key]
-        if key in self.dependencies:
-            del self.dependencies[key]
-        del self.dependents[key]
-        if key in self.worker_restrictions:
-            del self.worker_restrictions[key]
-        if key in self.host_restrictions:
-            del self.host_restrictions[key]
-        if key in self.loose_restrictions:
-            self.loose_restrictions.remove(key)
-        if key in self.priority:
-            del self.priority[key]
-        if key in self.exceptions:
-            del self.exceptions[key]
-        if key in self.exceptions_blame:
-            del self.exceptions_blame[key]
-        if key in self.released:
-            self.released.remove(key)
-        if key in self.waiting_data:
-            del self.waiting_data[key]
-        if key in self.suspicious_tasks:
-            del self.suspicious_tasks[key]
-        if key in self.nbytes:
-            del self.nbytes[key]
-        if key in self.resource_restrictions:
-            del self.resource_restrictions[key]
+        ts = self.tasks.pop(key)
+        ts.state = 'forgotten'
+        self.unrunnable.discard(ts)
 
     def transition_memory_forgotten(self, key):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
-                assert key in self.dependents
-                assert self.task_state[key] == 'memory'
-                assert key in self.waiting_data
-                assert key in self.who_has
-                assert key not in self.rprocessing
-                # assert key not in self.ready
-                assert key not in self.waiting
+                assert ts.state == 'memory'
+                assert not ts.processing_on
+                assert not ts.waiting_on
 
             recommendations = {}
 
-            for dep in self.waiting_data[key]:
-                recommendations[dep] = 'forgotten'
+            for dts in ts.waiters:
+                recommendations[dts.key] = 'forgotten'
 
-            for dep in self.dependents[key]:
-                if self.task_state[dep] == 'released':
-                    recommendations[dep] = 'forgotten'
+            for dts in ts.dependents:
+                if dts.state == 'released':
+                    recommendations[dts.key] = 'forgotten'
 
-            for dep in self.dependencies.get(key, ()):
-                try:
-                    s = self.dependents[dep]
-                    s.remove(key)
-                    if not s and dep not in self.who_wants:
-                        assert dep is not key
-                        recommendations[dep] = 'forgotten'
-                except KeyError:
-                    pass
-
-            workers = self.who_has.pop(key)
-            for w in workers:
+            for dts in ts.dependencies:
+                if dts.state == 'forgotten':
+                    continue
+                s = dts.dependents
+                if ts in s:
+                    s.remove(ts)
+                    if not s and not dts.who_wants:
+                        assert dts is not ts
+                        recommendations[dts.key] = 'forgotten'
+
+            for w in ts.who_has:
                 if w in self.worker_info:  # in case worker has died
                     self.has_what[w].remove(key)
-                    self.worker_bytes[w] -= self.nbytes.get(key,
-                                                            DEFAULT_DATA_SIZE)
+                    self.worker_bytes[w] -= ts.get_nbytes()
                     try:
                         self.worker_comms[w].send({'op': 'delete-data',
                                                      'keys': [key], 'report': False})
                     except EnvironmentError:
                         self.loop.add_callback(self.remove_worker, address=w)
+            ts.who_has = _NO_WORKERS
 
             if self.validate:
-                assert all(key not in self.dependents[dep]
-                            for dep in self.dependencies[key]
-                            if dep in self.task_state)
-                assert all(key not in self.waiting_data.get(dep, ())
-                            for dep in self.dependencies[key]
-                            if dep in self.task_state)
+                assert all(ts not in dts.dependents
+                           for dts in ts.dependencies
+                           if dts.state != 'forgotten')
+                assert all(ts not in dts.waiters
+                           for dts in ts.dependencies
+                           if dts.state != 'forgotten')
 
             self.remove_key(key)
 
@@ -2781,21 +3503,20 @@ class Scheduler(ServerNode):
 
     def transition_no_worker_released(self, key):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
-                assert self.task_state[key] == 'no-worker'
-                assert key not in self.who_has
+                assert ts.state == 'no-worker'
+                assert not ts.who_has
+                assert not ts.waiting_on
 
-            self.unrunnable.remove(key)
-            self.released.add(key)
-            self.task_state[key] = 'released'
+            self.unrunnable.remove(ts)
+            ts.state = 'released'
 
-            for dep in self.dependencies[key]:
-                try:
-                    self.waiting_data[dep].remove(key)
-                except KeyError:  # dep may also be released
-                    pass
+            for dts in ts.dependencies:
+                dts.waiters.discard(ts)
 
-            del self.waiting_data[key]
+            ts.waiters.clear()
 
             return {}
         except Exception as e:
@@ -2806,52 +3527,46 @@ class Scheduler(ServerNode):
 
     def transition_released_forgotten(self, key):
         try:
+            ts = self.tasks[key]
+
             if self.validate:
-                assert key in self.dependencies
-                assert self.task_state[key] in ('released', 'erred')
-                # assert not self.waiting_data[key]
-                if key in self.tasks and self.dependencies[key].issubset(self.task_state):
-                    assert key not in self.who_wants
-                    assert not self.dependents[key]
-                    assert not any(key in self.waiting_data.get(dep, ())
-                                   for dep in self.dependencies[key])
-                assert key not in self.who_has
-                assert key not in self.rprocessing
-                # assert key not in self.ready
-                assert key not in self.waiting
+                assert ts.state in ('released', 'erred')
+                if (ts.run_spec is not None and
+                        all(dts.state != 'forgotten'
+                            for dts in ts.dependencies)):
+                    assert not ts.who_wants
+                    assert not ts.dependents
+                    assert not any(ts in dts.waiters
+                                   for dts in ts.dependencies)
+                assert not ts.who_has
+                assert not ts.processing_on
+                assert not ts.waiting_on
 
             recommendations = {}
-            for dep in self.dependencies[key]:
-                try:
-                    s = self.dependents[dep]
-                    s.remove(key)
-                    if not s and dep not in self.who_wants:
-                        assert dep is not key
-                        recommendations[dep] = 'forgotten'
-                except KeyError:
-                    pass
-
-            for dep in self.dependents[key]:
-                if self.task_state[dep] not in ('memory', 'error'):
-                    recommendations[dep] = 'forgotten'
-
-            for dep in self.dependents[key]:
-                if self.task_state[dep] == 'released':
-                    recommendations[dep] = 'forgotten'
-
-            for dep in self.dependencies[key]:
-                try:
-                    self.waiting_data[dep].remove(key)
-                except KeyError:
-                    pass
+            for dts in ts.dependencies:
+                if dts.state == 'forgotten':
+                    continue
+                s = dts.dependents
+                if ts in s:
+                    s.remove(ts)
+                    if not s and not dts.who_wants:
+                        assert dts is not ts
+                        recommendations[dts.key] = 'forgotten'
+
+            for dts in ts.dependents:
+                if dts.state != 'memory':
+                    recommendations[dts.key] = 'forgotten'
+
+            for dts in ts.dependencies:
+                dts.waiters.discard(ts)
 
             if self.validate:
-                assert all(key not in self.dependents[dep]
-                            for dep in self.dependencies[key]
-                            if dep in self.task_state)
-                assert all(key not in self.waiting_data.get(dep, ())
-                            for dep in self.dependencies[key]
-                            if dep in self.task_state)
+                assert all(ts not in dts.dependents
+                           for dts in ts.dependencies
+                           if dts.state != 'forgotten')
+                assert all(ts not in dts.waiters
+                           for dts in ts.dependencies
+                           if dts.state != 'forgotten')
 
             self.remove_key(key)
 
@@ -2881,10 +3596,10 @@ class Scheduler(ServerNode):
         Scheduler.transitions: transitive version of this function
         """
         try:
-            try:
-                start = self.task_state[key]
-            except KeyError:
+            ts = self.tasks.get(key)
+            if ts is None:
                 return {}
+            start = ts.state
             if start == finish:
                 return {}
 
@@ -2902,7 +3617,7 @@ class Scheduler(ServerNode):
                 a.update(b)
                 recommendations = a
                 start = 'released'
-            finish2 = self.task_state.get(key, 'forgotten')
+            finish2 = ts.state
             self.transition_log.append((key, start, finish2, recommendations,
                                         self._transition_counter))
             self._transition_counter += 1
@@ -2950,20 +3665,44 @@ class Scheduler(ServerNode):
     # Assigning Tasks to Workers #
     ##############################
 
+    def _rekey_idle(self, worker):
+        """ Move an idle worker to its place for its current occupancy
+
+        The sort key of a worker must not change while it is in the set, so
+        it is reinserted whenever its occupancy changes.
+        """
+        key = self._idle_key.get(worker)
+        if key is not None:
+            new = (self.occupancy[worker] / self.ncores[worker], worker)
+            if key != new:
+                self.idle.remove(worker)
+                self._idle_key[worker] = new
+                self.idle.add(worker)
+
     def check_idle_saturated(self, worker):
         occ = self.occupancy[worker]
         nc = self.ncores[worker]
         p = len(self.processing[worker])
 
+        if p < self.worker_slots(worker):
+            self.open_workers.add(worker)
+        else:
+            self.open_workers.discard(worker)
+
         avg = self.total_occupancy / self.total_ncores
 
         if p < nc or occ / nc < avg / 2:
-            self.idle.add(worker)
+            if worker in self.idle:
+                self._rekey_idle(worker)
+            else:
+                self._idle_key[worker] = (occ / nc, worker)
+                self.idle.add(worker)
             if worker in self.saturated:
                 self.saturated.remove(worker)
         else:
             if worker in self.idle:
                 self.idle.remove(worker)
+                del self._idle_key[worker]
 
             pending = occ * (p - nc) / p / nc
             if p > nc and pending > 0.4 and pending > 1.9 * avg:
@@ -2971,8 +3710,8 @@ class Scheduler(ServerNode):
             elif worker in self.saturated:
                 self.saturated.remove(worker)
 
-    def valid_workers(self, key):
-        """ Return set of currently valid worker addresses for key
+    def valid_workers(self, ts):
+        """ Return set of currently valid worker addresses for a task
 
         If all workers are valid then this returns ``True``.
         This checks tracks the following state:
@@ -2983,14 +3722,14 @@ class Scheduler(ServerNode):
         """
         s = True
 
-        if key in self.worker_restrictions:
-            s = {w for w in self.worker_restrictions[key] if w in
+        if ts.worker_restrictions:
+            s = {w for w in ts.worker_restrictions if w in
                     self.worker_info}
 
-        if key in self.host_restrictions:
+        if ts.host_restrictions:
             # Resolve the alias here rather than early, for the worker
             # may not be connected when host_restrictions is populated
-            hr = [self.coerce_hostname(h) for h in self.host_restrictions[key]]
+            hr = [self.coerce_hostname(h) for h in ts.host_restrictions]
             ss = [self.host_info[h]['addresses']
                   for h in hr if h in self.host_info]
             ss = set.union(*ss) if ss else set()
@@ -2999,10 +3738,10 @@ class Scheduler(ServerNode):
             else:
                 s |= ss
 
-        if self.resource_restrictions.get(key):
+        if ts.resource_restrictions:
             w = {resource: {w for w, supplied in self.resources[resource].items()
                               if supplied >= required}
-                 for resource, required in self.resource_restrictions[key].items()}
+                 for resource, required in ts.resource_restrictions.items()}
 
             ww = set.intersection(*w.values())
 
@@ -3013,14 +3752,14 @@ class Scheduler(ServerNode):
 
         return s
 
-    def consume_resources(self, key, worker):
-        if key in self.resource_restrictions:
-            for r, required in self.resource_restrictions[key].items():
+    def consume_resources(self, ts, worker):
+        if ts.resource_restrictions:
+            for r, required in ts.resource_restrictions.items():
                 self.used_resources[worker][r] += required
 
-    def release_resources(self, key, worker):
-        if key in self.resource_restrictions:
-            for r, required in self.resource_restrictions[key].items():
+    def release_resources(self, ts, worker):
+        if ts.resource_restrictions:
+            for r, required in ts.resource_restrictions.items():
                 self.used_resources[worker][r] -= required
 
     #####################
@@ -3105,162 +3844,194 @@ class Scheduler(ServerNode):
             )
         return self._ipython_kernel.get_connection_info()
 
-    def worker_objective(self, key, worker):
+    def worker_objective(self, ts, worker):
         """
-        Objective function to determine which worker should get the key
+        Objective function to determine which worker should get the task
 
-        Minimize expected start time.  If a tie then break with data storate.
+        Avoid workers whose projected memory, counting the data they hold,
+        the expected results of the tasks they process, the dependencies
+        sent to them and the expected result of the task, passes
+        ``MEMORY_TARGET`` of their memory limit.  Then minimize expected start
+        time.  If a tie then break with projected memory.
         """
-        comm_bytes = sum([self.nbytes.get(k, DEFAULT_DATA_SIZE)
-                          for k in self.dependencies[key]
-                          if worker not in self.who_has[k]])
-        stack_time = self.occupancy[worker] / self.ncores[worker]
+        comm_bytes = sum([dts.get_nbytes()
+                          for dts in ts.dependencies
+                          if worker not in dts.who_has])
+        row = self.worker_index.rows[worker]
+        stack_time = self.occupancy.data[row] / self.ncores.data[row]
         start_time = comm_bytes / BANDWIDTH + stack_time
-        return (start_time, self.worker_bytes[worker])
-
-    ###########
-    # Cleanup #
-    ###########
-
-    async def reevaluate_occupancy(self):
-        """ Periodically reassess task duration time
-
-        The expected duration of a task can change over time.  Unfortunately we
-        don't have a good constant-time way to propagate the effects of these
-        changes out to the summaries that they affect, like the total expected
-        runtime of each of the workers, or what tasks are stealable.
-
-        In this coroutine we walk through all of the workers and re-align their
-        estimates with the current state of tasks.  We do this periodically
-        rather than at every transition, and we only do it if the scheduler
-        process isn't under load (using psutil.Process.cpu_percent()).  This
-        lets us avoid this fringe optimization when we have better things to
-        think about.
+        projected = (self.worker_bytes.data[row]
+                     + self.processing_bytes.data[row]
+                     + comm_bytes + self.get_task_nbytes(ts))
+        limit = self.memory_limit.data[row]
+        full = bool(limit) and projected > MEMORY_TARGET * limit
+        return (full, start_time, projected)
+
+    def over_memory_target(self, ts, worker):
+        """ Whether running *ts* on *worker* would take the worker's
+        projected memory past its target, see ``worker_objective`` """
+        if not self.memory_limit.data[self.worker_index.rows[worker]]:
+            return False
+        return self.worker_objective(ts, worker)[0]
+
+    def choose_worker(self, ts, workers):
         """
-        DELAY = 0.1
-        with log_errors():
-            import psutil
-            proc = psutil.Process()
-
-            while self.status != 'closed':
-                await asyncio.sleep(DELAY)
-                while not self.rprocessing:
-                    await asyncio.sleep(DELAY)
-                last = time()
+        Choose the worker among *workers* that minimizes ``worker_objective``
 
-                for w, processing in list(self.processing.items()):
-                    while proc.cpu_percent() > 50:
-                        await asyncio.sleep(DELAY)
-                        last = time()
-
-                    if w not in self.workers or not processing:
-                        continue
-
-                    self._reevaluate_occupancy_worker(w)
-
-                    duration = time() - last
-                    if duration > 0.005:  # 5ms since last release
-                        await asyncio.sleep(duration * 5)  # 25ms gap
-                        last = time()
-
-    def _reevaluate_occupancy_worker(self, worker):
-        """ See reevaluate_occupancy """
-        w = worker
-        processing = self.processing[w]
-        if not processing or w not in self.workers or self.status == 'closed':
-            return
-        old = self.occupancy[w]
-
-        new = 0
-        nbytes = 0
-        for key in processing:
-            duration = self.get_task_duration(key)
-            comm = self.get_comm_cost(key, worker)
-            processing[key] = duration + comm
-            new += duration + comm
-
-        self.occupancy[w] = new
-        self.total_occupancy += new - old
-        self.check_idle_saturated(w)
-
-        if new > old * 1.3:  # significant increase in duration
-            steal = self.extensions['stealing']
-            for key in processing:
-                steal.remove_key_from_stealable(key)
-                steal.put_key_in_stealable(key)
-
-
-def decide_worker(dependencies, occupancy, who_has, valid_workers,
-                  loose_restrictions, objective, key):
+        Rather than summing dependency sizes once per candidate worker we walk
+        the dependencies of *ts* once, tallying bytes held by each worker.
+        Dependencies replicated on most candidates are tallied by the workers
+        that lack them instead.  Large sets of candidates are then scored
+        together as NumPy arrays.
+        """
+        comm_bytes = 0  # bytes to move to a worker that holds nothing
+        held = {}  # bytes saved on each worker
+        candidates = None
+        for dts in ts.dependencies:
+            nbytes = dts.get_nbytes()
+            who_has = dts.who_has
+            if 2 * len(who_has) < len(workers):
+                comm_bytes += nbytes
+                for w in who_has:
+                    held[w] = held.get(w, 0) + nbytes
+            else:
+                if candidates is None:
+                    candidates = (workers if isinstance(workers, set)
+                                  else set(workers))
+                for w in candidates.difference(who_has):
+                    held[w] = held.get(w, 0) - nbytes
+
+        occupancy = self.occupancy
+        ncores = self.ncores
+        memory_limit = self.memory_limit
+        output_bytes = self.get_task_nbytes(ts)
+
+        if np is None or len(workers) < BATCH_SCORE_WORKERS:
+            # Read the columns' storage directly, as this runs per worker
+            rows = self.worker_index.rows
+            occ, nc = occupancy.data, ncores.data
+            nb, pb = self.worker_bytes.data, self.processing_bytes.data
+            limits = memory_limit.data
+
+            def objective(w):
+                row = rows[w]
+                comm = comm_bytes - held.get(w, 0)
+                projected = nb[row] + pb[row] + comm + output_bytes
+                limit = limits[row]
+                return (bool(limit) and projected > MEMORY_TARGET * limit,
+                        comm / BANDWIDTH + occ[row] / nc[row],
+                        projected)
+
+            return min(workers, key=objective)
+
+        workers = list(workers)
+        n = len(workers)
+        rows = self.worker_index.select(workers)
+        start_time = occupancy.take(rows) / ncores.take(rows)
+        projected = (self.worker_bytes.take(rows)
+                     + self.processing_bytes.take(rows) + output_bytes)
+        if comm_bytes or held:
+            saved = np.fromiter(map(held.get, workers, repeat(0)), 'f8', n)
+            start_time += (comm_bytes - saved) / BANDWIDTH
+            projected += comm_bytes - saved
+        if memory_limit.total:
+            limits = memory_limit.take(rows)
+            full = (limits > 0) & (projected > MEMORY_TARGET * limits)
+            if full.any() and not full.all():
+                start_time[full] = np.inf
+        best = np.flatnonzero(start_time == start_time.min())
+        if len(best) > 1:  # break ties with projected memory
+            return workers[best[projected[best].argmin()]]
+        return workers[best[0]]
+
+
+def decide_worker(ts, all_workers, valid_workers, choose):
     """
-    Decide which worker should take task
-
-    >>> dependencies = {'c': {'b'}, 'b': {'a'}}
-    >>> occupancy = {'alice:8000': 0, 'bob:8000': 0}
-    >>> who_has = {'a': {'alice:8000'}}
-    >>> nbytes = {'a': 100}
-    >>> ncores = {'alice:8000': 1, 'bob:8000': 1}
-    >>> valid_workers = True
-    >>> loose_restrictions = set()
-
-    We choose the worker that has the data on which 'b' depends (alice has 'a')
-
-    >>> decide_worker(dependencies, occupancy, who_has, has_what,
-    ...               valid_workers, loose_restrictions, nbytes, ncores, 'b')
-    'alice:8000'
-
-    If both Alice and Bob have dependencies then we choose the less-busy worker
+    Decide which worker should take task *ts*
 
-    >>> who_has = {'a': {'alice:8000', 'bob:8000'}}
-    >>> has_what = {'alice:8000': {'a'}, 'bob:8000': {'a'}}
-    >>> decide_worker(dependencies, who_has, has_what,
-    ...               valid_workers, loose_restrictions, nbytes, ncores, 'b')
-    'bob:8000'
+    We choose the worker that has the data on which *ts* depends.
 
-    Optionally provide valid workers of where jobs are allowed to occur
+    If several workers have dependencies then we choose the less-busy worker,
+    as chosen by ``choose(ts, workers)``.
 
-    >>> valid_workers = {'alice:8000', 'charlie:8000'}
-    >>> decide_worker(dependencies, who_has, has_what,
-    ...               valid_workers, loose_restrictions, nbytes, ncores, 'b')
-    'alice:8000'
+    Optionally provide *valid_workers* of where jobs are allowed to occur
+    (pass ``True`` if all workers are allowed to take the task).
 
-    If the task requires data communication, then we choose to minimize the
-    number of bytes sent between workers. This takes precedence over worker
-    occupancy.
-
-    >>> dependencies = {'c': {'a', 'b'}}
-    >>> who_has = {'a': {'alice:8000'}, 'b': {'bob:8000'}}
-    >>> has_what = {'alice:8000': {'a'}, 'bob:8000': {'b'}}
-    >>> nbytes = {'a': 1, 'b': 1000}
-
-    >>> decide_worker(dependencies, who_has, has_what,
-    ...               {}, set(), nbytes, ncores, 'c')
-    'bob:8000'
+    If the task requires data communication, then *choose* should also
+    account for the number of bytes sent between workers.
     """
-    deps = dependencies[key]
-    assert all(d in who_has for d in deps)
-    workers = frequencies([w for dep in deps
-                             for w in who_has[dep]])
+    deps = ts.dependencies
+    assert all(dts.who_has for dts in deps)
+    workers = set().union(*[dts.who_has for dts in deps])
     if not workers:
-        workers = occupancy
+        workers = all_workers
     if valid_workers is not True:
         workers = valid_workers & set(workers)
         if not workers:
             workers = valid_workers
             if not workers:
-                if key in loose_restrictions:
-                    return decide_worker(dependencies, occupancy, who_has,
-                            True, set(), objective, key)
-
+                if ts.loose_restrictions:
+                    return decide_worker(ts, all_workers, True, choose)
                 else:
                     return None
-    if not workers or not occupancy:
+    if not workers or not all_workers:
         return None
 
     if len(workers) == 1:
         return first(workers)
 
-    return min(workers, key=objective)
+    return choose(ts, workers)
+
+
+def validate_task_state(ts):
+    """
+    Validate a single TaskState and its links to neighbouring tasks
+
+    This raises assert errors if anything doesn't check out.
+    """
+    assert ts.waiting_on.issubset(ts.dependencies), \
+        ("waiting not subset of dependencies", ts, ts.waiting_on)
+    assert ts.waiters.issubset(ts.dependents), \
+        ("waiters not subset of dependents", ts, ts.waiters)
+
+    for dts in ts.waiting_on:
+        assert not dts.who_has, ("waiting on in-memory dep", ts, dts)
+        assert dts.state != 'released', ("waiting on released dep", ts, dts)
+
+    for dts in ts.dependencies:
+        if dts.state != 'forgotten':
+            assert ts in dts.dependents, ("not in dependency's dependents",
+                                          ts, dts)
+        if ts.state in ('waiting', 'processing'):
+            assert dts in ts.waiting_on or dts.who_has, ("dep missing",
+                                                         ts, dts)
+
+    for dts in ts.waiters:
+        assert dts.state in ('waiting', 'processing', 'no-worker'), \
+            ("dependent not in play", ts, dts)
+
+    for dts in ts.dependents:
+        assert ts in dts.dependencies, ("not in dependent's dependencies",
+                                        ts, dts)
+        assert dts.state != 'forgotten', ("forgotten dependent", ts, dts)
+
+    assert (ts.processing_on is not None) == (ts.state == 'processing'), ts
+    assert bool(ts.who_has) == (ts.state == 'memory'), (ts, ts.who_has)
+
+    if ts.state == 'processing':
+        assert all(dts.who_has for dts in ts.dependencies), \
+            ("task processing without all deps", ts)
+        assert not ts.waiting_on
+
+    if ts.state == 'waiting':
+        assert ts.waiting_on or ts.dependencies, ("waiting on nothing", ts)
+
+    if ts.who_has:
+        assert not any(ts in dts.waiting_on for dts in ts.dependents), \
+            ("dependent waiting on in-memory task", ts)
+
+    if ts.who_wants:
+        assert ts.state != 'forgotten', ("wanted task forgotten", ts)
 
 
 def validate_state(dependencies, dependents, waiting, waiting_data, ready,
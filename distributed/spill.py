@@ -0,0 +1,424 @@
+""" Spill-to-disk storage for workers
+
+Values are serialized without compression and each of their frames is written
+at an aligned offset of a file of its own.  Reading a value back maps its file
+into memory, so that NumPy arrays and other objects backed by buffers come
+back as views onto the mapped pages: nothing is copied, and pages are only
+read from disk as they are touched.
+
+``SpillBuffer`` keeps the most recently used values in memory and moves the
+others to disk in a thread of its own, so that the event loop does not wait on
+disk I/O.
+"""
+from __future__ import print_function, division, absolute_import
+
+from collections import MutableMapping, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+import mmap
+import os
+import struct
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+from .metrics import time
+from .protocol import msgpack
+from .protocol.serialize import serialize, deserialize, Serialized
+from .utils import nbytes
+
+
+logger = logging.getLogger(__name__)
+# Frames start at multiples of this many bytes in a file
+ALIGNMENT = 64
+
+
+def _aligned(n):
+    """
+    >>> _aligned(0), _aligned(1), _aligned(64), _aligned(65)
+    (0, 64, 64, 128)
+    """
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def dump_frames(header, frames):
+    """ Lay out a serialized value as it is written to disk
+
+    The file starts with the number of frames, the length of the msgpacked
+    header and the length of each frame, followed by the header.  Then comes
+    each frame, padded so that it starts on an ``ALIGNMENT`` boundary.
+
+    Returns the list of buffers to write, in order.
+
+    See Also
+    --------
+    load_frames
+    """
+    header = msgpack.dumps(header, use_bin_type=True)
+    lengths = [nbytes(frame) for frame in frames]
+    prelude = struct.pack('QQ' + 'Q' * len(frames), len(frames), len(header),
+                          *lengths)
+    buffers = [prelude, header]
+    end = len(prelude) + len(header)
+    for frame, n in zip(frames, lengths):
+        start = _aligned(end)
+        if start > end:
+            buffers.append(b'\x00' * (start - end))
+        buffers.append(frame)
+        end = start + n
+    return buffers
+
+
+def load_frames(buf):
+    """ Split a buffer laid out by ``dump_frames`` into header and frames
+
+    Frames are slices of ``buf``, not copies.
+
+    >>> header, frames = load_frames(b''.join(dump_frames({'x': 1},
+    ...                                                   [b'123', b'4567'])))
+    >>> header
+    {'x': 1}
+    >>> [bytes(frame) for frame in frames]
+    [b'123', b'4567']
+    """
+    buf = memoryview(buf)
+    n_frames, header_length = struct.unpack_from('QQ', buf)
+    lengths = struct.unpack_from('Q' * n_frames, buf, 16)
+    start = 16 + 8 * n_frames
+    header = msgpack.loads(bytes(buf[start:start + header_length]),
+                           encoding='utf8')
+    end = start + header_length
+    frames = []
+    for n in lengths:
+        start = _aligned(end)
+        end = start + n
+        frames.append(buf[start:end])
+    return header, frames
+
+
+class MMapFile(MutableMapping):
+    """ Mutable Mapping of values spilled into a directory
+
+    Each value is serialized into a file of its own, and mapped back into
+    memory when it is read.  The mapping is private and copy-on-write, so that
+    the values we hand out are writable and don't change the file.  Deleting
+    a key removes its file, while values read from it stay valid.
+
+    Parameters
+    ----------
+    directory: string
+    callback: callable, optional
+        Called as ``callback(kind, nbytes, duration)`` after each value is
+        written, with ``kind='spill'``, and after each value is read back,
+        with ``kind='unspill'``
+
+    Examples
+    --------
+    >>> z = MMapFile('storage')  # doctest: +SKIP
+    >>> z['x'] = np.arange(5)  # doctest: +SKIP
+    >>> z['x']  # doctest: +SKIP
+    array([0, 1, 2, 3, 4])
+    """
+    def __init__(self, directory, callback=None):
+        self.directory = directory
+        self.callback = callback
+        self.nbytes = dict()
+        if not os.path.exists(self.directory):
+            os.mkdir(self.directory)
+
+    def __str__(self):
+        return '<MMapFile: %s, %d elements>' % (self.directory, len(self))
+
+    __repr__ = __str__
+
+    def _path(self, key):
+        return os.path.join(self.directory, quote(key, safe=''))
+
+    def _map(self, key):
+        if key not in self.nbytes:
+            raise KeyError(key)
+        with open(self._path(key), 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        return load_frames(mm)
+
+    def __getitem__(self, key):
+        start = time()
+        header, frames = self._map(key)
+        value = deserialize(header, frames)
+        stop = time()
+        if self.callback is not None:
+            self.callback('unspill', self.nbytes[key], stop - start)
+        return value
+
+    def get_serialized(self, key, prefetch=False):
+        """ The serialized value of ``key``, with frames on the mapped pages
+
+        This lets the value be sent to peers without deserializing it.  With
+        ``prefetch=True`` every page is read in before returning, so that
+        later accesses don't wait on the disk.
+        """
+        header, frames = self._map(key)
+        if prefetch:
+            for frame in frames:
+                frame[::mmap.PAGESIZE].tobytes()
+        return Serialized(header, frames)
+
+    def __setitem__(self, key, value):
+        start = time()
+        header, frames = serialize(value)
+        buffers = dump_frames(header, frames)
+        with open(self._path(key), 'wb') as f:
+            for buf in buffers:
+                f.write(buf)
+        stop = time()
+        n = sum(map(nbytes, frames))
+        self.nbytes[key] = n
+        if self.callback is not None:
+            self.callback('spill', n, stop - start)
+
+    def __delitem__(self, key):
+        if key not in self.nbytes:
+            raise KeyError(key)
+        os.remove(self._path(key))
+        del self.nbytes[key]
+
+    def __contains__(self, key):
+        return key in self.nbytes
+
+    def keys(self):
+        return self.nbytes.keys()
+
+    def __iter__(self):
+        return iter(self.nbytes)
+
+    def __len__(self):
+        return len(self.nbytes)
+
+
+class SpillBuffer(MutableMapping):
+    """ Mutable Mapping that spills least recently used values to disk
+
+    This works like ``zict.Buffer``, but writes and reads values on disk in a
+    thread of its own.  Values pushed out of ``fast`` are held in ``spilling``
+    until they are written to ``slow``, and can still be used meanwhile.
+    ``load`` and ``load_serialized`` read values back off the event loop.
+
+    ``on_disk`` holds the keys whose current value is in ``slow``, which may
+    briefly hold stale values as well.
+
+    Plain item access to values on disk still reads them on the calling
+    thread.  The time spent doing so, and removing files, is reported as
+    ``'disk-stall'`` and added up in ``stall_time``.
+
+    Parameters
+    ----------
+    slow: MMapFile
+    n: number
+        How much weight of values to hold in ``fast``
+    weight: callable
+        Weight of a value, called as ``weight(key, value)``
+    callback: callable, optional
+        Called on the event loop as ``callback(kind, nbytes, duration)`` with
+        ``kind`` one of ``'spill'``, ``'unspill'`` and ``'disk-stall'``
+    loop: IOLoop, optional
+        The event loop that uses the buffer, by default the current one
+
+    Examples
+    --------
+    >>> buff = SpillBuffer(MMapFile('storage'), 2e9, weight)  # doctest: +SKIP
+    >>> buff['x'] = x  # doctest: +SKIP
+    >>> yield buff.load(['x'])  # doctest: +SKIP
+    """
+    def __init__(self, slow, n, weight=lambda k, v: 1, callback=None,
+                 loop=None):
+        self.fast = OrderedDict()
+        self.spilling = dict()
+        self.slow = slow
+        self.on_disk = set()
+        self.n = n
+        self.weight = weight
+        self.callback = callback
+        self.weights = dict()
+        self.fast_weight = 0
+        self.stall_time = 0
+        self.executor = ThreadPoolExecutor(1)
+        self.loop = loop or IOLoop.current()
+
+    def __str__(self):
+        return '<SpillBuffer: fast: %d, spilling: %d, slow: %d>' % (
+            len(self.fast), len(self.spilling), len(self.on_disk))
+
+    __repr__ = __str__
+
+    def _record(self, kind, nbytes, duration):
+        if kind == 'disk-stall':
+            self.stall_time += duration
+        if self.callback is not None:
+            self.callback(kind, nbytes, duration)
+
+    def _remove_from_disk(self, key):
+        start = time()
+        n = self.slow.nbytes.get(key, 0)
+        self.on_disk.discard(key)
+        del self.slow[key]
+        self._record('disk-stall', n, time() - start)
+
+    def _put_fast(self, key, value):
+        w = self.weight(key, value)
+        self.fast[key] = value
+        self.weights[key] = w
+        self.fast_weight += w
+
+    def _pop_fast(self, key):
+        value = self.fast.pop(key)
+        self.fast_weight -= self.weights.pop(key)
+        return value
+
+    def _submit(self, func, *args):
+        """ Run ``func(*args)`` in the I/O thread, with a Future of the loop """
+        result = Future()
+
+        def copy(future):
+            try:
+                result.set_result(future.result())
+            except Exception as e:
+                result.set_exception(e)
+
+        self.loop.add_future(self.executor.submit(func, *args), copy)
+        return result
+
+    def _write(self, key, value):
+        start = time()
+        self.slow[key] = value
+        return time() - start
+
+    def evict(self):
+        """ Start spilling least recently used values until under ``n`` """
+        if self.fast_weight <= self.n:
+            return
+        while self.fast_weight > self.n and self.fast:
+            key = next(iter(self.fast))
+            value = self._pop_fast(key)
+            self.spilling[key] = value
+            self.loop.add_future(self.executor.submit(self._write, key, value),
+                                 partial(self._spilled, key, value))
+
+    def _spilled(self, key, value, future):
+        current = self.spilling.get(key) is value
+        if current:
+            del self.spilling[key]
+        try:
+            duration = future.result()
+        except Exception:
+            logger.exception("Failed to spill %s to disk", key)
+            if current:
+                self._put_fast(key, value)
+            return
+        if current:
+            self.on_disk.add(key)
+        elif (key not in self.spilling and key not in self.on_disk
+                and key in self.slow):
+            # Replaced or deleted while being written, and not being written
+            # again
+            self._remove_from_disk(key)
+        self._record('spill', self.slow.nbytes.get(key, 0), duration)
+
+    def _read(self, key, deserialize_value=True):
+        start = time()
+        try:
+            value = self.slow.get_serialized(key, prefetch=True)
+        except (KeyError, EnvironmentError):
+            # Removed from disk meanwhile
+            return None, time() - start
+        if deserialize_value:
+            value = deserialize(value.header, value.frames)
+        return value, time() - start
+
+    async def load(self, keys):
+        """ Move the given keys from disk into memory, off the event loop """
+        for key in keys:
+            if key in self.fast or key in self.spilling or key not in self.on_disk:
+                continue
+            value, duration = await self._submit(self._read, key)
+            if (value is None or key in self.fast or key in self.spilling
+                    or key not in self.on_disk):
+                continue
+            self._record('unspill', self.slow.nbytes[key], duration)
+            self._remove_from_disk(key)
+            self._put_fast(key, value)
+        self.evict()
+
+    async def load_serialized(self, keys):
+        """ Serialized values of those of the given keys that are on disk
+
+        Their pages are read in off the event loop, but they stay on disk.
+        """
+        result = {}
+        for key in keys:
+            if key in self.fast or key in self.spilling or key not in self.on_disk:
+                continue
+            value, duration = await self._submit(self._read, key, False)
+            if value is not None:
+                result[key] = value
+                self._record('unspill', sum(map(nbytes, value.frames)),
+                             duration)
+        return result
+
+    def __getitem__(self, key):
+        if key in self.fast:
+            self.fast.move_to_end(key)
+            return self.fast[key]
+        if key in self.spilling:
+            return self.spilling[key]
+        if key not in self.on_disk:
+            raise KeyError(key)
+        start = time()
+        n = self.slow.nbytes[key]
+        value = self.slow[key]
+        self.on_disk.discard(key)
+        del self.slow[key]
+        self._record('disk-stall', n, time() - start)
+        self._put_fast(key, value)
+        self.evict()
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.fast:
+            self._pop_fast(key)
+        self.spilling.pop(key, None)
+        if key in self.on_disk:
+            self._remove_from_disk(key)
+        self._put_fast(key, value)
+        self.evict()
+
+    def __delitem__(self, key):
+        if key in self.fast:
+            self._pop_fast(key)
+        elif key in self.spilling:
+            del self.spilling[key]
+        elif key in self.on_disk:
+            self._remove_from_disk(key)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return (key in self.fast or key in self.spilling
+                or key in self.on_disk)
+
+    def keys(self):
+        return set(self.fast) | set(self.spilling) | self.on_disk
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def close(self):
+        """ Wait for pending writes and stop the I/O thread """
+        self.executor.shutdown()
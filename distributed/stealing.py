@@ -1,6 +1,7 @@
 from __future__ import print_function, division, absolute_import
 
 from collections import defaultdict, deque
+from itertools import islice
 import logging
 from math import log
 import os
@@ -12,13 +13,16 @@ from .diagnostics.plugin import SchedulerPlugin
 from .utils import key_split, log_errors
 from .tornado_shim import PeriodicCallback
 
-try:
-    from cytoolz import topk
-except ImportError:
-    from toolz import topk
+# Assumed for links between workers until they report measurements
+BANDWIDTH = config.get('bandwidth', 100e6)
+LATENCY = config.get('latency', 10e-3)
+
+# Milliseconds between rounds of balancing.  Rounds take longer on larger
+# clusters, so they are spaced out to spend at most STEAL_OVERHEAD of the
+# scheduler's time balancing, up to ten times the interval.
+STEAL_INTERVAL = config.get('steal-interval', 100)
+STEAL_OVERHEAD = config.get('steal-overhead', 0.02)
 
-BANDWIDTH = 100e6
-LATENCY = 10e-3
 log_2 = log(2)
 
 logger = logging.getLogger(__name__)
@@ -38,15 +42,32 @@ class WorkStealing(SchedulerPlugin):
         self.cost_multipliers = [1 + 2 ** (i - 6) for i in range(15)]
         self.cost_multipliers[0] = 1
 
+        # Bandwidth and latency reported by each worker for its links to
+        # peers, and their running averages over the cluster
+        self.links = dict()
+        self.bandwidth = BANDWIDTH
+        self.latency = LATENCY
+
+        # Steals waiting for the victim to confirm that it released the task,
+        # as {key: (victim, thief, victim_duration, thief_duration)}, and the
+        # occupancy they will move between workers
+        self.in_flight = dict()
+        self.in_flight_occupancy = defaultdict(lambda: 0)
+        # Outcomes of steal requests, and seconds spent computing tasks that
+        # were computed elsewhere as well
+        self.counts = defaultdict(int)
+        self.wasted_compute = 0
+
         for worker in scheduler.workers:
             self.add_worker(worker=worker)
 
         self._pc = PeriodicCallback(callback=self.balance,
-                                    callback_time=100,
+                                    callback_time=STEAL_INTERVAL,
                                     io_loop=self.scheduler.loop)
         self.scheduler.loop.add_callback(self._pc.start)
         self.scheduler.plugins.append(self)
         self.scheduler.extensions['stealing'] = self
+        self.scheduler.worker_handlers['steal-response'] = self.steal_response
         self.scheduler.events['stealing'] = deque(maxlen=100000)
         self.count = 0
 
@@ -59,6 +80,65 @@ class WorkStealing(SchedulerPlugin):
 
     def remove_worker(self, scheduler=None, worker=None):
         del self.stealable[worker]
+        self.links.pop(worker, None)
+        for key, (victim, thief, _, _) in list(self.in_flight.items()):
+            if victim == worker:
+                self.cancel_steal(key)
+        self.in_flight_occupancy.pop(worker, None)
+
+    def update_links(self, worker, links, alpha=0.1):
+        """ Record a worker's estimates of its links to peers
+
+        Parameters
+        ----------
+        worker: string
+            Address of the worker receiving data over these links
+        links: dict
+            Mapping of peer address to ``(bandwidth, latency)``, in bytes per
+            second and seconds.  The latency may be None if unknown.
+        alpha: float
+            Weight of each link in the cluster-wide averages
+        """
+        d = self.links.setdefault(worker, dict())
+        for peer, (bandwidth, latency) in links.items():
+            d[peer] = (bandwidth, latency)
+            # Average seconds per byte, as that is what transfer times add up
+            self.bandwidth = 1 / ((1 - alpha) / self.bandwidth
+                                  + alpha / bandwidth)
+            if latency is not None:
+                self.latency += alpha * (latency - self.latency)
+
+    def link(self, worker, peer):
+        """ Bandwidth and latency of receiving data on ``worker`` from
+        ``peer``, as measured by either of them or else as on average """
+        bandwidth, latency = (self.links.get(worker, {}).get(peer)
+                              or self.links.get(peer, {}).get(worker)
+                              or (None, None))
+        return (bandwidth or self.bandwidth,
+                self.latency if latency is None else latency)
+
+    def transfer_time(self, ts, worker):
+        """ Estimated seconds to gather the dependencies of ``ts`` that
+        ``worker`` doesn't have, each from its quickest holder
+
+        Latency is paid once per holder.  Only a few holders of widely
+        replicated data are considered.
+        """
+        total = 0
+        holders = set()
+        for dts in ts.dependencies:
+            if not dts.who_has or worker in dts.who_has:
+                continue
+            nbytes = dts.get_nbytes()
+            best, best_holder = None, None
+            for w in islice(dts.who_has, 10):
+                bandwidth, latency = self.link(worker, w)
+                t = nbytes / bandwidth + (0 if w in holders else latency)
+                if best is None or t < best:
+                    best, best_holder = t, w
+            total += best
+            holders.add(best_holder)
+        return total
 
     def teardown(self):
         self._pc.stop()
@@ -70,15 +150,20 @@ class WorkStealing(SchedulerPlugin):
 
         if start == 'processing':
             self.remove_key_from_stealable(key)
+            if key in self.in_flight:
+                self.cancel_steal(key)
             if finish == 'memory':
                 ks = key_split(key)
                 if ks in self.stealable_unknown_durations:
                     for k in self.stealable_unknown_durations.pop(ks):
-                        if self.scheduler.task_state[k] == 'processing':
+                        ts = self.scheduler.tasks.get(k)
+                        if ts is not None and ts.state == 'processing':
                             self.put_key_in_stealable(k, split=ks)
 
     def put_key_in_stealable(self, key, split=None):
-        worker = self.scheduler.rprocessing[key]
+        if key in self.in_flight:
+            return
+        worker = self.scheduler.tasks[key].processing_on
         cost_multiplier, level = self.steal_time_ratio(key, split=split)
         if cost_multiplier is not None:
             self.stealable_all[level].add(key)
@@ -108,25 +193,24 @@ class WorkStealing(SchedulerPlugin):
         For example a result of zero implies a task without dependencies.
         level: The location within a stealable list to place this value
         """
-        if (key not in self.scheduler.loose_restrictions
-                and (key in self.scheduler.host_restrictions or
-                     key in self.scheduler.worker_restrictions) or
-            key in self.scheduler.resource_restrictions):
+        ts = self.scheduler.tasks[key]
+        if (not ts.loose_restrictions
+                and (ts.host_restrictions or ts.worker_restrictions) or
+            ts.resource_restrictions):
             return None, None  # don't steal
 
-        if not self.scheduler.dependencies[key]:  # no dependencies fast path
+        if not ts.dependencies:  # no dependencies fast path
             return 0, 0
 
-        nbytes = sum(self.scheduler.nbytes.get(k, 1000)
-                     for k in self.scheduler.dependencies[key])
+        nbytes = sum(dts.nbytes if dts.nbytes is not None else 1000
+                     for dts in ts.dependencies)
 
-        transfer_time = nbytes / BANDWIDTH + LATENCY
+        transfer_time = nbytes / self.bandwidth + self.latency
         split = split or key_split(key)
         if split in fast_tasks:
             return None, None
         try:
-            worker = self.scheduler.rprocessing[key]
-            compute_time = self.scheduler.processing[worker][key]
+            compute_time = self.scheduler.get_processing_cost(ts)
         except KeyError:
             self.stealable_unknown_durations[split].add(key)
             return None, None
@@ -142,9 +226,11 @@ class WorkStealing(SchedulerPlugin):
             return cost_multiplier, level
 
     def move_task(self, key, victim, thief):
+        """ Move a task that ``victim`` confirmed it released to ``thief`` """
         try:
+            ts = self.scheduler.tasks[key]
             if self.scheduler.validate:
-                if victim != self.scheduler.rprocessing[key]:
+                if victim != ts.processing_on:
                     import pdb; pdb.set_trace()
 
             self.remove_key_from_stealable(key)
@@ -152,61 +238,124 @@ class WorkStealing(SchedulerPlugin):
                     victim, self.scheduler.occupancy[victim],
                     thief, self.scheduler.occupancy[thief])
 
-            duration = self.scheduler.processing[victim].pop(key)
-            self.scheduler.occupancy[victim] -= duration
-            self.scheduler.total_occupancy -= duration
-
-            duration = self.scheduler.task_duration.get(key_split(key), 0.5)
-            duration += sum(self.scheduler.nbytes[key] for key in
-                            self.scheduler.dependencies[key] -
-                            self.scheduler.has_what[thief]) / BANDWIDTH
-            self.scheduler.processing[thief][key] = duration
-            self.scheduler.rprocessing[key] = thief
-            self.scheduler.occupancy[thief] += duration
-            self.scheduler.total_occupancy += duration
+            self.scheduler.release_occupancy(ts, victim)
+            self.scheduler.consume_occupancy(ts, thief,
+                                             self.transfer_time(ts, thief))
+            ts.processing_on = thief
             self.put_key_in_stealable(key)
-
-            self.scheduler.worker_comms[victim].send({'op': 'release-task',
-                                                      'reason': 'stolen',
-                                                      'key': key})
+            self.scheduler.check_idle_saturated(victim)
+            self.scheduler.check_idle_saturated(thief)
 
             try:
                 self.scheduler.send_task_to_worker(thief, key)
             except CommClosedError:
                 self.scheduler.remove_worker(thief)
-        except CommClosedError:
-            logger.info("Worker comm closed while stealing: %s", victim)
         except Exception as e:
             logger.exception(e)
             if LOG_PDB:
                 import pdb; pdb.set_trace()
             raise
 
+    def request_steal(self, key, victim, thief):
+        """ Ask ``victim`` to give up ``key`` for ``thief``
+
+        The task stays with the victim until it confirms in ``steal_response``
+        that it hadn't started the task yet.  Meanwhile its duration counts
+        towards the occupancy of the thief rather than of the victim in
+        ``balance``.  Requests are sent to victims at the end of ``balance``.
+        """
+        ts = self.scheduler.tasks[key]
+        victim_duration = self.scheduler.get_processing_cost(ts)
+        thief_duration = (self.scheduler.get_task_duration(ts)
+                          + self.transfer_time(ts, thief))
+        self.remove_key_from_stealable(key)
+        self.in_flight[key] = (victim, thief, victim_duration, thief_duration)
+        self.in_flight_occupancy[victim] -= victim_duration
+        self.in_flight_occupancy[thief] += thief_duration
+        self.counts['requested'] += 1
+
+    def cancel_steal(self, key):
+        """ Forget a steal request, returning its victim and thief """
+        victim, thief, victim_duration, thief_duration = self.in_flight.pop(key)
+        if victim in self.stealable:
+            self.in_flight_occupancy[victim] += victim_duration
+        if thief in self.stealable:
+            self.in_flight_occupancy[thief] -= thief_duration
+        return victim, thief
+
+    def steal_response(self, worker=None, keys=None):
+        """ Handle a victim's answer to steal requests
+
+        ``keys`` maps each requested key to the state the task was in on the
+        victim.  Tasks the victim hadn't started have been released by it and
+        move to their thief.  Tasks it is already computing, or has computed,
+        stay where they are.
+        """
+        s = self.scheduler
+        for key, state in keys.items():
+            if key not in self.in_flight:
+                continue  # finished or rescheduled meanwhile
+            victim, thief = self.cancel_steal(key)
+            if state not in (None, 'waiting', 'ready', 'constrained'):
+                self.counts['rejected'] += 1
+                s.counters['steal'].add('rejected')
+                continue
+            if thief not in s.workers:
+                # The victim released the task, so give it back
+                try:
+                    s.send_task_to_worker(victim, key)
+                except CommClosedError:
+                    s.remove_worker(victim)
+                else:
+                    self.put_key_in_stealable(key)
+                continue
+            self.counts['confirmed'] += 1
+            s.counters['steal'].add('confirmed')
+            self.move_task(key, victim, thief)
+
+    def add_wasted_compute(self, key, worker, startstops=None):
+        """ Record that ``worker`` computed ``key`` after another worker
+        already had """
+        duration = sum(stop - start for action, start, stop in startstops or ()
+                       if action == 'compute')
+        self.wasted_compute += duration
+        self.counts['duplicate'] += 1
+        if self.scheduler.digests:
+            self.scheduler.digests['wasted-compute'].add(duration)
+
     def balance(self):
         with log_errors():
             i = 0
             s = self.scheduler
             occupancy = s.occupancy
+            in_flight_occupancy = self.in_flight_occupancy
+
+            def occ(w):
+                return occupancy[w] + in_flight_occupancy.get(w, 0)
+
             idle = s.idle
             saturated = s.saturated
             if not idle or len(idle) == len(self.scheduler.workers):
                 return
 
             log = list()
+            requests = defaultdict(list)
             start = time()
 
             seen = False
             acted = False
 
+            # Consider more candidates on larger clusters
+            ncandidates = max(10, int(len(s.workers) ** 0.5))
             if not s.saturated:
-                saturated = topk(10, s.workers, key=occupancy.get)
+                saturated = occupancy.topk(ncandidates)
                 saturated = [w for w in saturated
                                 if occupancy[w] > 0.2
                                and len(s.processing[w]) > s.ncores[w]]
-            elif len(s.saturated) < 20:
+            elif len(s.saturated) < 2 * ncandidates:
                 saturated = sorted(saturated, key=occupancy.get, reverse=True)
 
-            if len(idle) < 20:
+            if len(idle) < 2 * ncandidates:
                 idle = sorted(idle, key=occupancy.get)
 
             for level, cost_multiplier in enumerate(self.cost_multipliers):
@@ -224,16 +373,16 @@ class WorkStealing(SchedulerPlugin):
                         if not idle:
                             break
                         idl = idle[i % len(idle)]
-                        duration = s.processing[sat][key]
-
-                        if (occupancy[idl] + cost_multiplier * duration
-                          <= occupancy[sat] - duration / 2):
-                            self.move_task(key, sat, idl)
+                        ts = s.tasks[key]
+                        duration = s.get_processing_cost(ts)
+
+                        if (occ(idl) + duration + self.transfer_time(ts, idl)
+                                <= occ(sat) - duration / 2
+                                and not s.over_memory_target(ts, idl)):
+                            self.request_steal(key, sat, idl)
+                            requests[sat].append(key)
                             log.append((start, level, key, duration,
-                                        sat, occupancy[sat],
-                                        idl, occupancy[idl]))
-                            self.scheduler.check_idle_saturated(sat)
-                            self.scheduler.check_idle_saturated(idl)
+                                        sat, occ(sat), idl, occ(idl)))
                             seen = True
 
                 if self.cost_multipliers[level] < 20:  # don't steal from public at cost
@@ -244,35 +393,46 @@ class WorkStealing(SchedulerPlugin):
                         if not idle:
                             break
 
-                        sat = s.rprocessing[key]
-                        if occupancy[sat] < 0.2:
+                        sat = s.tasks[key].processing_on
+                        if occ(sat) < 0.2:
                             continue
                         if len(s.processing[sat]) <= s.ncores[sat]:
                             continue
 
                         i += 1
                         idl = idle[i % len(idle)]
-                        duration = s.processing[sat][key]
-
-                        if (occupancy[idl] + cost_multiplier * duration
-                            <= occupancy[sat] - duration / 2):
-                            self.move_task(key, sat, idl)
+                        ts = s.tasks[key]
+                        duration = s.get_processing_cost(ts)
+
+                        if (occ(idl) + duration + self.transfer_time(ts, idl)
+                                <= occ(sat) - duration / 2
+                                and not s.over_memory_target(ts, idl)):
+                            self.request_steal(key, sat, idl)
+                            requests[sat].append(key)
                             log.append((start, level, key, duration,
-                                        sat, occupancy[sat],
-                                        idl, occupancy[idl]))
-                            self.scheduler.check_idle_saturated(sat)
-                            self.scheduler.check_idle_saturated(idl)
+                                        sat, occ(sat), idl, occ(idl)))
                             seen = True
 
                 if seen and not acted:
                     break
 
+            for victim, keys in requests.items():
+                try:
+                    s.worker_comms[victim].send({'op': 'steal-request',
+                                                 'keys': keys})
+                except CommClosedError:
+                    for key in keys:
+                        self.cancel_steal(key)
+
             if log:
                 self.log.append(log)
                 self.count += 1
             stop = time()
             if self.scheduler.digests:
                 self.scheduler.digests['steal-duration'].add(stop - start)
+            self._pc.callback_time = min(
+                    10 * STEAL_INTERVAL,
+                    max(STEAL_INTERVAL, (stop - start) * 1000 / STEAL_OVERHEAD))
 
     def restart(self, scheduler):
         for stealable in self.stealable.values():
@@ -282,6 +442,8 @@ class WorkStealing(SchedulerPlugin):
         for s in self.stealable_all:
             s.clear()
         self.key_stealable.clear()
+        self.in_flight.clear()
+        self.in_flight_occupancy.clear()
         self.stealable_unknown_durations.clear()
 
     def story(self, *keys):
@@ -0,0 +1,152 @@
+""" Streaming statistics of the tasks of each key prefix
+
+The scheduler estimates the duration and the size of the result of a task
+from previous tasks with the same key prefix, like ``'inc'`` for
+``'inc-1234'``.  Averaging each new observation half-and-half with the last
+estimate forgets all but the last few tasks, so that prefixes with skewed
+durations jump between their fast and their slow tasks.
+
+Instead we keep decayed statistics over all previous tasks.  Each
+observation counts half as much after ``halflife`` newer ones, so that
+estimates still follow prefixes whose tasks change over time.  Besides the
+mean and variance we keep a histogram with logarithmically spaced buckets,
+from which we read quantiles like the median or the 95th percentile to
+within ``RESOLUTION`` of their value.
+
+Rather than decaying the weights of all previous observations at each new
+one we give each new observation more weight than the last, and rescale
+everything only once these weights grow large.
+"""
+from __future__ import print_function, division, absolute_import
+
+from math import floor, log, sqrt
+
+# Relative width of the buckets of histograms
+RESOLUTION = 2 ** 0.25
+
+_LOG_RESOLUTION = log(RESOLUTION)
+_RESCALE = 1e100
+
+
+class StreamStats(object):
+    """ Decayed mean, variance and quantiles of a stream of numbers
+
+    Observations count half as much after *halflife* newer ones.  Quantiles
+    are only kept for non-negative numbers.
+
+    Examples
+    --------
+    >>> stats = StreamStats(halflife=float('inf'))
+    >>> for x in [1, 2, 3, 4, 100]:
+    ...     stats.add(x)
+    >>> stats.mean
+    22.0
+    >>> 2.7 < stats.quantile(0.5) < 3.3
+    True
+    """
+    def __init__(self, halflife=10, quantiles=True):
+        self.decay = 0.5 ** (1 / halflife)
+        self.count = 0
+        self.weight = 0  # sum of the weights of all observations
+        self.mean = 0
+        self.m2 = 0  # weighted sum of squared differences from the mean
+        self.scale = 1  # weight of the next observation
+        self.buckets = {} if quantiles else None
+
+    def add(self, x):
+        """ Add an observation """
+        w = self.scale
+        self.count += 1
+        self.weight += w
+        delta = x - self.mean
+        self.mean += delta * w / self.weight
+        self.m2 += w * delta * (x - self.mean)
+        if self.buckets is not None:
+            b = floor(log(x) / _LOG_RESOLUTION) if x > 0 else None
+            self.buckets[b] = self.buckets.get(b, 0) + w
+        self.scale /= self.decay
+        if self.scale > _RESCALE:
+            self._rescale()
+
+    def _rescale(self):
+        s = self.scale
+        self.weight /= s
+        self.m2 /= s
+        self.scale = 1
+        if self.buckets is not None:
+            # Drop buckets whose observations no longer count
+            threshold = 1e-12 * self.weight
+            self.buckets = {b: w / s for b, w in self.buckets.items()
+                            if w / s > threshold}
+
+    @property
+    def var(self):
+        if not self.weight:
+            return 0
+        return max(self.m2 / self.weight, 0)
+
+    @property
+    def std(self):
+        return sqrt(self.var)
+
+    def quantile(self, q):
+        """ The *q*-th quantile of the observations, or None if there are
+        none """
+        if not self.buckets:
+            return None
+        target = q * sum(self.buckets.values())
+        zero = self.buckets.get(None, 0)
+        if target <= zero:
+            return 0
+        total = zero
+        buckets = sorted(b for b in self.buckets if b is not None)
+        for b in buckets:
+            total += self.buckets[b]
+            if total >= target:
+                break
+        return RESOLUTION ** (b + 0.5)
+
+    def summary(self):
+        """ A dictionary of the statistics, for diagnostics """
+        d = {'count': self.count, 'mean': self.mean, 'std': self.std}
+        if self.buckets is not None:
+            d['p50'] = self.quantile(0.5)
+            d['p95'] = self.quantile(0.95)
+        return d
+
+
+class TaskPrefixStats(object):
+    """ Statistics of the tasks of one key prefix
+
+    Tracks the durations and result sizes of tasks that finish, and the
+    fraction of tasks that fail, each decayed over *halflife* observations.
+    """
+    def __init__(self, halflife=10):
+        self.duration = StreamStats(halflife)
+        self.nbytes = StreamStats(halflife)
+        self.outcomes = StreamStats(halflife, quantiles=False)
+        self.failures = 0
+
+    def add_duration(self, duration):
+        self.duration.add(duration)
+
+    def add_nbytes(self, nbytes):
+        self.nbytes.add(nbytes)
+
+    def add_success(self):
+        self.outcomes.add(0)
+
+    def add_failure(self):
+        self.outcomes.add(1)
+        self.failures += 1
+
+    @property
+    def failure_rate(self):
+        return self.outcomes.mean
+
+    def summary(self):
+        """ A dictionary of the statistics, for diagnostics """
+        return {'duration': self.duration.summary(),
+                'nbytes': self.nbytes.summary(),
+                'failures': self.failures,
+                'failure-rate': self.failure_rate}
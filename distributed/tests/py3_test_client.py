@@ -1,6 +1,6 @@
 import pytest
 
-from distributed.utils_test import gen_cluster, inc, div, loop
+from distributed.utils_test import gen_cluster, inc, div, loop, slowinc
 from distributed import as_completed, Client
 
 
@@ -72,3 +72,132 @@ def test_async_with(loop):
     assert result == 11
     assert client.status == 'closed'
     assert cluster.status == 'closed'
+
+
+class AsyncRange(object):
+    """ An async iterable of numbers, counting how many were taken """
+    def __init__(self, n):
+        self.n = n
+        self.taken = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.taken >= self.n:
+            raise StopAsyncIteration
+        self.taken += 1
+        return self.taken - 1
+
+
+@gen_cluster(client=True, ncores=[('127.0.0.1', 1)] * 2)
+def test_map_async_iterable(c, s, a, b):
+    source = AsyncRange(50)
+    most = 0
+
+    async def f():
+        nonlocal most
+        futures = []
+        async for future in c.map(slowinc, source, delay=0.01):
+            futures.append(future)
+            unfinished = [f for f in futures if f.status == 'pending']
+            most = max(most, len(unfinished))
+        return futures
+
+    futures = yield f()
+    assert len(futures) == 50
+    assert 0 < most <= 4  # two tasks per core
+    results = yield c._gather(futures)
+    assert results == list(range(1, 51))
+
+
+@gen_cluster(client=True)
+def test_gather_async_iterable(c, s, a, b):
+    async def f(ordered):
+        results = []
+        stream = c.map(inc, AsyncRange(20), maxsize=5)
+        async for result in c.gather(stream, ordered=ordered):
+            results.append(result)
+        return results
+
+    results = yield f(True)
+    assert results == list(range(1, 21))
+    results = yield f(False)
+    assert sorted(results) == list(range(1, 21))
+
+
+@gen_cluster(client=True)
+def test_gather_async_iterable_holds_back_source(c, s, a, b):
+    source = AsyncRange(1000)
+
+    async def f():
+        stream = c.gather(c.map(inc, source), maxsize=3)
+        results = []
+        async for result in stream:
+            results.append(result)
+            if len(results) == 10:
+                break
+        return results
+
+    results = yield f()
+    assert results == list(range(1, 11))
+    assert source.taken < 100
+
+
+@gen_cluster(client=True)
+def test_gather_async_iterable_aclose(c, s, a, b):
+    source = AsyncRange(1000)
+
+    async def f():
+        stream = c.gather(c.map(inc, source), maxsize=3)
+        async for result in stream:
+            break
+        await stream.aclose()
+        assert stream.reader.done()
+        taken = source.taken
+        assert [result async for result in stream] == []
+        assert source.taken == taken
+
+    yield f()
+
+
+class FailingRange(AsyncRange):
+    """ An async iterable of numbers that fails after the first few """
+    async def __anext__(self):
+        if self.taken == 5:
+            raise ValueError('source failed')
+        return await AsyncRange.__anext__(self)
+
+
+@gen_cluster(client=True)
+def test_gather_async_iterable_source_error(c, s, a, b):
+    async def f(ordered):
+        results = []
+        stream = c.map(slowinc, FailingRange(10), delay=0.1)
+        with pytest.raises(ValueError):
+            async for result in c.gather(stream, ordered=ordered):
+                results.append(result)
+        return results
+
+    # Results of the futures taken before the error still come first
+    assert (yield f(True)) == [1, 2, 3, 4, 5]
+    assert sorted((yield f(False))) == [1, 2, 3, 4, 5]
+
+
+@gen_cluster(client=True)
+def test_map_async_iterable_keys(c, s, a, b):
+    async def f(**kwargs):
+        return [future async for future in c.map(inc, AsyncRange(5), **kwargs)]
+
+    futures = yield f(key='x')
+    assert len({future.key for future in futures}) == 5
+    assert all(future.key.startswith('x-') for future in futures)
+    assert (yield c._gather(futures)) == list(range(1, 6))
+
+    futures2 = yield f(key='x')
+    assert [ff.key for ff in futures2] == [ff.key for ff in futures]
+    futures3 = yield f(key='x', pure=False)
+    assert not {ff.key for ff in futures3} & {ff.key for ff in futures}
+
+    with pytest.raises(TypeError):
+        c.map(inc, AsyncRange(2), key=['a', 'b'])
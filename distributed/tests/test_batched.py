@@ -83,6 +83,35 @@ def test_send_before_start():
         result = yield comm.read(); assert result == ['hello', 'world']
 
 
+@gen_test()
+def test_send_bulk():
+    with echo_server() as e:
+        comm = yield connect(e.address)
+
+        b = BatchedSend(interval=10)
+
+        for key in 'xyz':
+            b.send_bulk({'op': 'keys', 'type': None}, keys=key)
+        b.send('hello')
+        b.send_bulk({'op': 'keys', 'type': None}, keys='a')
+        b.send_bulk({'op': 'keys', 'type': 1}, keys='b')
+        b.send_bulk({'op': 'keys', 'type': 1}, keys='c')
+        assert b.message_count == 4
+        assert b.row_count == 6
+
+        b.start(comm)
+        result = yield comm.read()
+        assert result == [{'op': 'keys', 'type': None, 'keys': ['x', 'y', 'z']},
+                          'hello',
+                          {'op': 'keys', 'type': None, 'keys': ['a']},
+                          {'op': 'keys', 'type': 1, 'keys': ['b', 'c']}]
+
+        # Rows sent after a flush start a new message
+        b.send_bulk({'op': 'keys', 'type': 1}, keys='d')
+        result = yield comm.read()
+        assert result == [{'op': 'keys', 'type': 1, 'keys': ['d']}]
+
+
 @gen_test()
 def test_send_after_stream_start():
     with echo_server() as e:
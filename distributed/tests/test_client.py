@@ -177,6 +177,56 @@ def test_map_naming(c, s, a, b):
     assert len({x.event for x in L4}) == 4
 
 
+@gen_cluster(client=True)
+def test_map_in_chunks(c, s, a, b):
+    L1 = c.map(inc, range(30))
+    assert c._map_pool is None
+    with mock.patch('distributed.client.MAP_CHUNK_SIZE', 7):
+        L2 = c.map(inc, range(30))
+        pool = c._map_pool
+        L3 = c.map(inc, range(30), pure=False,
+                   workers=[[a.address]] * 15 + [[b.address]] * 15)
+    assert [f.key for f in L1] == [f.key for f in L2]
+    assert c._map_pool is pool is not None  # threads are kept for later maps
+
+    results = yield c._gather(L3)
+    assert results == list(range(1, 31))
+    assert all(s.tasks[f.key].who_has == {a.address} for f in L3[:15])
+    assert all(s.tasks[f.key].who_has == {b.address} for f in L3[15:])
+
+    yield c._close()
+    assert c._map_pool is None
+    assert pool._shutdown
+
+
+@gen_cluster(client=True)
+def test_map_in_chunks_released_dependency(c, s, a, b):
+    x = c.submit(inc, 1)
+    key = x.key
+    c.futures.pop(key)  # as if released by another thread meanwhile
+    with mock.patch('distributed.client.MAP_CHUNK_SIZE', 2):
+        with pytest.raises(CancelledError):
+            c.map(add, range(10), [x] * 10)
+    c.futures[key] = x._state
+
+
+@gen_cluster(client=True)
+def test_map_reports_in_bulk(c, s, a, b):
+    futures = c.map(inc, range(200))
+    yield wait(futures)
+    assert all(future.type == int for future in futures)
+
+    bcomm = s.comms[c.id]
+    assert bcomm.row_count >= 200
+    assert bcomm.message_count < bcomm.row_count / 2
+
+    rows, messages = bcomm.row_count, bcomm.message_count
+    yield c._cancel(futures)
+    assert all(future.cancelled() for future in futures)
+    assert bcomm.row_count >= rows + 200
+    assert bcomm.message_count < messages + 10
+
+
 @gen_cluster(client=True)
 def test_submit_naming(c, s, a, b):
     a = c.submit(inc, 1)
@@ -2712,7 +2762,7 @@ def test_unrunnable_task_runs(c, s, a, b):
         assert time() < start + 5
         yield gen.sleep(0.01)
 
-    assert x.key in s.unrunnable
+    assert s.tasks[x.key] in s.unrunnable
     assert s.task_state[x.key] == 'no-worker'
 
     w = Worker(s.ip, s.port, loop=s.loop)
@@ -2723,7 +2773,7 @@ def test_unrunnable_task_runs(c, s, a, b):
         assert time() < start + 2
         yield gen.sleep(0.01)
 
-    assert x.key not in s.unrunnable
+    assert s.tasks[x.key] not in s.unrunnable
     result = yield x
     assert result == 2
     yield w._close()
@@ -0,0 +1,86 @@
+from __future__ import print_function, division, absolute_import
+
+import pytest
+
+from distributed.columns import WorkerIndex, WorkerColumn
+
+
+def test_totals():
+    index = WorkerIndex()
+    occupancy = WorkerColumn(index)
+    ncores = WorkerColumn(index, 'q')
+
+    occupancy['a'] = 1.5
+    occupancy['b'] = 2.5
+    ncores['a'] = 4
+    assert ncores['b'] == 0
+    assert occupancy.total == 4
+    assert ncores.total == 4
+
+    occupancy['a'] -= 1
+    assert occupancy.total == 3
+    assert dict(occupancy) == {'a': 0.5, 'b': 2.5}
+
+    index.remove('a')
+    assert 'a' not in occupancy
+    assert occupancy.total == 2.5
+    assert ncores.total == 0
+    with pytest.raises(KeyError):
+        occupancy['a']
+
+    index.remove('b')
+    assert occupancy.total == 0
+    assert not occupancy
+
+
+def test_rows_are_reused():
+    index = WorkerIndex()
+    occupancy = WorkerColumn(index)
+    occupancy.update({'a': 1, 'b': 2})
+    index.remove('a')
+    occupancy['c'] = 3
+    assert len(index.addresses) == 2
+    assert dict(occupancy) == {'b': 2, 'c': 3}
+
+    # Columns created later get a row for every worker
+    nbytes = WorkerColumn(index)
+    nbytes['b'] = 10
+    assert dict(nbytes) == {'b': 10, 'c': 0}
+
+
+def test_clear():
+    index = WorkerIndex()
+    occupancy = WorkerColumn(index)
+    ncores = WorkerColumn(index, 'q')
+    occupancy.update({'a': 1, 'b': 2})
+    occupancy.clear()
+    assert not ncores and not occupancy
+    assert occupancy.total == ncores.total == 0
+
+
+def test_array():
+    np = pytest.importorskip('numpy')
+    index = WorkerIndex()
+    occupancy = WorkerColumn(index)
+    occupancy.update({'a': 1, 'b': 2, 'c': 3})
+    index.remove('b')
+
+    assert occupancy.array().tolist() == [1, 0, 3]
+    assert occupancy.array(['c', 'a']).tolist() == [3, 1]
+
+    # Arrays are copies
+    x = occupancy.array()
+    x[:] = 10
+    assert occupancy['a'] == 1
+
+
+@pytest.mark.parametrize('n', [5, 100])
+def test_topk(n):
+    index = WorkerIndex()
+    occupancy = WorkerColumn(index)
+    for i in range(n):
+        occupancy['w-%d' % i] = (i * 7) % n - n  # negative values
+    index.remove('w-0')
+
+    expected = sorted(occupancy, key=occupancy.get, reverse=True)[:3]
+    assert occupancy.topk(3) == expected
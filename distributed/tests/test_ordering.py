@@ -0,0 +1,63 @@
+from __future__ import print_function, division, absolute_import
+
+from distributed.ordering import merge_priorities
+from distributed.scheduler import TaskState
+
+
+def make_task(key, state, priority, dependencies=()):
+    ts = TaskState(key, b'spec')
+    ts.state = state
+    ts.priority = priority
+    for dts in dependencies:
+        ts.dependencies.add(dts)
+        dts.dependents.add(ts)
+    return ts
+
+
+def duration(ts):
+    return 1
+
+
+def test_continuations_rank_with_older_graph():
+    x = make_task('x', 'processing', (1, 0))
+    y = make_task('y', 'waiting', (1, 1))
+    a = make_task('a', 'released', (2, 0), [x])
+    b = make_task('b', 'released', (2, 1), [a])
+    c = make_task('c', 'released', (2, 2))
+    tasks = {ts.key: ts for ts in [a, b, c]}
+
+    new = merge_priorities(tasks, 2, duration)
+    assert set(new) == {a, b}
+    assert new[a][0] == new[b][0] == 1
+    # before the rest of the older graph, in order of their critical path
+    assert new[a] < new[b] < y.priority
+
+
+def test_anchor_to_first_dependency():
+    x = make_task('x', 'processing', (1, 5))
+    y = make_task('y', 'processing', (2, 0))
+    z = make_task('z', 'processing', (1, 3))
+    a = make_task('a', 'released', (3, 0), [x, y])
+    b = make_task('b', 'released', (3, 1), [z])
+    new = merge_priorities({'a': a, 'b': b}, 3, duration)
+    assert new[a][0] == 1
+    assert new[b] < new[a]  # same critical path, z before x
+
+    # continuations of continuations keep the same anchor
+    a.priority = new[a]
+    a.state = 'waiting'
+    c = make_task('c', 'released', (4, 0), [a])
+    priority = merge_priorities({'c': c}, 4, duration)[c]
+    assert (priority[0], priority[2]) == (1, 5)
+
+
+def test_persisted_and_newer_dependencies_dont_anchor():
+    x = make_task('x', 'memory', (1, 0))
+    x.who_wants = {'client'}
+    y = make_task('y', 'memory', (1, 1))
+    z = make_task('z', 'processing', (3, 0))
+    a = make_task('a', 'released', (2, 0), [x])
+    b = make_task('b', 'released', (2, 1), [y])
+    c = make_task('c', 'released', (2, 2), [z])
+    new = merge_priorities({'a': a, 'b': b, 'c': c}, 2, duration)
+    assert set(new) == {b}  # y is only held for its dependents
@@ -48,7 +48,7 @@ def test_resource_submit(c, s, a, b):
     yield _wait(y)
     assert y.key in b.data
 
-    assert z.key in s.unrunnable
+    assert s.tasks[z.key] in s.unrunnable
 
     d = Worker(s.ip, s.port, loop=s.loop, resources={'C': 10})
     yield d._start()
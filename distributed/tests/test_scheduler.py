@@ -21,11 +21,12 @@ import pytest
 
 from distributed import Nanny, Worker, Client
 from distributed.core import connect, rpc, CommClosedError
-from distributed.scheduler import validate_state, Scheduler, BANDWIDTH
+from distributed.scheduler import (validate_state, Scheduler, BANDWIDTH,
+        TemplatedTask)
 from distributed.client import _wait, _first_completed
 from distributed.metrics import time
 from distributed.protocol.pickle import dumps
-from distributed.worker import dumps_function, dumps_task
+from distributed.worker import dumps_function, dumps_task, task_templates
 from distributed.utils_test import (inc, ignoring, dec, gen_cluster, gen_test,
         loop, readone, slowinc, slowadd, cluster, div)
 from distributed.utils import All, tmpfile
@@ -81,6 +82,33 @@ def test_recompute_released_results(c, s, a, b):
     assert result == 1
 
 
+@gen_cluster(client=True)
+def test_task_state_links(c, s, a, b):
+    x = c.submit(inc, 1)
+    y = c.submit(inc, x)
+    yield _wait(y)
+
+    xs = s.tasks[x.key]
+    ys = s.tasks[y.key]
+    assert xs in ys.dependencies
+    assert ys in xs.dependents
+    assert ys.state == 'memory'
+    assert ys.who_has <= {a.address, b.address}
+    assert ys.who_wants == {c.id}
+    assert not ys.waiting_on
+
+    # legacy per-key views
+    assert s.task_state[y.key] == 'memory'
+    assert s.dependencies[y.key] == {x.key}
+    assert s.who_has[y.key] == ys.who_has
+    s.validate_state()
+
+    del x, y
+    while s.tasks:
+        yield gen.sleep(0.01)
+    assert xs.state == ys.state == 'forgotten'
+
+
 @gen_cluster(client=True)
 def test_decide_worker_with_many_independent_leaves(c, s, a, b):
     xs = yield [c._scatter(list(range(0, 100, 2)), workers=a.address),
@@ -104,6 +132,64 @@ def test_decide_worker_with_restrictions(client, s, a, b, c):
     assert x.key in a.data or x.key in b.data
 
 
+@gen_cluster(client=True, ncores=[('127.0.0.1', 1)] * 3)
+def test_choose_worker_matches_objective(client, s, a, b, c):
+    x, y = yield client._scatter([1, list(range(1000))], workers=a.address)
+    [z] = yield client._scatter([list(range(100))], broadcast=True)
+    future = client.submit(lambda *args: None, x, y, z)
+    yield _wait(future)
+    ts = s.tasks[future.key]
+
+    from distributed import scheduler
+    old = scheduler.BATCH_SCORE_WORKERS
+    limits = {w.address: s.memory_limit[w.address] for w in [a, b, c]}
+    try:
+        for batch in [1000, 1]:  # pure Python, then NumPy if available
+            scheduler.BATCH_SCORE_WORKERS = batch
+            for limit in [(0, 0, 0), (1, 0, 0), (1, 1, 1e9)]:
+                for w, l in zip([a, b, c], limit):
+                    s.memory_limit[w.address] = l
+                for occ in [(0, 0, 0), (10, 0, 0), (0, 0.001, 0.001)]:
+                    for w, o in zip([a, b, c], occ):
+                        s.occupancy[w.address] = o
+                    expected = min(s.workers,
+                                   key=lambda w: s.worker_objective(ts, w))
+                    assert s.choose_worker(ts, s.workers) == expected
+    finally:
+        scheduler.BATCH_SCORE_WORKERS = old
+        for w in [a, b, c]:
+            s.occupancy[w.address] = 0
+            s.memory_limit[w.address] = limits[w.address]
+
+
+@gen_cluster(client=True, ncores=[('127.0.0.1', 2)] * 4)
+def test_idle_ordered_by_occupancy(c, s, *workers):
+    futures = c.map(slowinc, range(6), delay=0.5)
+    while len(s.rprocessing) < 6:
+        yield gen.sleep(0.01)
+
+    stack = [s.occupancy[w] / s.ncores[w] for w in s.idle]
+    assert stack == sorted(stack)
+    s.validate_state()
+    yield _wait(futures)
+
+
+@gen_cluster(client=True, ncores=[('127.0.0.1', 2)] * 3)
+def test_idle_order_follows_task_durations(c, s, a, b, w):
+    x = c.submit(slowinc, 1, delay=0.5, workers=a.address)
+    y = c.submit(slowadd, 1, 2, delay=0.5, workers=b.address)
+    while len(s.rprocessing) < 2:
+        yield gen.sleep(0.01)
+    assert set(s.idle) == {a.address, b.address, w.address}
+
+    s.set_task_duration('slowinc', 100)
+    assert list(s.idle) == [w.address, b.address, a.address]
+    s.set_task_duration('slowadd', 1000)
+    assert list(s.idle) == [w.address, a.address, b.address]
+    s.validate_state()
+    yield _wait([x, y])
+
+
 @gen_cluster(client=True, ncores=[('127.0.0.1', 1)] * 3)
 def test_move_data_over_break_restrictions(client, s, a, b, c):
     [x] = yield client._scatter([1], workers=b.address)
@@ -128,7 +214,7 @@ def test_no_valid_workers(client, s, a, b, c):
     while not s.tasks:
         yield gen.sleep(0.01)
 
-    assert x.key in s.unrunnable
+    assert s.tasks[x.key] in s.unrunnable
 
     with pytest.raises(gen.TimeoutError):
         yield gen.with_timeout(timedelta(milliseconds=50), x)
@@ -149,7 +235,7 @@ def test_no_workers(client, s):
     while not s.tasks:
         yield gen.sleep(0.01)
 
-    assert x.key in s.unrunnable
+    assert s.tasks[x.key] in s.unrunnable
 
     with pytest.raises(gen.TimeoutError):
         yield gen.with_timeout(timedelta(milliseconds=50), x)
@@ -241,7 +327,7 @@ def test_server(s, a, b):
 
     while True:
         msg = yield readone(comm)
-        if msg['op'] == 'key-in-memory' and msg['key'] == 'y':
+        if msg['op'] == 'keys-in-memory' and 'y' in msg['keys']:
             break
 
     yield comm.write({'op': 'close-stream'})
@@ -269,6 +355,36 @@ def test_remove_client(s, a, b):
     assert not s.dependencies
 
 
+@gen_cluster()
+def test_update_graph_cancels_dependents_of_lost_data(s, a, b):
+    s.update_graph(tasks={'x': dumps_task((inc, 'lost')),
+                          'y': dumps_task((inc, 'x')),
+                          'z': dumps_task((inc, 'y')),
+                          'w': dumps_task((inc, 1))},
+                   dependencies={'x': ['lost'], 'y': ['x'], 'z': ['y'],
+                                 'w': []},
+                   keys=['z', 'w'],
+                   client='ident')
+
+    assert set(s.tasks) == {'w'}
+    s.validate_state()
+
+
+@gen_cluster(client=True)
+def test_update_graph_in_chunks(c, s, a, b):
+    from distributed import scheduler
+    old = scheduler.UPDATE_GRAPH_CHUNK
+    scheduler.UPDATE_GRAPH_CHUNK = 10
+    try:
+        futures = c.map(inc, range(100))
+        total = c.submit(sum, futures)
+        result = yield total
+        assert result == sum(map(inc, range(100)))
+    finally:
+        scheduler.UPDATE_GRAPH_CHUNK = old
+    s.validate_state()
+
+
 @gen_cluster()
 def test_server_listens_to_other_ops(s, a, b):
     with rpc(s.address) as r:
@@ -286,7 +402,33 @@ def test_remove_worker_from_scheduler(s, a, b):
     assert a.address in s.worker_comms
     s.remove_worker(address=a.address)
     assert a.address not in s.ncores
-    assert len(s.processing[b.address]) == len(dsk)  # b owns everything
+    # b owns everything, or will once it has room
+    assert len(s.processing[b.address]) + len(s.queued) == len(dsk)
+    s.validate_state()
+
+
+@gen_cluster(client=True)
+def test_root_tasks_queued(c, s, a, b):
+    futures = c.map(slowinc, range(20), delay=0.05)
+    while not s.queued:
+        yield gen.sleep(0.01)
+
+    assert s.queued_counts == {'slowinc': len(s.queued)}
+    for w in [a, b]:
+        assert len(s.processing[w.address]) == s.worker_slots(w.address)
+    assert len(s.processing[b.address]) == 3  # two cores, 1.1 per core
+    queued = list(s.queued)
+    assert [ts.priority for ts in queued] == sorted(ts.priority
+                                                    for ts in queued)
+    assert min(s.tasks[k].priority for p in s.processing.values()
+               for k in p) < queued[0].priority
+
+    info = yield c.scheduler.task_prefixes()
+    assert info['slowinc']['queued'] == len(s.queued)
+    s.validate_state()
+
+    yield _wait(futures)
+    assert not s.queued and not s.queued_counts
     s.validate_state()
 
 
@@ -469,11 +611,11 @@ def test_filtered_communication(s, a, b):
                    'keys': ['z']})
 
     msg, = yield c.read()
-    assert msg['op'] == 'key-in-memory'
-    assert msg['key'] == 'y'
+    assert msg['op'] == 'keys-in-memory'
+    assert msg['keys'] == ['y']
     msg, = yield f.read()
-    assert msg['op'] == 'key-in-memory'
-    assert msg['key'] == 'z'
+    assert msg['op'] == 'keys-in-memory'
+    assert msg['keys'] == ['z']
 
 
 def test_dumps_function():
@@ -503,6 +645,40 @@ def test_dumps_task():
     assert set(d) == {'function', 'args'}
 
 
+def test_task_templates():
+    f = lambda x, y=2: x + y
+    tasks = {'x': dumps_task((inc, 1)),
+             'y': dumps_task((inc, 2)),
+             'z': dumps_task((dec, 3)),
+             'a': dumps_task((apply, f, (1,), {'y': 10})),
+             'b': dumps_task((apply, f, (2,), {'y': 10})),
+             'c': dumps_task((apply, f, (3,), {'y': 20}))}
+    templates = task_templates(tasks)
+    assert set(tasks) == {'z', 'c'}
+    assert len(templates) == 2
+
+    t = [t for t in templates if 'kwargs' not in t][0]
+    assert cloudpickle.loads(t['function']) is inc
+    args = dict(zip(t['keys'], map(cloudpickle.loads, t['args'])))
+    assert args == {'x': (1,), 'y': (2,)}
+
+    t = [t for t in templates if 'kwargs' in t][0]
+    assert sorted(t['keys']) == ['a', 'b']
+    assert cloudpickle.loads(t['kwargs']) == {'y': 10}
+
+
+@gen_cluster(client=True)
+def test_map_sends_task_templates(c, s, a, b):
+    futures = c.map(inc, range(20))
+    results = yield c._gather(futures)
+    assert results == list(range(1, 21))
+
+    templated = [s.tasks[f.key].run_spec for f in futures]
+    assert all(isinstance(t, TemplatedTask) for t in templated)
+    assert len({id(t.template) for t in templated}) == 1
+    assert set(templated[0].expand()) == {'function', 'args'}
+
+
 @gen_cluster()
 def test_ready_remove_worker(s, a, b):
     s.update_graph(tasks={'x-%d' % i: dumps_task((inc, i)) for i in range(20)},
@@ -754,7 +930,59 @@ def test_scheduler_sees_memory_limits(s):
     yield w._start(0)
 
     assert s.worker_info[w.address]['memory_limit'] == 12345
+    assert s.memory_limit[w.address] == 12345
+    assert s.memory_limit.total == 12345
     yield w._close()
+    assert s.memory_limit.total == 0
+
+
+@gen_cluster(client=True, ncores=[])
+def test_workers_over_memory(c, s):
+    a = Worker(s.ip, s.port, ncores=1, memory_limit=1e6)
+    b = Worker(s.ip, s.port, ncores=1, memory_limit=1e9)
+    yield [a._start(0), b._start(0)]
+
+    yield c._scatter([b'0' * 500000], workers=a.address)
+    yield c._scatter([b'1' * 500000], workers=b.address)
+
+    assert s.workers_over_memory(0.25) == [a.address]
+    assert s.workers_over_memory(0.75) == []
+    yield [a._close(), b._close()]
+
+
+@gen_cluster(client=True)
+def test_peak_bytes(c, s, a, b):
+    x = yield c._scatter(b'0' * 100000, workers=a.address)
+    y = yield c._scatter(b'1' * 200000, workers=a.address)
+    assert s.peak_bytes[a.address] == s.worker_bytes[a.address] >= 300000
+    assert s.peak_bytes[b.address] == 0
+
+    del y
+    start = time()
+    while s.worker_bytes[a.address] >= 300000:
+        yield gen.sleep(0.01)
+        assert time() < start + 2
+    assert x.key in s.has_what[a.address]
+    assert s.peak_bytes[a.address] >= 300000
+
+    info = yield c.scheduler.identity()
+    assert info['peak_bytes'] == dict(s.peak_bytes)
+
+
+@gen_cluster(client=True, ncores=[])
+def test_placement_avoids_workers_near_memory_limit(c, s):
+    a = Worker(s.ip, s.port, ncores=1, memory_limit=1e6)
+    b = Worker(s.ip, s.port, ncores=1, memory_limit=1e9)
+    yield [a._start(0), b._start(0)]
+
+    yield c._scatter([b'0' * 900000], workers=a.address)
+    futures = c.map(lambda x: b'1' * 10000, range(20))
+    yield _wait(futures)
+
+    assert all(f.key in b.data for f in futures)
+    assert s.task_nbytes['lambda'] > 10000
+    assert not any(s.processing_bytes.values())
+    yield [a._close(), b._close()]
 
 
 @gen_cluster(client=True, timeout=1000)
@@ -879,7 +1107,7 @@ def test_include_communication_in_occupancy(c, s, a, b):
         yield gen.sleep(0.01)
 
     try:
-        assert s.processing[b.address][z.key] > 1
+        assert s.get_processing_cost(s.tasks[z.key]) > 1
     except Exception:
         print("processing:", s.processing)
         print("rprocessing:", s.rprocessing)
@@ -888,6 +1116,75 @@ def test_include_communication_in_occupancy(c, s, a, b):
         raise
 
 
+@gen_cluster(client=True)
+def test_task_duration_updates_occupancy(c, s, a, b):
+    futures = c.map(slowinc, range(20), delay=0.5)
+    while not s.rprocessing:
+        yield gen.sleep(0.01)
+
+    nprocessing = {w: len(p) for w, p in s.processing.items() if p}
+    assert s.processing_counts['slowinc'] == nprocessing
+
+    s.set_task_duration('slowinc', 100)
+    assert abs(s.total_occupancy - 100 * sum(nprocessing.values())) < 1
+    for w, n in nprocessing.items():
+        assert abs(s.occupancy[w] - 100 * n) < 1
+    s.validate_state()
+
+    yield _wait(futures)
+    assert not s.processing_counts
+    assert abs(s.total_occupancy) < 1e-9
+
+
+@gen_cluster(client=True)
+def test_task_prefix_statistics(c, s, a, b):
+    futures = c.map(slowinc, range(10), delay=0.01)
+    futures += c.map(div, range(5), [0, 1, 1, 1, 1])
+    yield _wait(futures)
+
+    stats = s.task_prefix_stats['slowinc']
+    assert stats.duration.count == 10
+    assert s.task_duration['slowinc'] == stats.duration.mean
+    assert s.task_nbytes['slowinc'] == stats.nbytes.mean
+    assert s.task_prefix_stats['div'].failures == 1
+
+    info = yield c.scheduler.identity()
+    summary = info['task_prefixes']
+    assert 0 < summary['div']['failure-rate'] < 0.5
+    assert 0.01 < summary['slowinc']['duration']['p50'] < 0.1
+    assert (yield c.scheduler.task_prefixes(prefixes=['div'])) == {
+        'div': summary['div']}
+
+
+@gen_cluster(client=True)
+def test_task_counts(c, s, a, b):
+    x = c.submit(inc, 1)
+    y = c.submit(div, 1, 0)
+    z = c.submit(inc, y)
+    yield _wait([x, y, z])
+
+    counts = s.task_counts()
+    assert counts['memory'] == counts['in-memory'] == len(s.who_has) == 1
+    assert counts['erred'] == 2
+    assert counts['exceptions'] == len(s.exceptions) == 1
+    assert counts['failed'] == len(s.exceptions_blame) == 2
+    assert counts['waiting'] == len(s.waiting) == 0
+    assert counts['released'] == len(s.released)
+
+
+@gen_cluster(client=True)
+def test_continuations_ranked_with_their_graph(c, s, a, b):
+    futures = c.map(slowinc, range(20), delay=0.2)
+    y = c.submit(inc, futures[-1])
+    z = c.submit(inc, 1)
+    yield _wait([y, z])
+
+    generation = s.tasks[futures[-1].key].priority[0]
+    assert s.tasks[y.key].priority[0] == generation
+    assert s.tasks[z.key].priority[0] > generation
+    yield _wait(futures)
+
+
 @gen_cluster(client=True)
 def test_worker_arrives_with_processing_data(c, s, a, b):
     x = delayed(slowinc)(1, delay=0.4)
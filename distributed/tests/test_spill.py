@@ -0,0 +1,97 @@
+from __future__ import print_function, division, absolute_import
+
+import os
+
+import pytest
+
+from tornado import gen
+
+from distributed.protocol import deserialize
+from distributed.sizeof import sizeof
+from distributed.spill import MMapFile, SpillBuffer, ALIGNMENT
+from distributed.utils import tmpfile
+from distributed.utils_test import gen_test
+
+
+def test_mmap_file():
+    np = pytest.importorskip('numpy')
+    events = []
+    with tmpfile() as fn:
+        z = MMapFile(fn, callback=lambda *args: events.append(args))
+        x = np.arange(1000, dtype='f8')
+        z['x'] = x
+        z['y'] = b'123'
+        z['a/b'] = {'a': [1, 2]}
+
+        assert set(z) == {'x', 'y', 'a/b'}
+        assert len(os.listdir(fn)) == 3
+        assert z['y'] == b'123'
+        assert z['a/b'] == {'a': [1, 2]}
+
+        y = z['x']
+        assert (y == x).all()
+        assert y.ctypes.data % ALIGNMENT == 0
+        y[0] = 100  # mapped copy-on-write
+        assert z['x'][0] == 0
+
+        s = z.get_serialized('x')
+        header, frames = s.header, s.frames
+        assert all(isinstance(frame, memoryview) for frame in frames)
+        assert (deserialize(header, frames) == x).all()
+
+        del z['x']
+        assert 'x' not in z
+        assert len(os.listdir(fn)) == 2
+        assert y[1] == 1  # still mapped after the file is gone
+
+    assert [kind for kind, _, _ in events[:3]] == ['spill'] * 3
+    assert events[0][1] == x.nbytes
+    assert 'unspill' in [kind for kind, _, _ in events]
+
+
+@gen_test()
+def test_spill_buffer():
+    np = pytest.importorskip('numpy')
+    events = []
+    with tmpfile() as fn:
+        buff = SpillBuffer(MMapFile(fn), 1000, lambda k, v: sizeof(v),
+                           callback=lambda *args: events.append(args[0]))
+        for k in 'xyz':
+            buff[k] = np.arange(500, dtype='u1')
+
+        # x is written in the background and still readable meanwhile
+        assert set(buff.fast) == {'y', 'z'}
+        assert set(buff.spilling) == {'x'}
+        assert set(buff) == {'x', 'y', 'z'}
+        assert (buff['x'] == np.arange(500, dtype='u1')).all()
+
+        while buff.spilling:
+            yield gen.sleep(0.01)
+        assert buff.on_disk == {'x'}
+        assert set(buff.slow) == {'x'}
+        assert events == ['spill']
+
+        serialized = yield buff.load_serialized(['x', 'y'])
+        assert list(serialized) == ['x']
+        assert buff.on_disk == {'x'}
+
+        yield buff.load(['x'])
+        assert 'x' in buff.fast
+        assert buff.on_disk == {'y'} or 'y' in buff.spilling
+
+        # Deleted while being written
+        buff['w'] = np.arange(600, dtype='u1')
+        spilling = set(buff.spilling)
+        assert spilling
+        for k in spilling:
+            del buff[k]
+        assert not buff.spilling
+        # Wait for the queued writes, and for _spilled to remove their files
+        yield buff._submit(lambda: None)
+        assert not spilling & set(buff)
+        assert not spilling & set(buff.slow)
+
+        buff['w'] = 1  # replace a value in memory
+        assert buff['w'] == 1
+        assert 'unspill' in events
+        buff.close()
@@ -354,6 +354,9 @@ def func(x):
 def assert_balanced(inp, expected, c, s, *workers):
     steal = s.extensions['stealing']
     steal._pc.stop()
+    # Keep tasks ready on the workers, so that they can all be stolen
+    for w in workers:
+        w.ncores = 0
 
     counter = itertools.count()
     B = BANDWIDTH
@@ -365,7 +368,7 @@ def assert_balanced(inp, expected, c, s, *workers):
         for t in ts:
             if t:
                 [dat] = yield c._scatter([next(data_seq)], workers=w.address)
-                s.nbytes[dat.key] = BANDWIDTH * t
+                s.tasks[dat.key].nbytes = BANDWIDTH * t
             else:
                 dat = 123
             s.task_duration[str(int(t))] = 1
@@ -377,7 +380,9 @@ def assert_balanced(inp, expected, c, s, *workers):
     while len(s.rprocessing) < len(futures):
         yield gen.sleep(0.001)
 
-    s.extensions['stealing'].balance()
+    steal.balance()
+    while steal.in_flight:
+        yield gen.sleep(0.001)
 
     result = [sorted([int(key_split(k)) for k in s.processing[w.address]],
                      reverse=True)
@@ -484,11 +489,73 @@ def test_steal_communication_heavy_tasks(c, s, a, b):
     while not any(f.key in s.rprocessing for f in futures):
         yield gen.sleep(0.01)
 
-    s.extensions['stealing'].balance()
+    steal = s.extensions['stealing']
+    steal.balance()
+    while steal.in_flight:
+        yield gen.sleep(0.01)
 
     assert s.processing[b.address]
 
 
+@gen_cluster(client=True, ncores=[('127.0.0.1', 1)] * 2)
+def test_steal_over_measured_links(c, s, a, b):
+    steal = s.extensions['stealing']
+    steal._pc.stop()
+    s.task_duration['slowidentity'] = 0.2
+    x = c.submit(mul, b'0', int(BANDWIDTH), workers=a.address)
+    yield _wait(x)
+
+    futures = [c.submit(slowidentity, x, delay=0.2, pure=False,
+                        workers=a.address, allow_other_workers=True)
+               for i in range(4)]
+    while len(s.processing[a.address]) < 4:
+        yield gen.sleep(0.01)
+
+    steal.balance()  # moving x takes a second at the assumed bandwidth
+    assert not s.processing[b.address]
+
+    steal.update_links(b.address, {a.address: (100 * BANDWIDTH, 1e-4)})
+    assert steal.link(b.address, a.address) == (100 * BANDWIDTH, 1e-4)
+    assert steal.link(a.address, b.address) == (100 * BANDWIDTH, 1e-4)
+    assert steal.bandwidth > BANDWIDTH
+
+    steal.balance()
+    while steal.in_flight:
+        yield gen.sleep(0.01)
+    assert s.processing[b.address]
+
+
+@gen_cluster(client=True, ncores=[('127.0.0.1', 1)] * 2)
+def test_dont_steal_started_tasks(c, s, a, b):
+    steal = s.extensions['stealing']
+    steal._pc.stop()
+    futures = c.map(slowinc, range(2), delay=0.5, workers=a.address,
+                    allow_other_workers=True)
+    while not a.executing or len(s.processing[a.address]) < 2:
+        yield gen.sleep(0.01)
+    [executing] = a.executing
+    [ready] = {f.key for f in futures} - {executing}
+
+    steal.request_steal(executing, a.address, b.address)
+    steal.request_steal(ready, a.address, b.address)
+    s.worker_comms[a.address].send({'op': 'steal-request',
+                                    'keys': [executing, ready]})
+    while steal.in_flight:
+        yield gen.sleep(0.01)
+
+    assert set(s.processing[a.address]) == {executing}
+    assert set(s.processing[b.address]) == {ready}
+    assert steal.counts['confirmed'] == 1
+    assert steal.counts['rejected'] == 1
+    assert not any(steal.in_flight_occupancy.values())
+
+    yield _wait(futures)
+    assert ready not in a.data
+    assert not steal.wasted_compute
+    # The victim already released the task, it isn't told again
+    assert (ready, 'release-task') not in a.log
+
+
 @gen_cluster(client=True)
 def test_steal_twice(c, s, a, b):
     x = c.submit(inc, 1, workers=a.address)
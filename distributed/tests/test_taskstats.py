@@ -0,0 +1,67 @@
+from __future__ import print_function, division, absolute_import
+
+import random
+
+from distributed.taskstats import StreamStats, TaskPrefixStats, RESOLUTION
+
+
+def test_moments_without_decay():
+    stats = StreamStats(halflife=float('inf'))
+    data = [random.random() for i in range(1000)]
+    for x in data:
+        stats.add(x)
+    mean = sum(data) / len(data)
+    var = sum((x - mean) ** 2 for x in data) / len(data)
+    assert stats.count == 1000
+    assert abs(stats.mean - mean) < 1e-9
+    assert abs(stats.var - var) < 1e-9
+
+
+def test_decay_follows_changes():
+    stats = StreamStats(halflife=10)
+    for i in range(100):
+        stats.add(1)
+    for i in range(10):
+        stats.add(3)
+    assert abs(stats.mean - 2) < 0.01
+    for i in range(100):
+        stats.add(3)
+    assert abs(stats.mean - 3) < 0.01
+    assert stats.quantile(0.5) > 3 / RESOLUTION
+
+
+def test_quantiles_of_skewed_data():
+    stats = StreamStats(halflife=float('inf'))
+    for i in range(95):
+        stats.add(0.01)
+    for i in range(5):
+        stats.add(10)
+    assert 0.01 / RESOLUTION < stats.quantile(0.5) < 0.01 * RESOLUTION
+    assert stats.quantile(0.95) < 1
+    assert 10 / RESOLUTION < stats.quantile(0.99) < 10 * RESOLUTION
+    assert stats.mean > 0.5  # the mean is pulled up by the slow tasks
+
+    stats.add(0)
+    assert stats.quantile(0.001) == 0
+    assert StreamStats().quantile(0.5) is None
+
+
+def test_rescale():
+    stats = StreamStats(halflife=0.01)
+    for i in range(10000):
+        stats.add(i % 7)
+    assert stats.scale < 1e100
+    assert stats.mean == 9999 % 7
+    assert len(stats.buckets) < 7
+
+
+def test_failure_rate():
+    stats = TaskPrefixStats(halflife=float('inf'))
+    for i in range(3):
+        stats.add_success()
+    stats.add_failure()
+    assert stats.failures == 1
+    assert stats.failure_rate == 0.25
+    summary = stats.summary()
+    assert summary['failure-rate'] == 0.25
+    assert summary['duration']['count'] == 0
@@ -1,6 +1,7 @@
 from __future__ import print_function, division, absolute_import
 
 import pytest
+from tornado import gen
 
 from distributed.core import rpc
 from distributed.utils_test import gen_cluster
@@ -26,3 +27,25 @@ def test_gather_from_workers_permissive(s, a, b):
 
     assert data == {'x': 1}
     assert list(missing) == ['y']
+
+
+@gen_cluster()
+def test_gather_from_workers_retries_replicas(s, a, b):
+    while not a.batched_stream:
+        yield gen.sleep(0.01)
+    a.update_data(data={'x': 1, 'y': 2})
+
+    received = []
+    stats = {}
+    data, missing, bad_workers = yield gather_from_workers(
+            {'x': [a.address, b.address], 'y': [b.address, a.address]},
+            rpc=rpc, max_connections=1,
+            callback=lambda w, d: received.append((w, d)), stats=stats)
+
+    assert data == {'x': 1, 'y': 2}
+    assert not missing
+    assert not bad_workers
+    assert [w for w, d in received] == [a.address] * len(received)
+    assert sum(len(d) for w, d in received) == 2
+    assert stats[a.address]['nbytes'] > 0
+    assert stats[a.address]['bandwidth'] > 0
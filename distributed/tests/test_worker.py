@@ -26,7 +26,9 @@ from distributed.metrics import time
 from distributed.protocol import to_serialize
 from distributed.protocol.pickle import dumps, loads
 from distributed.sizeof import sizeof
-from distributed.worker import Worker, error_message, logger, TOTAL_MEMORY
+from distributed.worker import (Worker, error_message, logger, TOTAL_MEMORY,
+        dumps_function, loads_function, cache_dumps, cache_loads,
+        FUNCTION_CACHE_SIZE)
 from distributed.utils import ignoring, tmpfile
 from distributed.utils_test import (loop, inc, mul, gen_cluster, div, dec,
         slow, slowinc, throws, gen_test, readone, cluster)
@@ -338,14 +340,40 @@ def test_spill_to_disk(e, s):
     yield _wait(z)
     assert set(w.data) == {x.key, y.key, z.key}
     assert set(w.data.fast) == {y.key, z.key}
+    while w.data.spilling:
+        yield gen.sleep(0.01)
     assert set(w.data.slow) == {x.key} or set(w.data.slow) == {x.key, y.key}
 
-    yield x
+    yield x  # sent from disk
+    assert set(w.data.fast) == {y.key, z.key}
+    assert set(w.data.slow) == {x.key}
+
+    yield w.data.load([x.key])
     assert set(w.data.fast) == {x.key, z.key}
-    assert set(w.data.slow) == {y.key} or set(w.data.slow) == {x.key, y.key}
+    assert y.key in w.data.spilling or y.key in w.data.slow
     yield w._close()
 
 
+@gen_cluster(client=True, ncores=[('127.0.0.1', 1)],
+             worker_kwargs={'memory_limit': 1000})
+def test_get_data_from_disk(c, s, w):
+    np = pytest.importorskip('numpy')
+    x = c.submit(np.arange, 500, dtype='u1', key='x')
+    yield _wait(x)
+    y = c.submit(np.arange, 500, dtype='u1', key='y')
+    yield _wait(y)
+    z = c.submit(np.arange, 500, dtype='u1', key='z')
+    yield _wait(z)
+    while w.data.spilling:
+        yield gen.sleep(0.01)
+    assert x.key in w.data.slow
+
+    result = yield x
+    assert (result == np.arange(500, dtype='u1')).all()
+    assert x.key in w.data.slow  # served without loading it back
+    assert w.counters['spill'].components[0]['spill'] >= 1
+
+
 @gen_cluster(client=True)
 def test_access_key(c, s, a, b):
     def f(i):
@@ -558,6 +586,37 @@ def test_gather_many_small(c, s, a, *workers):
     assert a.comm_nbytes == 0
 
 
+@gen_cluster(client=True, ncores=[('127.0.0.1', 1)] * 3)
+def test_fetch_from_fastest_peer(c, s, a, b, w):
+    [x] = yield c._scatter([123], workers=[b.address, w.address],
+                           broadcast=True)
+    a.compression_policy.bandwidth[b.address] = 1e9
+    a.compression_policy.bandwidth[w.address] = 1e6
+
+    y = c.submit(inc, x, workers=a.address)
+    yield _wait(y)
+
+    assert [msg['who'] for msg in a.incoming_transfer_log] == [b.address]
+    assert not a.in_flight_nbytes
+    assert a.fetch_queues() == {}
+    assert a.total_comm_nbytes >= a.min_comm_nbytes
+
+
+@gen_cluster(client=True)
+def test_heartbeat_reports_links(c, s, a, b):
+    x = c.submit(inc, 1, workers=a.address)
+    y = c.submit(inc, x, workers=b.address)
+    yield _wait(y)
+
+    assert b.updated_links == {a.address}
+    assert len(b.peer_transfers[a.address]) == 1
+
+    yield b.heartbeat()
+    assert not b.updated_links
+    bandwidth, latency = s.extensions['stealing'].links[b.address][a.address]
+    assert bandwidth > 0
+
+
 @gen_cluster(client=True, ncores=[('127.0.0.1', 1)] * 3)
 def test_multiple_transfers(c, s, w1, w2, w3):
     x = c.submit(inc, 1, workers=w1.address)
@@ -884,3 +943,27 @@ def test_global_workers(s, a, b):
     yield a._close()
     yield b._close()
     assert len(_global_workers) == n - 2
+
+
+def test_function_caches_are_bounded():
+    f = lambda x: x + 1
+    b = dumps_function(f)
+    assert dumps_function(f) is b
+    assert loads_function(bytes(b)) is loads_function(bytes(b))
+    assert loads_function(b)(1) == 2
+
+    for i in range(FUNCTION_CACHE_SIZE + 10):
+        loads_function(dumps_function(lambda x, i=i: x + i))
+    assert len(cache_dumps) <= FUNCTION_CACHE_SIZE
+    assert len(cache_loads) <= FUNCTION_CACHE_SIZE
+    assert f not in cache_dumps
+
+
+@gen_cluster(client=True, ncores=[('127.0.0.1', 1)])
+def test_function_cache_counters(c, s, a):
+    f = lambda x: x + 1
+    futures = c.map(f, range(10))
+    yield _wait(futures)
+    counts = a.counters['function-cache'].components[0]
+    assert counts['hit'] >= 8
+    assert counts['hit'] + counts['miss'] == 10
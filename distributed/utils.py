@@ -834,7 +834,7 @@ if PY2:
 else:
     def nbytes(frame):
         """ Number of bytes of a frame or memoryview """
-        if isinstance(frame, bytes):
+        if isinstance(frame, (bytes, bytearray)):
             return len(frame)
         else:
             return frame.nbytes
@@ -7,24 +7,46 @@ import random
 
 from toolz import merge, concat, groupby, drop
 
+from .config import config
 from .core import rpc
+from .metrics import time
+from .sizeof import sizeof
 from .utils import All, tokey
 
 
 no_default = '__no_default__'
 
+# How many workers gather_from_workers asks for data at once
+GATHER_CONNECTIONS = config.get('gather-connections', 50)
 
-@asyncio.coroutine
-def gather_from_workers(who_has, rpc, close=True):
+
+async def gather_from_workers(who_has, rpc, close=True,
+                              max_connections=GATHER_CONNECTIONS,
+                              callback=None, stats=None):
     """ Gather data directly from peers
 
+    Workers are asked for their keys concurrently, with at most
+    ``max_connections`` requests in flight.  As soon as a worker fails, or
+    doesn't have some of the keys it was asked for, those keys are asked of
+    other workers that hold them.
+
     Parameters
     ----------
     who_has: dict
         Dict mapping keys to sets of workers that may have that key
     rpc: callable
-
-    Returns dict mapping key to value
+    max_connections: int
+        How many workers to ask at once
+    callback: callable, optional
+        Called as ``callback(worker, data)`` with the data each worker sends,
+        as it arrives
+    stats: dict, optional
+        Filled with ``{worker: {'latency': ..., 'nbytes': ...,
+        'bandwidth': ...}}``: the time spent waiting on the worker's replies,
+        the size of the data it sent and the rate at which it did
+
+    Returns dict mapping key to value, dict mapping keys that could not be
+    found to the workers we tried, and list of workers that failed
 
     See Also
     --------
@@ -37,46 +59,94 @@ def gather_from_workers(who_has, rpc, close=True):
     who_has = {k: set(v) for k, v in who_has.items()}
     results = dict()
     all_bad_keys = set()
+    semaphore = asyncio.Semaphore(max_connections)
+    tasks = dict()
+
+    async def get_data(address, keys):
+        async with semaphore:
+            r = rpc(address)
+            try:
+                start = time()
+                data = await r.get_data(keys=keys, close=close)
+                return data, time() - start
+            finally:
+                r.close_rpc()
 
-    while len(results) + len(all_bad_keys) < len(who_has):
+    def request(keys):
         d = defaultdict(list)
-        rev = dict()
-        bad_keys = set()
-        for key, addresses in who_has.items():
-            if key in results:
-                continue
+        for key in keys:
             try:
-                addr = random.choice(list(addresses - bad_addresses))
-                d[addr].append(key)
-                rev[key] = addr
+                addr = random.choice(list(who_has[key] - bad_addresses))
             except IndexError:
-                bad_keys.add(key)
-        if bad_keys:
-            all_bad_keys |= bad_keys
-
-        rpcs = {addr: rpc(addr) for addr in d}
-        try:
-            coroutines = {address: rpcs[address].get_data(keys=keys, close=close)
-                          for address, keys in d.items()}
-            response = {}
-            for worker, c in coroutines.items():
+                all_bad_keys.add(key)
+            else:
+                d[addr].append(key)
+        for addr, keys in d.items():
+            task = asyncio.ensure_future(get_data(addr, keys))
+            tasks[task] = (addr, keys)
+
+    request(who_has)
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(tasks,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            retry = []
+            for task in done:
+                address, keys = tasks.pop(task)
                 try:
-                    r = yield c
+                    data, duration = task.result()
                 except EnvironmentError:
-                    missing_workers.add(worker)
-                else:
-                    response.update(r)
-        finally:
-            for r in rpcs.values():
-                r.close_rpc()
-
-        bad_addresses |= {v for k, v in rev.items() if k not in response}
-        results.update(response)
+                    missing_workers.add(address)
+                    data, duration = {}, None
+                results.update(data)
+                missing = [key for key in keys if key not in data]
+                if missing:
+                    bad_addresses.add(address)
+                    retry.extend(missing)
+                if data and callback is not None:
+                    callback(address, data)
+                if stats is not None and duration is not None:
+                    s = stats.setdefault(address, {'latency': 0, 'nbytes': 0})
+                    s['latency'] += duration
+                    s['nbytes'] += sum(map(sizeof, data.values()))
+                    s['bandwidth'] = s['nbytes'] / (s['latency'] or 0.001)
+            request(retry)
+    finally:
+        for task in tasks:
+            task.cancel()
 
     bad_keys = {k: list(original_who_has[k]) for k in all_bad_keys}
     return results, bad_keys, list(missing_workers)
 
 
+def fit_link(transfers):
+    """ Estimate the bandwidth and latency of a link from past transfers
+
+    Fits ``duration = latency + nbytes / bandwidth`` to ``(nbytes, duration)``
+    pairs by least squares.  If the transfers don't tell the two apart, for
+    example because they were all of the same size, the latency is None and
+    the bandwidth is the average one.
+
+    >>> fit_link([(0, 0.5), (2 ** 20, 1.5)])
+    (1048576.0, 0.5)
+    >>> fit_link([(1000, 0.5), (1000, 1.5)])
+    (1000.0, None)
+    """
+    transfers = list(transfers)
+    n = len(transfers)
+    total_bytes = sum(nb for nb, _ in transfers)
+    total_duration = sum(d for _, d in transfers)
+    mean_bytes = total_bytes / n
+    mean_duration = total_duration / n
+    var = sum((nb - mean_bytes) ** 2 for nb, _ in transfers)
+    cov = sum((nb - mean_bytes) * (d - mean_duration) for nb, d in transfers)
+    if var > 0 and cov > 0:
+        slope = cov / var
+        return 1 / slope, max(0, mean_duration - slope * mean_bytes)
+    else:
+        return total_bytes / (total_duration or 1e-6), None
+
+
 class WrappedKey(object):
     """ Interface for a key in a dask graph.
 
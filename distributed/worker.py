@@ -3,6 +3,7 @@ from __future__ import print_function, division, absolute_import
 import asyncio
 from collections import defaultdict, deque
 from datetime import timedelta
+from functools import partial
 import heapq
 import logging
 import os
@@ -24,9 +25,11 @@ except ImportError:
 # from tornado import gen
 # from tornado.ioloop import IOLoop, PeriodicCallback
 # from tornado.locks import Event
+from zict import LRU
 
 from .batched import BatchedSend
 from .comm import get_address_host, get_local_address_for
+from .comm.utils import offload, FRAME_OFFLOAD_THRESHOLD
 from .config import config
 from .compatibility import unicode, get_thread_identity
 from .core import (error_message, CommClosedError,
@@ -34,15 +37,16 @@ from .core import (error_message, CommClosedError,
 from .metrics import time
 from .node import ServerNode
 from .preloading import preload_modules
-from .protocol import (pickle, to_serialize, deserialize_bytes,
-                       serialize_bytelist)
+from .protocol import (pickle, to_serialize, serialize_compressed,
+                       CompressionPolicy)
 from .security import Security
 from .sizeof import safe_sizeof as sizeof
+from .spill import MMapFile, SpillBuffer
 from .threadpoolexecutor import ThreadPoolExecutor, secede as tpe_secede
 from .utils import (funcname, get_ip, has_arg, _maybe_complex, log_errors,
                     ignoring, validate_key, mp_context, import_file,
                     silence_logging)
-from .utils_comm import pack_data, gather_from_workers
+from .utils_comm import pack_data, gather_from_workers, fit_link
 
 _ncores = mp_context.cpu_count()
 
@@ -54,6 +58,21 @@ LOG_PDB = config.get('pdb-on-err') or os.environ.get('DASK_ERROR_PDB', False)
 
 no_value = '--no-value-sentinel--'
 
+# How many functions to keep pickled and unpickled, and how large their
+# pickled bytes may be to be kept at all
+FUNCTION_CACHE_SIZE = config.get('function-cache-size', 100)
+FUNCTION_CACHE_NBYTES = config.get('function-cache-nbytes', 100000)
+
+# Estimated bandwidth to peers we haven't fetched data from yet
+BANDWIDTH = config.get('bandwidth', 100e6)
+
+# How many recent transfers from each peer to estimate its link from
+LINK_TRANSFERS = config.get('link-transfers', 20)
+
+# How long we would like fetches from peers to take.  Bytes in flight are
+# adjusted so that what we receive in this time is in flight at once.
+FETCH_DURATION = config.get('fetch-duration', 1.0)
+
 try:
     import psutil
     TOTAL_MEMORY = psutil.virtual_memory().total
@@ -110,17 +129,14 @@ class WorkerBase(ServerNode):
             memory_limit = memory_limit * TOTAL_MEMORY
         self.memory_limit = memory_limit
 
+        self.loop = loop or IOLoop.current()
         if self.memory_limit:
-            try:
-                from zict import Buffer, File, Func
-            except ImportError:
-                raise ImportError("Please `pip install zict` for spill-to-disk workers")
             path = os.path.join(self.local_dir, 'storage')
-            storage = Func(serialize_bytelist, deserialize_bytes, File(path))
-            self.data = Buffer({}, storage, int(float(self.memory_limit)), weight)
+            self.data = SpillBuffer(MMapFile(path), int(float(self.memory_limit)),
+                                    weight, callback=self._record_spill,
+                                    loop=self.loop)
         else:
             self.data = dict()
-        self.loop = loop or IOLoop.current()
         self.status = None
         self._closed = Event()
         self.reconnect = reconnect
@@ -157,6 +173,7 @@ class WorkerBase(ServerNode):
           'upload_file': self.upload_file,
           'start_ipython': self.start_ipython,
           'keys': self.keys,
+          'fetch_queues': self.fetch_queues,
         }
 
         super(WorkerBase, self).__init__(handlers, io_loop=self.loop,
@@ -184,6 +201,13 @@ class WorkerBase(ServerNode):
                               'memory-rss': memory_info.rss}
                 else:
                     kwargs = {}
+                if isinstance(self.data, SpillBuffer):
+                    kwargs['spilling'] = len(self.data.spilling)
+                    kwargs['disk-stall'] = self.data.stall_time
+                links = {w: fit_link(self.peer_transfers[w])
+                         for w in self.updated_links}
+                if links:
+                    kwargs['links'] = links
 
                 await self.scheduler.register(
                         address=self.address,
@@ -198,6 +222,7 @@ class WorkerBase(ServerNode):
                         ready=len(self.ready),
                         in_flight=len(self.in_flight_tasks),
                         **kwargs)
+                self.updated_links.difference_update(links)
             finally:
                 self.heartbeat_active = False
         else:
@@ -331,6 +356,8 @@ class WorkerBase(ServerNode):
                         io_loop=self.loop)
         self.scheduler.close_rpc()
         self.executor.shutdown()
+        if isinstance(self.data, SpillBuffer):
+            self.data.close()
         if os.path.exists(self.local_dir):
             shutil.rmtree(self.local_dir)
 
@@ -438,9 +465,33 @@ class WorkerBase(ServerNode):
     async def get_data(self, comm, keys=None, who=None):
         start = time()
 
-        msg = {k: to_serialize(self.data[k]) for k in keys if k in self.data}
+        compress = partial(self.compression_policy.compress, peer=who)
+        if isinstance(self.data, SpillBuffer):
+            # Send straight from disk, without loading into memory
+            on_disk = await self.data.load_serialized(keys)
+        else:
+            on_disk = {}
+        values = {}
+        for k in keys:
+            if k in on_disk:
+                values[k] = on_disk[k]
+            elif k in self.data:
+                values[k] = self.data[k]
         nbytes = {k: self.nbytes.get(k) for k in keys if k in self.data}
+
+        def _serialize():
+            return {k: serialize_compressed(v, compress)
+                    for k, v in values.items()}
+
+        # Compressing large values would block the event loop
+        if sum(filter(None, nbytes.values())) > FRAME_OFFLOAD_THRESHOLD:
+            msg = await offload(_serialize)
+        else:
+            msg = _serialize()
         stop = time()
+        for value in msg.values():
+            for compression in value.header['compression']:
+                self.counters['compression'].add(compression)
         if self.digests is not None:
             self.digests['get-data-load-duration'].add(stop - start)
         start = time()
@@ -553,12 +604,23 @@ class WorkerBase(ServerNode):
     def keys(self, comm=None):
         return list(self.data)
 
+    def _record_spill(self, kind, nbytes, duration):
+        self.counters['spill'].add(kind)
+        if self.digests is not None:
+            self.digests[kind + '-nbytes'].add(nbytes)
+            self.digests[kind + '-duration'].add(duration)
+
     async def gather(self, comm=None, who_has=None):
         who_has = {k: [coerce_to_address(addr) for addr in v]
                     for k, v in who_has.items()
                     if k not in self.data}
+        stats = {}
         result, missing_keys, missing_workers = await gather_from_workers(
-                who_has, rpc=self.rpc)
+                who_has, rpc=self.rpc, stats=stats)
+        for worker, s in stats.items():
+            self.compression_policy.update_bandwidth(worker, s['nbytes'],
+                                                     s['latency'])
+            self.record_transfer(worker, s['nbytes'], s['latency'])
         if missing_keys:
             logger.warning("Could not find data: %s on workers: %s (who_has: %s)",
                            missing_keys, missing_workers, who_has)
@@ -575,7 +637,7 @@ job_counter = [0]
 def _deserialize(function=None, args=None, kwargs=None, task=None):
     """ Deserialize task inputs and regularize to func, args, kwargs """
     if function is not None:
-        function = pickle.loads(function)
+        function = loads_function(function)
     if args:
         args = pickle.loads(args)
     if kwargs:
@@ -607,15 +669,39 @@ def execute_task(task):
         return task
 
 
-cache = dict()
+# Most recently used functions and their pickled bytes, in both directions
+cache_dumps = LRU(FUNCTION_CACHE_SIZE, dict())
+cache_loads = LRU(FUNCTION_CACHE_SIZE, dict())
+
+# The client serializes tasks in several threads, see Client.map
+_cache_dumps_lock = threading.Lock()
 
 
 def dumps_function(func):
     """ Dump a function to bytes, cache functions """
-    if func not in cache:
-        b = pickle.dumps(func)
-        cache[func] = b
-    return cache[func]
+    try:
+        with _cache_dumps_lock:
+            result = cache_dumps[func]
+    except KeyError:
+        result = pickle.dumps(func)
+        if len(result) < FUNCTION_CACHE_NBYTES:
+            with _cache_dumps_lock:
+                cache_dumps[func] = result
+    except TypeError:  # Unhashable function
+        result = pickle.dumps(func)
+    return result
+
+
+def loads_function(bytes_object):
+    """ Load a function from bytes, cache bytes """
+    if len(bytes_object) < FUNCTION_CACHE_NBYTES:
+        try:
+            result = cache_loads[bytes_object]
+        except KeyError:
+            result = pickle.loads(bytes_object)
+            cache_loads[bytes_object] = result
+        return result
+    return pickle.loads(bytes_object)
 
 
 def dumps_task(task):
@@ -651,6 +737,43 @@ def dumps_task(task):
     return to_serialize(task)
 
 
+def task_templates(tasks):
+    """ Gather serialized tasks that share their function into templates
+
+    Takes the tasks from *tasks*, a dict of results of ``dumps_task``, that
+    share their function and kwargs with other tasks.  Returns a list of
+    templates, each with the shared ``'function'`` and ``'kwargs'``, if any,
+    and the ``'keys'`` and ``'args'`` of its tasks, so that these are sent
+    once rather than once per task.
+
+    Examples
+    --------
+    >>> from operator import add
+    >>> tasks = {'x': dumps_task((add, 1, 2)), 'y': dumps_task((add, 3, 4)),
+    ...          'z': dumps_task((sum, [1, 2]))}
+    >>> task_templates(tasks)  # doctest: +SKIP
+    [{'function': b'...', 'keys': ['x', 'y'], 'args': [b'...', b'...']}]
+    >>> list(tasks)
+    ['z']
+    """
+    groups = defaultdict(list)
+    for key, task in tasks.items():
+        if type(task) is dict:
+            groups[task['function'], task.get('kwargs')].append(key)
+
+    templates = []
+    for (function, kwargs), keys in groups.items():
+        if len(keys) < 2:
+            continue
+        template = {'function': function,
+                    'keys': keys,
+                    'args': [tasks.pop(key)['args'] for key in keys]}
+        if kwargs is not None:
+            template['kwargs'] = kwargs
+        templates.append(template)
+    return templates
+
+
 def apply_function(function, args, kwargs, execution_state, key):
     """ Run a function, collect information
 
@@ -823,6 +946,9 @@ class Worker(WorkerBase):
     * **total_connections**: ``int``
         The maximum number of concurrent connections we want to see
     * **total_comm_nbytes**: ``int``
+        The number of bytes we want in flight at once, beyond which no new
+        connections are opened past ``total_connections``.  Adjusted to what
+        we receive from peers in ``FETCH_DURATION``
     * **batched_stream**: ``BatchedSend``
         A batched stream along which we communicate to the scheduler
     * **log**: ``[(message)]``
@@ -836,7 +962,8 @@ class Worker(WorkerBase):
     that we want to collect from others.
 
     * **data:** ``{key: object}``:
-        Dictionary mapping keys to actual values
+        Dictionary mapping keys to actual values.  With a memory limit this is
+        a ``SpillBuffer``, whose ``spilling`` values are being written to disk
     * **task_state**: ``{key: string}``:
         The state of all tasks that the scheduler has asked us to compute.
         Valid states include waiting, constrained, exeucuting, memory, erred
@@ -846,8 +973,8 @@ class Worker(WorkerBase):
         The data needed by this key to run
     * **dependents**: ``{dep: {keys}}``
         The keys that use this dependency
-    * **data_needed**: deque(keys)
-        The keys whose data we still lack, arranged in a deque
+    * **data_needed**: ``[(priority, key)]``
+        The keys whose data we still lack, arranged in a heap by priority
     * **waiting_for_data**: ``{kep: {deps}}``
         A dynamic verion of dependencies.  All dependencies that we still don't
         have for a particular key.
@@ -879,7 +1006,9 @@ class Worker(WorkerBase):
     * **in_flight_workers**: ``{worker: {task}}``
         The workers from which we are currently gathering data and the
         dependencies we expect from those connections
-    * **comm_bytes**: ``int``
+    * **in_flight_nbytes**: ``{worker: int}``
+        The number of bytes in flight from each worker
+    * **comm_nbytes**: ``int``
         The total number of bytes in flight
     * **suspicious_deps**: ``{dep: int}``
         The number of times a dependency has not been where we expected it
@@ -952,12 +1081,15 @@ class Worker(WorkerBase):
         self.extensions = {}
         self._lock = threading.Lock()
 
-        self.data_needed = deque()  # TODO: replace with heap?
+        self.data_needed = []
 
         self.in_flight_tasks = dict()
         self.in_flight_workers = dict()
+        self.in_flight_nbytes = dict()
         self.total_connections = 50
-        self.total_comm_nbytes = 10e6
+        self.min_comm_nbytes = 10e6
+        self.max_comm_nbytes = 1e9
+        self.total_comm_nbytes = self.min_comm_nbytes
         self.comm_nbytes = 0
         self.suspicious_deps = defaultdict(lambda: 0)
         self._missing_dep_flight = set()
@@ -1012,6 +1144,12 @@ class Worker(WorkerBase):
         self.incoming_count = 0
         self.outgoing_transfer_log = deque(maxlen=(100000))
         self.outgoing_count = 0
+        self.compression_policy = CompressionPolicy()
+        # Recent (nbytes, duration) of transfers from each peer, and the peers
+        # whose link estimates we haven't sent to the scheduler yet
+        self.peer_transfers = defaultdict(partial(deque,
+                                                  maxlen=LINK_TRANSFERS))
+        self.updated_links = set()
         self._client = None
 
         WorkerBase.__init__(self, *args, **kwargs)
@@ -1070,6 +1208,8 @@ class Worker(WorkerBase):
                     elif op == 'release-task':
                         self.log.append((msg['key'], 'release-task'))
                         self.release_key(report=False, **msg)
+                    elif op == 'steal-request':
+                        self.steal_request(**msg)
                     elif op == 'delete-data':
                         self.delete_data(**msg)
                     else:
@@ -1118,6 +1258,9 @@ class Worker(WorkerBase):
                 return
 
             self.log.append((key, 'new'))
+            if function is not None:
+                self.counters['function-cache'].add(
+                    'hit' if function in cache_loads else 'miss')
             try:
                 start = time()
                 self.tasks[key] = _deserialize(function, args, kwargs, task)
@@ -1173,7 +1316,7 @@ class Worker(WorkerBase):
                         self.pending_data_per_worker[worker].append(dep)
 
             if self.waiting_for_data[key]:
-                self.data_needed.append(key)
+                heapq.heappush(self.data_needed, (priority, key))
             else:
                 self.transition(key, 'ready')
             if self.validate:
@@ -1242,7 +1385,8 @@ class Worker(WorkerBase):
                     self.loop.add_callback(self.handle_missing_dep, dep)
             for key in self.dependents.get(dep, ()):
                 if self.task_state[key] == 'waiting':
-                    self.data_needed.appendleft(key)
+                    heapq.heappush(self.data_needed,
+                                   (self.priorities[key], key))
 
             if not self.dependents[dep]:
                 self.release_dep(dep)
@@ -1435,26 +1579,29 @@ class Worker(WorkerBase):
     ##########################
 
     def ensure_communicating(self):
-        changed = True
+        """ Start fetching the dependencies of waiting tasks from peers
+
+        Keys are taken in priority order.  Those whose dependencies can only
+        come from peers we are already busy with are set aside for this pass,
+        so that they don't hold up keys behind them.
+        """
+        deferred = []
         try:
-            while changed and self.data_needed and len(self.in_flight_workers) < self.total_connections:
-                changed = False
+            while self.data_needed and (
+                    len(self.in_flight_workers) < self.total_connections
+                    or self.comm_nbytes < self.total_comm_nbytes):
                 logger.debug("Ensure communicating.  Pending: %d.  Connections: %d/%d",
                              len(self.data_needed),
                              len(self.in_flight_workers),
                              self.total_connections)
 
-                key = self.data_needed[0]
+                priority, key = heapq.heappop(self.data_needed)
 
                 if key not in self.tasks:
-                    self.data_needed.popleft()
-                    changed = True
                     continue
 
                 if self.task_state.get(key) != 'waiting':
                     self.log.append((key, 'communication pass'))
-                    self.data_needed.popleft()
-                    changed = True
                     continue
 
                 deps = self.dependencies[key]
@@ -1486,28 +1633,97 @@ class Worker(WorkerBase):
                         continue
                     if dep not in self.who_has:
                         continue
-                    workers = [w for w in self.who_has[dep]
-                                  if w not in self.in_flight_workers]
-                    if not workers:
+                    worker = self.choose_peer(dep)
+                    if worker in self.in_flight_workers:
                         in_flight = True
                         continue
-                    worker = random.choice(list(workers))
                     to_gather, total_nbytes = self.select_keys_for_gather(worker, dep)
                     self.comm_nbytes += total_nbytes
                     self.in_flight_workers[worker] = to_gather
+                    self.in_flight_nbytes[worker] = total_nbytes
                     for d in to_gather:
                         self.transition_dep(d, 'flight', worker=worker)
                     self.loop.add_callback(self.gather_dep, worker, dep,
                             to_gather, total_nbytes, cause=key)
-                    changed = True
 
-                if not deps and not in_flight:
-                    self.data_needed.popleft()
+                if deps or in_flight:
+                    deferred.append((priority, key))
+                    if len(self.in_flight_workers) >= len(self.has_what):
+                        # Every peer is busy, nothing else can start now
+                        break
         except Exception as e:
             logger.exception(e)
             if LOG_PDB:
                 import pdb; pdb.set_trace()
             raise
+        finally:
+            for item in deferred:
+                heapq.heappush(self.data_needed, item)
+
+    def choose_peer(self, dep):
+        """ The worker from which we expect to receive ``dep`` soonest
+
+        This is the bytes already in flight from a worker plus those of
+        ``dep``, over the bandwidth we have measured to that worker.  The
+        chosen worker may be busy, in which case it is faster to wait for it
+        than to fetch from an idle but slower one.
+        """
+        bandwidth = self.compression_policy.bandwidth
+        nbytes = self.nbytes.get(dep) or 0
+        in_flight = self.in_flight_nbytes
+
+        def finish(w):
+            return ((in_flight.get(w, 0) + nbytes) / bandwidth.get(w, BANDWIDTH),
+                    random.random())
+
+        return min(self.who_has[dep], key=finish)
+
+    def record_transfer(self, worker, nbytes, duration):
+        """ Remember a transfer from ``worker`` to estimate our link to it
+
+        Estimates of bandwidth and latency to the peers we received data from
+        are sent to the scheduler with the next heartbeat, for work stealing
+        to weigh the cost of moving data between workers.
+
+        See Also
+        --------
+        distributed.utils_comm.fit_link
+        """
+        if duration > 0:
+            self.peer_transfers[worker].append((nbytes, duration))
+            self.updated_links.add(worker)
+
+    def adapt_comm_nbytes(self):
+        """ Keep as many bytes in flight as we receive in ``FETCH_DURATION``
+
+        Throughput is measured over the transfers that completed in the last
+        ``FETCH_DURATION``.  While transfers finish faster than that the
+        budget grows; once they queue up behind each other it shrinks.
+        """
+        now = time()
+        total = 0
+        for msg in reversed(self.incoming_transfer_log):
+            if msg['stop'] < now - FETCH_DURATION:
+                break
+            total += msg['total']
+        self.total_comm_nbytes = min(self.max_comm_nbytes,
+                                     max(self.min_comm_nbytes, total))
+
+    def fetch_queues(self, comm=None):
+        """ Dependencies waiting to be fetched from each peer
+
+        Returns ``{worker: {'waiting': int, 'in-flight': int}}``: the number
+        of dependencies still queued for that worker and the bytes we are
+        currently receiving from it.
+        """
+        result = {}
+        for w in set(self.pending_data_per_worker) | set(self.in_flight_nbytes):
+            waiting = sum(self.dep_state.get(dep) == 'waiting'
+                          for dep in self.pending_data_per_worker.get(w, ()))
+            in_flight = self.in_flight_nbytes.get(w, 0)
+            if waiting or w in self.in_flight_nbytes:
+                result[w] = {'waiting': waiting, 'in-flight': in_flight}
+        return result
 
     def send_task_state_to_scheduler(self, key):
         if key in self.data:
@@ -1619,6 +1835,10 @@ class Worker(WorkerBase):
                     'bandwidth': total_bytes / duration,
                     'who': worker
                 })
+                self.compression_policy.update_bandwidth(worker, total_bytes,
+                                                         duration)
+                self.record_transfer(worker, total_bytes, duration)
+                self.adapt_comm_nbytes()
                 if self.digests is not None:
                     self.digests['transfer-bandwidth'].add(total_bytes / duration)
                     self.digests['transfer-duration'].add(duration)
@@ -1646,6 +1866,7 @@ class Worker(WorkerBase):
                 raise
             finally:
                 self.comm_nbytes -= total_nbytes
+                self.in_flight_nbytes.pop(worker, None)
 
                 for d in self.in_flight_workers.pop(worker):
                     if d in response:
@@ -1705,7 +1926,8 @@ class Worker(WorkerBase):
                     self.log.append((dep, 'new workers found'))
                     for key in self.dependents.get(dep, ()):
                         if key in self.waiting_for_data:
-                            self.data_needed.append(key)
+                            heapq.heappush(self.data_needed,
+                                           (self.priorities[key], key))
 
         except Exception:
             logger.error("Handle missing dep failed, retrying", exc_info=True)
@@ -1745,6 +1967,22 @@ class Worker(WorkerBase):
                 import pdb; pdb.set_trace()
             raise
 
+    def steal_request(self, keys=()):
+        """ Release those of ``keys`` that we haven't started computing
+
+        The scheduler asks this before moving tasks to other workers.  We
+        answer with the state each task was in, so that the scheduler only
+        moves the tasks we released.
+        """
+        response = {}
+        for key in keys:
+            state = self.task_state.get(key)
+            response[key] = state
+            if state in PENDING:
+                self.log.append((key, 'steal-request'))
+                self.release_key(key, reason='stolen', report=False)
+        self.batched_stream.send({'op': 'steal-response', 'keys': response})
+
     def release_key(self, key, cause=None, reason=None, report=True):
         try:
             if key not in self.task_state:
@@ -1913,6 +2151,10 @@ class Worker(WorkerBase):
             function, args, kwargs = self.tasks[key]
 
             start = time()
+            if isinstance(self.data, SpillBuffer):
+                await self.data.load(self.dependencies[key])
+                if key not in self.executing or key not in self.task_state:
+                    return
             args2 = pack_data(args, self.data, key_types=str)
             kwargs2 = pack_data(kwargs, self.data, key_types=str)
             stop = time()
@@ -2081,8 +2323,9 @@ class Worker(WorkerBase):
             for dep in self.dep_state:
                 self.validate_dep(dep)
 
+            needed = {key for _, key in self.data_needed}
             for key, deps in self.waiting_for_data.items():
-                if key not in self.data_needed:
+                if key not in needed:
                     for dep in deps:
                         assert (dep in self.in_flight_tasks or
                                 dep in self._missing_dep_flight or